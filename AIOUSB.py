@@ -340,11 +340,9 @@ def DACMultiDirect(index, DACValues, count):
     Simultaneously output values on multiple DACs.
 
     Note: 
-        Takes list of channel/count pairs and the count of pairs in the list
+        Takes a flat list of channel/count pairs [ch0, counts0, ch1, counts1, ...] and the count of pairs in the list
     """
-    dataBuf = (c_short * count)()
-    for i in range(count):
-        dataBuf[i] = DACValues[i]
+    dataBuf = (c_ushort * (2 * count))(*DACValues[:2 * count])
     return AIOUSB.DACMultiDirect(index, dataBuf, count)
 
 
@@ -0,0 +1,289 @@
+"""
+End-to-end benchmark: a mock OpenIris server feeds DataPipeline, which writes to simulated output modules.
+Runs headless, e.g. in CI:
+
+    python benchmark.py --rate 500 --duration 5 --json bench.json
+"""
+import argparse
+import gc
+import json
+import socket
+import select
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+import numpy as np
+
+from dac import SimulatedModule
+from gui import GlobalState, DataPipeline, AnalogOutput, AnalogOutputPair
+from multi import MultiPipeline, make_states
+from publish import SharedMemoryPublisher, MulticastPublisher
+from metrics import FrameMetrics, MetricsServer
+
+class MockOpenIrisServer(threading.Thread):
+    """
+    UDP server speaking the OpenIris "getdata" / "WAITFORDATA" protocol.
+
+    Frames are produced at rate Hz with gaussian jitter (seconds). "WAITFORDATA" requests are answered with the
+    next frame, "getdata" with the latest one. Replies are dropped with probability loss.
+    n_crs sets the number of CRs per eye (P4 is the 4th), pad adds a string of that many bytes to each payload.
+    Send times are kept in send_times, indexed by frame number.
+    """
+    def __init__(self, rate:float=500, jitter:float=0.0, loss:float=0.0, n_crs:int=4, extra:bool=True, pad:int=0,
+                 address:str='127.0.0.1', port:int=0, max_frames:int=1_000_000, seed:int=0):
+        super().__init__(daemon=True)
+        self.rate = rate
+        self.jitter = jitter
+        self.loss = loss
+        self.n_crs = n_crs
+        self.extra = extra
+        self.pad = 'x' * pad
+        self.rng = np.random.default_rng(seed)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((address, port))
+        self.address = self.sock.getsockname()
+        self.send_times = np.full(max_frames, np.nan)
+        self.frame_number = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.requests = 0
+        self._stop_event = threading.Event()
+
+    def make_frame(self, frame_number:int) -> bytes:
+        t = frame_number / self.rate
+        def eye(x0):
+            return {
+                'FrameNumber': frame_number,
+                'Pupil': {'Center': {'X': x0 + 20 * np.sin(t), 'Y': 240 + 20 * np.cos(t)}, 'Size': {'Width': 40.0, 'Height': 38.0}},
+                'CRs': [{'X': x0 + 5 * i + 10 * np.sin(2 * t), 'Y': 240 + 5 * i} for i in range(self.n_crs)],
+            }
+        struct = {'Left': eye(220), 'Right': eye(420)}
+        if self.extra:
+            struct['Extra'] = {**{f'Int{i}': frame_number & 1 for i in range(9)}, **{f'Double{i}': 0.0 for i in range(9)}}
+        if self.pad:
+            struct['Pad'] = self.pad
+        return json.dumps(struct).encode('utf-8')
+
+    def send(self, payload:bytes, addr):
+        if self.loss and self.rng.random() < self.loss:
+            self.frames_dropped += 1
+            return
+        self.sock.sendto(payload, addr)
+        self.frames_sent += 1
+
+    def run(self):
+        waiting = []
+        latest = self.make_frame(0)
+        next_frame = time.perf_counter() + 1 / self.rate
+        while not self._stop_event.is_set():
+            timeout = max(next_frame - time.perf_counter(), 0)
+            readable, _, _ = select.select([self.sock], [], [], min(timeout, 0.1))
+            if readable:
+                request, addr = self.sock.recvfrom(64)
+                self.requests += 1
+                if request == b'getdata':
+                    self.send(latest, addr)
+                elif request == b'WAITFORDATA' and addr not in waiting:
+                    waiting.append(addr)
+            if time.perf_counter() >= next_frame:
+                self.frame_number += 1
+                latest = self.make_frame(self.frame_number)
+                if self.frame_number < len(self.send_times):
+                    self.send_times[self.frame_number] = time.perf_counter()
+                for addr in waiting:
+                    self.send(latest, addr)
+                waiting = []
+                next_frame += max(1 / self.rate + self.rng.normal(0, self.jitter) if self.jitter else 1 / self.rate, 0)
+        self.sock.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+class RecordingModule(SimulatedModule):
+    """
+    SimulatedModule that timestamps writes to commit_channel (the last channel the pipeline writes per frame).
+    """
+    def __init__(self, state:GlobalState, commit_channel:int=5, max_frames:int=1_000_000, **kwargs):
+        super().__init__(**kwargs)
+        self.state = state
+        self.commit_channel = commit_channel
+        self.commit_times = np.zeros(max_frames)
+        self.commit_frames = np.zeros(max_frames, dtype=np.int64)
+        self.n_commits = 0
+
+    def write_channel(self, channel:int, voltage:float):
+        super().write_channel(channel, voltage)
+        if channel == self.commit_channel and self.n_commits < len(self.commit_times):
+            self.commit_times[self.n_commits] = time.perf_counter()
+            self.commit_frames[self.n_commits] = self.state.last_eyes_data.left.frame_number
+            self.n_commits += 1
+
+    def write_multiple(self, channels:np.ndarray, voltages:np.ndarray):
+        super().write_multiple(channels, voltages)
+        if self.commit_channel in channels and self.n_commits < len(self.commit_times):
+            self.commit_times[self.n_commits] = time.perf_counter()
+            self.commit_frames[self.n_commits] = self.state.last_eyes_data.left.frame_number
+            self.n_commits += 1
+
+def run_benchmark(rate:float=500, duration:float=5.0, jitter:float=0.0, loss:float=0.0, n_crs:int=4, extra:bool=True,
+                  pad:int=0, output_mode:str='direct', counters:bool=False, trackers:int=1,
+                  publish:bool=False, adaptive:bool=True, metrics:bool=False, routes:int=0) -> dict:
+    """
+    With trackers > 1, that many servers feed a MultiPipeline writing to one shared board; latency is measured
+    on the first tracker. publish attaches a shared memory and a multicast publisher to the first pipeline.
+    metrics serves the metrics endpoint and scrapes it 10 times a second while the pipeline runs.
+    routes adds that many derived outputs (alternately cyclopean x and vergence) to the first tracker.
+    """
+    servers = [MockOpenIrisServer(rate, jitter, loss, n_crs, extra, pad, seed=i) for i in range(trackers)]
+    for server in servers:
+        server.start()
+    server = servers[0]
+
+    states = make_states(trackers, Path(tempfile.mkdtemp()) / 'state')
+    state = states[0]
+    state.output_mode = output_mode
+    module = RecordingModule(state, n_channels=max(8, 6 * trackers + routes))
+    state.module_list.append(module)
+    for i, tracker_state in enumerate(states):
+        outputs = [AnalogOutput(module, 6 * i + j) for j in range(6)]
+        tracker_state.left_output = AnalogOutputPair(outputs[0], outputs[1])
+        tracker_state.right_output = AnalogOutputPair(outputs[2], outputs[3])
+        tracker_state.pupil_output = AnalogOutputPair(outputs[4], outputs[5])
+    state.router.set_routes([(AnalogOutput(module, 6 * trackers + i), ['(left_x + right_x) / 2', 'left_x - right_x'][i % 2])
+                             for i in range(routes)])
+
+    pipelines = [DataPipeline(tracker_state, *tracker_server.address, rate) for tracker_state, tracker_server in zip(states, servers)]
+    pipeline = pipelines[0]
+    for tracker_pipeline in pipelines:
+        tracker_pipeline.adaptive = adaptive
+    runner = MultiPipeline(pipelines) if trackers > 1 else pipeline
+    if counters:
+        pipeline.enable_counters()
+    if publish:
+        pipeline.publishers = [SharedMemoryPublisher('openiris_gaze_benchmark'), MulticastPublisher()]
+    scrape_times = []
+    if metrics:
+        for tracker_pipeline in pipelines:
+            tracker_pipeline.metrics = FrameMetrics()
+        metrics_server = MetricsServer(pipelines, '127.0.0.1', 0)
+        metrics_server.start()
+        def scrape():
+            url = 'http://%s:%d/metrics' % metrics_server.address
+            while state.is_running:
+                t0 = time.perf_counter()
+                urllib.request.urlopen(url).read()
+                scrape_times.append(time.perf_counter() - t0)
+                time.sleep(0.1)
+        threading.Thread(target=scrape, daemon=True).start()
+    cpu = {}
+    def target():
+        start = time.thread_time()
+        runner.run()
+        cpu['pipeline'] = time.thread_time() - start
+
+    gc.collect()
+    gen0_start = gc.get_stats()[0]['collections']
+    blocks_start = sys.getallocatedblocks()
+    thread = threading.Thread(target=target)
+    start = time.perf_counter()
+    thread.start()
+    time.sleep(duration)
+    stage_counters = pipeline.counters.snapshot() if pipeline.counters else {}
+    for tracker_state in states:
+        tracker_state.is_running = False
+    thread.join()
+    elapsed = time.perf_counter() - start
+    gen0 = gc.get_stats()[0]['collections'] - gen0_start
+    blocks = sys.getallocatedblocks() - blocks_start
+    for tracker_server in servers:
+        tracker_server.stop()
+        tracker_server.join()
+    state.device_monitor.stop()
+    if metrics:
+        metrics_server.stop()
+    published = pipeline.publishers[0].count if publish else 0
+    for publisher in pipeline.publishers:
+        publisher.close()
+
+    n = module.n_commits
+    frames = module.commit_frames[:n]
+    fresh = frames > 0
+    latency = (module.commit_times[:n][fresh] - server.send_times[frames[fresh]]) * 1e3
+    latency = latency[np.isfinite(latency)]
+    # longest time the outputs went without a new frame
+    new_frame = np.flatnonzero(np.diff(frames, prepend=0) > 0)
+    gaps = np.diff(module.commit_times[:n][new_frame]) * 1e3
+    client = (runner.clients[0] if trackers > 1 else pipeline.client).stats()
+    # final clock fit against the server's send times (the true capture times here)
+    capture = np.array([pipeline.clock.capture_time(frame) or np.nan for frame in frames[fresh]])
+    capture_error = (capture - server.send_times[frames[fresh]]) * 1e3
+    capture_error = capture_error[np.isfinite(capture_error)]
+    age = (module.commit_times[:n][fresh] - capture) * 1e3
+    age = age[np.isfinite(age)]
+    unique = len(np.unique(frames[fresh]))
+    percentiles = np.percentile(latency, [50, 90, 99]) if len(latency) else [np.nan] * 3
+    return {
+        'rate_hz': rate,
+        'trackers': trackers,
+        'duration_s': elapsed,
+        'output_mode': output_mode,
+        'frames_produced': int(server.frame_number),
+        'frames_sent': int(server.frames_sent),
+        'frames_dropped': int(server.frames_dropped),
+        'commits': int(n),
+        'unique_frames': int(unique),
+        'throughput_hz': unique / elapsed,
+        'total_throughput_hz': sum(runner.frames) / elapsed if trackers > 1 else unique / elapsed,
+        'latency_ms_p50': float(percentiles[0]),
+        'latency_ms_p90': float(percentiles[1]),
+        'latency_ms_p99': float(percentiles[2]),
+        'latency_ms_max': float(latency.max()) if len(latency) else float('nan'),
+        'capture_error_ms_p50': float(np.median(capture_error)) if len(capture_error) else float('nan'),
+        'capture_error_ms_std': float(np.std(capture_error)) if len(capture_error) else float('nan'),
+        'output_age_ms_p50': float(np.median(age)) if len(age) else float('nan'),
+        'output_age_ms_p99': float(np.percentile(age, 99)) if len(age) else float('nan'),
+        'clock_drift_ppm': float('nan') if pipeline.clock.drift_ppm is None else pipeline.clock.drift_ppm,
+        'frame_gap_ms_max': float(gaps.max()) if len(gaps) else float('nan'),
+        'cpu_us_per_frame': cpu.get('pipeline', 0.0) / max(n, 1) * 1e6,
+        'gc_gen0_per_1k_frames': gen0 / max(n, 1) * 1e3,
+        'net_allocated_blocks': int(blocks),
+        'frames_published': int(published),
+        'metrics_scrapes': len(scrape_times),
+        'metrics_scrape_ms_mean': float(np.mean(scrape_times) * 1e3) if scrape_times else float('nan'),
+        **{f'client_{key}': value for key, value in client.items()},
+        **{f'counter_{key}': value for key, value in stage_counters.items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=500, help='tracker frame rate (Hz)')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds to run')
+    parser.add_argument('--jitter', type=float, default=0.0, help='frame interval jitter (s, std)')
+    parser.add_argument('--loss', type=float, default=0.0, help='reply loss probability')
+    parser.add_argument('--crs', type=int, default=4, help='CRs per eye in the payload')
+    parser.add_argument('--no-extra', action='store_true', help='omit the Extra struct')
+    parser.add_argument('--pad', type=int, default=0, help='extra payload bytes')
+    parser.add_argument('--mode', default='direct', help='output mode: direct, interpolate or predict')
+    parser.add_argument('--trackers', type=int, default=1, help='number of mock servers, run through one MultiPipeline')
+    parser.add_argument('--fixed-timeout', action='store_true', help='wait the full timeout for lost replies (no adaptive re-request)')
+    parser.add_argument('--publish', action='store_true', help='publish frames to shared memory and multicast')
+    parser.add_argument('--metrics', action='store_true', help='serve and scrape the metrics endpoint while running')
+    parser.add_argument('--routes', type=int, default=0, help='number of derived outputs on the first tracker')
+    parser.add_argument('--counters', action='store_true', help='enable the pipeline counters and report them')
+    parser.add_argument('--json', default=None, help='write results to this file')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.rate, args.duration, args.jitter, args.loss, args.crs, not args.no_extra, args.pad, args.mode, args.counters, args.trackers, args.publish, not args.fixed_timeout, args.metrics, args.routes)
+    for key, value in results.items():
+        print(f'{key:>24}: {value:.3f}' if isinstance(value, float) else f'{key:>24}: {value}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if results['unique_frames'] == 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
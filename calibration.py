@@ -0,0 +1,315 @@
+import threading
+import warnings
+import numpy as np
+
+def parse_targets(text:str) -> np.ndarray:
+    """
+    Parses 'x,y; x,y; ...' (volts) into an (n, 2) array.
+    """
+    return np.array([[float(v) for v in pair.split(',')] for pair in text.split(';') if pair.strip()])
+
+def grid_targets(extent:float=3.0, n:int=3) -> np.ndarray:
+    """
+    n x n grid of targets spanning +/- extent volts, center first.
+    """
+    axis = np.linspace(-extent, extent, n)
+    targets = np.array([[x, y] for y in axis[::-1] for x in axis])
+    order = np.argsort(np.linalg.norm(targets, axis=1), kind='stable')
+    return targets[order]
+
+def robust_centroids(samples:np.ndarray, k:float=3.0) -> np.ndarray:
+    """
+    samples is (n_targets, n_samples, 2) with NaN for missing samples. Samples further than k scaled MADs from
+    the per-target median are rejected and the rest averaged. Returns (n_targets, 2), NaN where nothing is left.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # targets without samples
+        median = np.nanmedian(samples, axis=1, keepdims=True)
+        distance = np.linalg.norm(samples - median, axis=2)
+        mad = np.nanmedian(distance, axis=1, keepdims=True) * 1.4826
+    inlier = distance <= k * np.maximum(mad, 1e-9)
+    weights = inlier[..., None].astype(float)
+    total = weights.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nansum(np.where(inlier[..., None], samples, 0), axis=1) / total
+
+def fit_affine(raw:np.ndarray, targets:np.ndarray):
+    """
+    Least-squares fit of targets = raw @ M.T + t. Returns (M, t, rms residual).
+    """
+    design = np.hstack([raw, np.ones((len(raw), 1))])
+    coef, *_ = np.linalg.lstsq(design, targets, rcond=None)
+    residual = design @ coef - targets
+    return coef[:2].T, coef[2], float(np.sqrt(np.mean(np.sum(residual**2, axis=1))))
+
+def affine_to_parameters(M:np.ndarray, t:np.ndarray) -> tuple:
+    """
+    Closest (x_bias, y_bias, x_gain, y_gain, rotation in degrees) with M ~ Rot(rotation) @ diag(gain) and
+    t = M @ bias, i.e. the form CalibrationParameters.transform applies.
+    """
+    # both columns give the rotation modulo 180 degrees, average them on the doubled angle
+    theta1 = np.arctan2(M[1, 0], M[0, 0])
+    theta2 = np.arctan2(-M[0, 1], M[1, 1])
+    theta = 0.5 * np.arctan2(np.sin(2 * theta1) + np.sin(2 * theta2), np.cos(2 * theta1) + np.cos(2 * theta2))
+    c, s = np.cos(theta), np.sin(theta)
+    x_gain = c * M[0, 0] + s * M[1, 0]
+    y_gain = -s * M[0, 1] + c * M[1, 1]
+    rotated = np.array([c * t[0] + s * t[1], -s * t[0] + c * t[1]])
+    x_bias, y_bias = rotated / np.array([x_gain, y_gain])
+    return float(x_bias), float(y_bias), float(x_gain), float(y_gain), float(np.degrees(theta))
+
+def apply_parameters(parameters:tuple, raw:np.ndarray) -> np.ndarray:
+    """
+    CalibrationParameters.transform for (n, 2) raw vectors: ((raw + bias) * gain) rotated by rotation degrees.
+    """
+    x_bias, y_bias, x_gain, y_gain, rotation = parameters
+    c, s = np.cos(np.radians(rotation)), np.sin(np.radians(rotation))
+    return ((raw + [x_bias, y_bias]) * [x_gain, y_gain]) @ np.array([[c, s], [-s, c]])
+
+def rms_error(out:np.ndarray, targets:np.ndarray) -> float:
+    return float(np.sqrt(np.mean(np.sum((out - targets)**2, axis=1))))
+
+class CalibrationModel:
+    """
+    Base class for calibration models mapping a raw eye vector to output volts. Models are fitted offline and
+    evaluated from precomputed coefficients, so the per-frame cost does not depend on the number of targets.
+    """
+    name = None
+    min_targets = 3
+
+    def transform(self, raw:np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def to_dict(self) -> dict:
+        raise NotImplementedError
+
+    @classmethod
+    def fit(cls, raw:np.ndarray, targets:np.ndarray, **kwargs) -> 'CalibrationModel':
+        raise NotImplementedError
+
+    def rms(self, raw:np.ndarray, targets:np.ndarray) -> float:
+        return rms_error(np.array([self.transform(r) for r in raw]), targets)
+
+class AffineModel(CalibrationModel):
+    """
+    out = M @ raw + t
+    """
+    name = 'affine'
+
+    def __init__(self, M, t):
+        self.M = np.asarray(M, dtype=float)
+        self.t = np.asarray(t, dtype=float)
+
+    def transform(self, raw:np.ndarray) -> np.ndarray:
+        return self.M @ raw + self.t
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'M': self.M.tolist(), 't': self.t.tolist()}
+
+    @classmethod
+    def fit(cls, raw:np.ndarray, targets:np.ndarray) -> 'AffineModel':
+        M, t, _ = fit_affine(raw, targets)
+        return cls(M, t)
+
+class PolynomialModel(CalibrationModel):
+    """
+    Full bivariate polynomial of the given order in the normalized raw vector u = (raw - center) / scale.
+    """
+    name = 'poly'
+
+    def __init__(self, order:int, center, scale:float, coef):
+        self.order = order
+        self.center = np.asarray(center, dtype=float)
+        self.scale = float(scale)
+        self.coef = np.asarray(coef, dtype=float)
+        self.x_pow, self.y_pow = self.exponents(order)
+        self.min_targets = len(self.x_pow)
+
+    @staticmethod
+    def exponents(order:int):
+        pairs = [(i - j, j) for i in range(order + 1) for j in range(i + 1)]
+        return np.array([p[0] for p in pairs]), np.array([p[1] for p in pairs])
+
+    @classmethod
+    def terms(cls, u:np.ndarray, x_pow:np.ndarray, y_pow:np.ndarray) -> np.ndarray:
+        u = np.atleast_2d(u)
+        return u[:, :1] ** x_pow * u[:, 1:] ** y_pow
+
+    def transform(self, raw:np.ndarray) -> np.ndarray:
+        u = (raw - self.center) / self.scale
+        return (u[0] ** self.x_pow * u[1] ** self.y_pow) @ self.coef
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'order': self.order, 'center': self.center.tolist(), 'scale': self.scale, 'coef': self.coef.tolist()}
+
+    @classmethod
+    def fit(cls, raw:np.ndarray, targets:np.ndarray, order:int=2) -> 'PolynomialModel':
+        center = raw.mean(axis=0)
+        scale = max(float(np.abs(raw - center).max()), 1e-9)
+        x_pow, y_pow = cls.exponents(order)
+        if len(raw) < len(x_pow):
+            raise ValueError(f'Order {order} needs at least {len(x_pow)} targets, got {len(raw)}')
+        coef, *_ = np.linalg.lstsq(cls.terms((raw - center) / scale, x_pow, y_pow), targets, rcond=None)
+        return cls(order, center, scale, coef)
+
+class GridModel(CalibrationModel):
+    """
+    Thin-plate spline through the targets, sampled once onto a regular grid over the raw range and evaluated
+    per frame by bilinear interpolation (clamped at the grid edges).
+    """
+    name = 'tps'
+
+    def __init__(self, origin, step, grid):
+        self.origin = np.asarray(origin, dtype=float)
+        self.step = np.asarray(step, dtype=float)
+        self.grid = np.asarray(grid, dtype=float) # (nx, ny, 2)
+        self.limit = np.array(self.grid.shape[:2]) - 1.000001
+
+    def transform(self, raw:np.ndarray) -> np.ndarray:
+        g = np.clip((raw - self.origin) / self.step, 0, self.limit)
+        i, j = int(g[0]), int(g[1])
+        fx, fy = g[0] - i, g[1] - j
+        grid = self.grid
+        return ((grid[i, j] * (1 - fx) + grid[i + 1, j] * fx) * (1 - fy) +
+                (grid[i, j + 1] * (1 - fx) + grid[i + 1, j + 1] * fx) * fy)
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'origin': self.origin.tolist(), 'step': self.step.tolist(), 'grid': self.grid.tolist()}
+
+    @staticmethod
+    def tps_kernel(r:np.ndarray) -> np.ndarray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(r > 0, r**2 * np.log(r), 0.0)
+
+    @classmethod
+    def fit(cls, raw:np.ndarray, targets:np.ndarray, smoothing:float=0.0, resolution:int=64, margin:float=0.25) -> 'GridModel':
+        center = raw.mean(axis=0)
+        scale = max(float(np.abs(raw - center).max()), 1e-9)
+        u = (raw - center) / scale
+        n = len(u)
+        K = cls.tps_kernel(np.linalg.norm(u[:, None] - u[None], axis=2)) + smoothing * np.eye(n)
+        P = np.hstack([np.ones((n, 1)), u])
+        A = np.block([[K, P], [P.T, np.zeros((3, 3))]])
+        b = np.vstack([targets, np.zeros((3, 2))])
+        coef = np.linalg.lstsq(A, b, rcond=None)[0]
+        w, a = coef[:n], coef[n:]
+
+        low, high = raw.min(axis=0), raw.max(axis=0)
+        pad = (high - low) * margin
+        low, high = low - pad, high + pad
+        axes = [np.linspace(low[k], high[k], resolution) for k in range(2)]
+        points = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 2)
+        pu = (points - center) / scale
+        values = cls.tps_kernel(np.linalg.norm(pu[:, None] - u[None], axis=2)) @ w + np.hstack([np.ones((len(pu), 1)), pu]) @ a
+        return cls(low, (high - low) / (resolution - 1), values.reshape(resolution, resolution, 2))
+
+MODELS = {
+    'linear': None, # bias/gain/rotation, applied through CalibrationParameters
+    'affine': (AffineModel, {}),
+    'poly2': (PolynomialModel, {'order': 2}),
+    'poly3': (PolynomialModel, {'order': 3}),
+    'tps': (GridModel, {}),
+}
+
+def min_targets(model:str) -> int:
+    """
+    Fewest tracked targets per eye a model from MODELS can be fitted with, e.g. 10 for poly3.
+    """
+    if MODELS[model] is None:
+        return CalibrationModel.min_targets
+    cls, kwargs = MODELS[model]
+    if cls is PolynomialModel:
+        return len(PolynomialModel.exponents(kwargs['order'])[0])
+    return cls.min_targets
+
+def model_from_dict(struct:dict) -> CalibrationModel:
+    name = struct['name']
+    if name == 'affine':
+        return AffineModel(struct['M'], struct['t'])
+    if name == 'poly':
+        return PolynomialModel(struct['order'], struct['center'], struct['scale'], struct['coef'])
+    if name == 'tps':
+        return GridModel(struct['origin'], struct['step'], struct['grid'])
+    raise ValueError(f'Unknown calibration model {name}')
+
+class CalibrationEngine:
+    """
+    Collects raw eye vectors (CR - P4 or CR - pupil) for both eyes while the subject fixates known targets
+    (in output volts), then fits a calibration per eye.
+
+    push() is called by the pipeline every frame and only copies into a preallocated buffer; fitting runs on
+    a worker thread (fit_async).
+    """
+    eyes = ['left', 'right']
+
+    def __init__(self, targets:np.ndarray, samples_per_target:int=100, outlier_k:float=3.0):
+        self.targets = np.asarray(targets, dtype=float)
+        self.samples_per_target = samples_per_target
+        self.outlier_k = outlier_k
+        # (target, sample, eye, xy)
+        self.samples = np.full((len(self.targets), samples_per_target, 2, 2), np.nan)
+        self.counts = np.zeros(len(self.targets), dtype=int)
+        self.active = None
+        self.results = None
+        self.model = None
+
+    def start_target(self, index:int):
+        self.samples[index] = np.nan
+        self.counts[index] = 0
+        self.active = index
+
+    def push(self, left:np.ndarray, right:np.ndarray):
+        """
+        Adds one frame for the active target. Pass NaN for an eye that is not tracked.
+        """
+        index = self.active
+        if index is None:
+            return
+        count = self.counts[index]
+        self.samples[index, count, 0] = left
+        self.samples[index, count, 1] = right
+        self.counts[index] = count + 1
+        if count + 1 >= self.samples_per_target:
+            self.active = None
+
+    @property
+    def complete(self) -> bool:
+        return bool(np.all(self.counts >= self.samples_per_target))
+
+    def fit(self, model:str='linear') -> dict:
+        """
+        Fits each eye with a model from MODELS. Returns {eye: {'parameters' (linear) or 'model', 'rms', 'n_targets'}}
+        for eyes with at least min_targets(model) tracked targets.
+        """
+        self.model = model
+        results = {}
+        for e, eye in enumerate(self.eyes):
+            centroids = robust_centroids(self.samples[:, :, e], self.outlier_k)
+            usable = np.all(np.isfinite(centroids), axis=1)
+            if usable.sum() < min_targets(model):
+                continue
+            raw, targets = centroids[usable], self.targets[usable]
+            if model == 'linear':
+                # the rms of what is applied: the bias/gain/rotation projection, not the unconstrained affine fit
+                parameters = affine_to_parameters(*fit_affine(raw, targets)[:2])
+                rms = rms_error(apply_parameters(parameters, raw), targets)
+                results[eye] = {'parameters': parameters, 'rms': rms, 'n_targets': int(usable.sum())}
+            else:
+                cls, kwargs = MODELS[model]
+                try:
+                    fitted = cls.fit(raw, targets, **kwargs)
+                except (ValueError, np.linalg.LinAlgError) as e:
+                    print(f'Error fitting {model} for {eye} eye: {e}')
+                    continue
+                results[eye] = {'model': fitted, 'rms': fitted.rms(raw, targets), 'n_targets': int(usable.sum())}
+        self.results = results
+        return results
+
+    def fit_async(self, callback=None, model:str='linear') -> threading.Thread:
+        def target():
+            results = self.fit(model)
+            if callback is not None:
+                callback(results)
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,101 @@
+from collections import deque
+import numpy as np
+
+class ClockEstimator:
+    """
+    Maps tracker frame numbers to host time (time.perf_counter()).
+
+    Frame n is captured at offset + n * period on the host clock and received a variable delay later, but never
+    earlier than the smallest delay. So r - n * period (r = receive time) is bounded below by offset + the
+    smallest delay, and the lower envelope of those points is robust to network and scheduling spikes.
+    Minima are taken over windows of window frames, and a line through the last n_windows minima gives the
+    offset and the tracker's true period (drift against the host clock).
+
+    The smallest delay itself (exposure, tracker processing, network) cannot be observed from the host; pass it
+    as latency if it is known, otherwise capture times are the earliest possible arrival times.
+    period is the nominal frame period; when None it is taken from the first frames.
+    """
+    def __init__(self, period:float=None, window:int=100, n_windows:int=20, latency:float=0.0):
+        self.nominal = period
+        self.window = window
+        self.n_windows = n_windows
+        self.latency = latency
+        self.reset()
+
+    def reset(self):
+        self.period = self.nominal
+        self.offset = None
+        self.minima = deque(maxlen=self.n_windows)
+        self.last_frame = None
+        self._window_min = None
+        self._window_count = 0
+        self._bootstrap = []
+
+    def update(self, frame_number:int, t_receive:float) -> float:
+        """
+        Adds one received frame and returns its estimated capture time, or None while the period is unknown.
+        """
+        if self.last_frame is not None and frame_number <= self.last_frame:
+            if frame_number < self.last_frame:
+                # tracker restarted
+                self.reset()
+            else:
+                return self.capture_time(frame_number)
+        self.last_frame = frame_number
+
+        if self.period is None:
+            self._bootstrap.append((frame_number, t_receive))
+            if len(self._bootstrap) < 50:
+                return None
+            (n0, r0), (n1, r1) = self._bootstrap[0], self._bootstrap[-1]
+            self.period = (r1 - r0) / (n1 - n0)
+            for n_i, r_i in self._bootstrap:
+                self.add_point(n_i, r_i)
+            self._bootstrap = []
+        else:
+            self.add_point(frame_number, t_receive)
+        return self.capture_time(frame_number)
+
+    def add_point(self, frame_number:int, t_receive:float):
+        residual = t_receive - frame_number * self.period
+        if self._window_min is None or residual < self._window_min[2]:
+            self._window_min = (frame_number, t_receive, residual)
+        if len(self.minima) < 2:
+            # before the first fit: running minimum at the current period
+            self.offset = residual if self.offset is None else min(self.offset, residual)
+        self._window_count += 1
+        if self._window_count >= self.window:
+            self.minima.append(self._window_min[:2])
+            self._window_min = None
+            self._window_count = 0
+            self.fit()
+
+    def fit(self):
+        """
+        Fits a line through the window minima, r - n * period = a + slope * (n - n_last), and folds the slope
+        into the period so later residuals are flat.
+        """
+        if len(self.minima) < 2:
+            return
+        n, r = np.array(self.minima).T
+        slope, intercept = np.polyfit(n - n[-1], r - n * self.period, 1)
+        self.period += slope
+        self.offset = intercept - slope * n[-1]
+        if self._window_min is not None:
+            n_w, r_w, _ = self._window_min
+            self._window_min = (n_w, r_w, r_w - n_w * self.period)
+
+    def capture_time(self, frame_number:int) -> float:
+        if self.period is None or self.offset is None:
+            return None
+        return self.offset + frame_number * self.period - self.latency
+
+    @property
+    def drift_ppm(self) -> float:
+        """
+        Tracker clock rate against the host, relative to the nominal period; None when no nominal period was
+        given or the period is not known yet.
+        """
+        if self.period is None or self.nominal is None:
+            return None
+        return (self.period / self.nominal - 1) * 1e6
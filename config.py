@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import threading
+from pathlib import Path
+
+CONFIG_NAME = 'config.json'
+HISTORY_NAME = 'history.jsonl'
+CONFIG_VERSION = 1
+EYES = ['left', 'right', 'pupil']
+
+def atomic_write(fname:Path, text:str):
+    """
+    Writes text to fname through a temporary file in the same directory and os.replace, so readers (and a
+    crash mid-write) see either the old or the new file, never a partial one.
+    """
+    tmp = fname.with_name(f'.{fname.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(tmp, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, fname)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def write_config(fname:Path, config:dict):
+    atomic_write(fname, json.dumps(config, indent=2))
+
+def read_config(fname:Path) -> dict:
+    """
+    Reads and upgrades a config document. Raises on a missing or unreadable file.
+    """
+    with open(fname, 'r') as f:
+        config = json.load(f)
+    return upgrade_config(config)
+
+def set_aside(fname:Path) -> Path:
+    """
+    Renames an unreadable config to <name>.bad-<time> so that the next save cannot overwrite it. Returns the new
+    path.
+    """
+    bad = fname.with_name(f'{fname.name}.bad-{time.strftime("%Y%m%d-%H%M%S")}')
+    os.replace(fname, bad)
+    return bad
+
+def upgrade_config(config:dict) -> dict:
+    """
+    Brings an older config document up to CONFIG_VERSION. Version 0 is the dict read_legacy_config builds.
+    """
+    version = config.get('version', 0)
+    if version > CONFIG_VERSION:
+        print(f'Config version {version} is newer than this program ({CONFIG_VERSION}); unknown fields are ignored.')
+    if version < 1:
+        config.setdefault('channels', {})
+        config.setdefault('devices', {})
+    config['version'] = CONFIG_VERSION
+    return config
+
+def read_legacy_config(path:Path) -> dict:
+    """
+    Builds a version 0 config from the comma-separated left_cal.txt, right_cal.txt, pupil_cal.txt and methods.txt
+    that older versions wrote into the state directory. Missing or broken files are skipped.
+    """
+    config = {'version': 0, 'calibrations': {}}
+    for eye in EYES:
+        try:
+            with open(path / f'{eye}_cal.txt', 'r') as f:
+                values = [float(x) for x in f.read().split(',')]
+            config['calibrations'][eye] = dict(zip(['x_bias', 'y_bias', 'x_gain', 'y_gain', 'rotation'], values))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(e)
+    try:
+        with open(path / 'methods.txt', 'r') as f:
+            config['methods'] = dict(zip(['left', 'right'], f.read().split(',')))
+    except FileNotFoundError:
+        pass
+    return config
+
+class History:
+    """
+    Undo/redo stack of calibration snapshots backed by an append-only log, one JSON line per change:
+    {"t": unix time, "state": {section: ...}}. Only the sections in tracked are kept and consecutive duplicates
+    are skipped, so a slider drag that was coalesced by ConfigWriter becomes a single entry.
+
+    Undo and redo append {"t": ..., "state": ..., "step": offset} with the state they moved to, so the last line is
+    always the current state, and load() replays the steps to restore the cursor. The log is compacted to the
+    newest max_entries entries once it grows past twice that, followed by a step line when the cursor is not on
+    the newest one.
+    """
+    tracked = ['calibrations', 'methods', 'models']
+
+    def __init__(self, fname:Path, max_entries:int=500):
+        self.fname = fname
+        self.max_entries = max_entries
+        self.entries = []
+        self.cursor = -1
+        self.lines = 0
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.fname, 'r') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return
+        self.lines = len(lines)
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except Exception:
+                continue # a line cut off by a crash
+            if 'step' in entry:
+                self.cursor = min(max(self.cursor + entry['step'], 0), len(self.entries) - 1)
+            else:
+                self.add(entry)
+
+    def record(self, config:dict):
+        """
+        Adds the tracked sections of config if they differ from the current entry. Drops the redo branch.
+        """
+        state = {section: config[section] for section in self.tracked if section in config}
+        with self.lock:
+            if self.cursor >= 0 and self.entries[self.cursor]['state'] == state:
+                return
+            entry = {'t': time.time(), 'state': state}
+            self.add(entry)
+            self.append(entry)
+
+    def add(self, entry:dict):
+        """
+        Makes entry the current one, dropping the redo branch and the oldest entries past max_entries.
+        """
+        del self.entries[self.cursor + 1:]
+        self.entries.append(entry)
+        if len(self.entries) > self.max_entries:
+            del self.entries[:len(self.entries) - self.max_entries]
+        self.cursor = len(self.entries) - 1
+
+    def append(self, entry:dict):
+        with open(self.fname, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.lines += 1
+        if self.lines > 2 * self.max_entries:
+            self.compact()
+
+    def compact(self):
+        lines = [json.dumps(entry) for entry in self.entries]
+        if self.cursor < len(self.entries) - 1:
+            # end on the current state, with the step that gets load() back to it
+            lines.append(json.dumps({'t': time.time(), 'state': self.entries[self.cursor]['state'],
+                                     'step': self.cursor - (len(self.entries) - 1)}))
+        atomic_write(self.fname, ''.join(line + '\n' for line in lines))
+        self.lines = len(lines)
+
+    def step(self, offset:int) -> dict:
+        """
+        Moves offset entries back (negative) or forward and returns that state, or None at either end.
+        """
+        with self.lock:
+            cursor = self.cursor + offset
+            if cursor < 0 or cursor >= len(self.entries):
+                return None
+            self.cursor = cursor
+            state = self.entries[cursor]['state']
+            self.append({'t': time.time(), 'state': state, 'step': offset})
+            return state
+
+    def undo(self) -> dict:
+        return self.step(-1)
+
+    def redo(self) -> dict:
+        return self.step(1)
+
+class ConfigWriter(threading.Thread):
+    """
+    Debounced background saver. request() only marks the config dirty, so it is cheap enough to call on every
+    GUI event; the document is built by get_config and written once no request has come in for delay seconds.
+    """
+    def __init__(self, get_config, fname:Path, delay:float=1.0, history:'History'=None):
+        super().__init__(daemon=True)
+        self.get_config = get_config
+        self.fname = fname
+        self.delay = delay
+        self.history = history
+        self.lock = threading.Lock()
+        self.last_request = None
+        self.writes = 0
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+
+    def request(self):
+        self.last_request = time.perf_counter()
+        self._wake.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            while self.last_request is not None and not self._stop_event.is_set():
+                remaining = self.last_request + self.delay - time.perf_counter()
+                if remaining > 0:
+                    self._stop_event.wait(remaining)
+                    continue
+                self.last_request = None
+                self.flush()
+
+    def flush(self):
+        """
+        Writes the current config now. Also used for the synchronous save on exit.
+        """
+        with self.lock:
+            try:
+                config = self.get_config()
+                write_config(self.fname, config)
+                self.writes += 1
+                if self.history is not None:
+                    self.history.record(config)
+            except Exception as e:
+                print(e)
+                print(f'Error writing {self.fname}.')
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
@@ -1,29 +1,50 @@
-import os
-assert os.name == 'nt', 'DAC only works on Windows'
 import numpy as np
+import sys
+import time
+import threading
 
-has_aio = False
-try:
-    import AIOUSB as ao
-    has_aio = True
-except Exception as e:
-    print('Error importing AIOUSB. Ignore if using NI modules.')
-    print(e)
-
-has_daqmx = False
-try:
-    import nidaqmx
-    import nidaqmx.stream_writers
-    import nidaqmx.system
-except Exception as e:
-    print('Error importing nidaqmx. Ignore if using AIOUSB.')
-    print(e)
+# The vendor backends are imported on first discovery rather than with this module: AIOUSB loads its DLL at
+# import and nidaqmx is slow to import, and neither is needed for simulated modules or the GUI layout.
+# has_aio / has_daqmx are None until load_aio() / load_daqmx() have tried.
+ao = None
+nidaqmx = None
+has_aio = None
+has_daqmx = None
+
+def load_aio() -> bool:
+    global ao, has_aio
+    if has_aio is None:
+        try:
+            import AIOUSB
+            ao = AIOUSB
+            has_aio = True
+        except Exception as e:
+            print('Error importing AIOUSB. Ignore if using NI modules.')
+            print(e)
+            has_aio = False
+    return has_aio
+
+def load_daqmx() -> bool:
+    global nidaqmx, has_daqmx
+    if has_daqmx is None:
+        try:
+            import nidaqmx
+            import nidaqmx.stream_writers
+            import nidaqmx.system
+            has_daqmx = True
+        except Exception as e:
+            print('Error importing nidaqmx. Ignore if using AIOUSB.')
+            print(e)
+            has_daqmx = False
+    return has_daqmx
+
+ERROR_SUCCESS = 0
 
 def discover_ni_modules():
     """
     Returns a list of NI modules connected to the computer.
     """
-    if not has_daqmx:
+    if not load_daqmx():
         return []
 
     system = nidaqmx.system.System.local()
@@ -33,10 +54,91 @@ def discover_ni_modules():
 class AnalogModule:
     def __init__(self):
         self.name = None
+        self.serial = (ERROR_SUCCESS, 0)
         self.n_channels = 1
+        self.bitdepth = 16
         self.v_max = 5
         self.v_min = -5
+        self.init_channels()
+        self.n_dio = 1
+        self.dio_out = np.zeros(self.n_dio, dtype=bool)
+        self.connected = True
+        self.fault_time = None
+        self.last_status = ERROR_SUCCESS
+        # output transactions sent and failed, see metrics.py
+        self.writes = 0
+        self.faults = 0
+
+    def init_channels(self):
+        """
+        Resets v_out and the per-channel calibration tables. Call after n_channels, bitdepth or the voltage range change.
+        """
         self.v_out = np.zeros(self.n_channels)
+        self.channel_gain = np.ones(self.n_channels)
+        self.channel_offset = np.zeros(self.n_channels)
+        self.compile_codes()
+
+    def compile_codes(self):
+        """
+        Precomputes code = voltage * code_scale + code_offset for every channel, folding in the board range and the
+        per-channel gain/offset correction (corrected = voltage * gain + offset).
+        """
+        span = 2**self.bitdepth / (self.v_max - self.v_min)
+        self.code_max = 2**self.bitdepth - 1
+        self.code_scale = self.channel_gain * span
+        self.code_offset = (self.channel_offset - self.v_min) * span + 0.5 # +0.5 so truncation rounds to nearest
+        self._scale_list = self.code_scale.tolist()
+        self._offset_list = self.code_offset.tolist()
+        self._code_buf = np.zeros(self.n_channels)
+        self._codes = np.zeros(self.n_channels, dtype=np.uint16)
+
+    def volts_to_code(self, channel:int, voltage:float) -> int:
+        """
+        Converts an already clamped voltage to a DAC code for one channel.
+        """
+        code = int(voltage * self._scale_list[channel] + self._offset_list[channel])
+        return 0 if code < 0 else (self.code_max if code > self.code_max else code)
+
+    def volts_to_codes(self, voltages:np.ndarray) -> np.ndarray:
+        """
+        Converts already clamped voltages for all channels to DAC codes. The returned buffer is reused between calls.
+        """
+        np.multiply(voltages, self.code_scale, out=self._code_buf)
+        self._code_buf += self.code_offset
+        np.clip(self._code_buf, 0, self.code_max, out=self._code_buf)
+        self._codes[:] = self._code_buf
+        return self._codes
+
+    def set_channel_calibration(self, channel:int, gain:float, offset:float):
+        self.channel_gain[channel] = gain
+        self.channel_offset[channel] = offset
+        self.compile_codes()
+
+    def calibration_table(self) -> list:
+        """
+        [[gain, offset], ...] per channel.
+        """
+        return np.stack([self.channel_gain, self.channel_offset], axis=1).tolist()
+
+    def set_calibration_table(self, table):
+        table = np.asarray(table, dtype=float)
+        assert table.shape == (self.n_channels, 2), f'Expected {self.n_channels} channels, got {table.shape[0]}'
+        self.channel_gain[:] = table[:, 0]
+        self.channel_offset[:] = table[:, 1]
+        self.compile_codes()
+
+    def save_calibration(self, fname):
+        with open(fname, 'w') as f:
+            for gain, offset in zip(self.channel_gain, self.channel_offset):
+                f.write(f'{gain},{offset}\n')
+
+    def load_calibration(self, fname):
+        try:
+            with open(fname, 'r') as f:
+                self.set_calibration_table([[float(x) for x in line.split(',')] for line in f.read().split()])
+        except Exception as e:
+            print(e)
+            print(f'Error loading DAC calibration file for {self}.')
 
     def write_channel(self, channel:int, voltage:float):
         self.v_out[channel] = voltage
@@ -48,76 +150,303 @@ class AnalogModule:
         """
         pass
 
+    def write_multiple(self, channels:np.ndarray, voltages:np.ndarray):
+        """
+        Writes voltages to a subset of channels. The voltages are clamped to the range [v_min, v_max].
+        """
+        self.v_out[channels] = np.clip(voltages, self.v_min, self.v_max)
+
+    def write_digital(self, bit:int, value:bool):
+        """
+        Writes one digital output line.
+        """
+        self.dio_out[bit] = value
+
+    def write_digital_multiple(self, bits:np.ndarray, values:np.ndarray):
+        """
+        Sets several digital output lines at once; the other lines keep their last value.
+        """
+        self.dio_out[bits] = values
+
+    def output_waveform(self, voltages:np.ndarray, rate:float) -> float:
+        """
+        Plays voltages (one row of n_channels values per point) on the board's own clock at rate Hz. Returns the
+        rate the board runs at, or None if the module has no clocked output.
+        """
+        return None
+
+    def fault(self, status:int):
+        """
+        Marks the module as disconnected after a failed write. Writes are skipped until reconnect() succeeds.
+        """
+        self.last_status = status
+        self.faults += 1
+        if self.connected:
+            self.connected = False
+            self.fault_time = time.perf_counter()
+            print(f'{self} write failed with status {status}. Waiting for reconnect.')
+
+    def reconnect(self) -> bool:
+        """
+        Tries to bring a faulted module back. Returns True if the module is connected afterwards.
+        """
+        self.connected = True
+        return True
+
     def __repr__(self) -> str:
         return f"AnalogModule(name={self.name}, n_channels={self.n_channels})"
     
     def __str__(self) -> str:
         return self.__repr__()
 
+class SimulatedModule(AnalogModule):
+    """
+    Software stand-in for an output board. Can be unplugged and replugged to exercise fault recovery.
+    The last codes written to each channel are kept in codes.
+    """
+    def __init__(self, name:str='Simulated', n_channels:int=8, bitdepth:int=16):
+        super().__init__()
+        self.name = name
+        self.n_channels = n_channels
+        self.bitdepth = bitdepth
+        self.init_channels()
+        self.codes = np.zeros(self.n_channels, dtype=np.uint16)
+        self.n_dio = 16
+        self.dio_out = np.zeros(self.n_dio, dtype=bool)
+        self.plugged = True
+
+    def unplug(self):
+        self.plugged = False
+
+    def replug(self):
+        self.plugged = True
+
+    def write_channel(self, channel:int, voltage:float):
+        v_out = min(max(voltage, self.v_min), self.v_max)
+        self.v_out[channel] = v_out
+        if not self.connected:
+            return
+        if not self.plugged:
+            self.fault(-1)
+            return
+        self.writes += 1
+        self.codes[channel] = self.volts_to_code(channel, v_out)
+
+    def write_channels(self, voltages:np.ndarray):
+        assert voltages.shape == (self.n_channels,), f'Expected {self.n_channels} channels, got {voltages.shape[0]}'
+        np.clip(voltages, self.v_min, self.v_max, out=self.v_out)
+        if not self.connected:
+            return
+        if not self.plugged:
+            self.fault(-1)
+            return
+        self.writes += 1
+        self.codes[:] = self.volts_to_codes(self.v_out)
+
+    def write_multiple(self, channels:np.ndarray, voltages:np.ndarray):
+        v_out = np.clip(voltages, self.v_min, self.v_max)
+        self.v_out[channels] = v_out
+        if not self.connected:
+            return
+        if not self.plugged:
+            self.fault(-1)
+            return
+        self.writes += 1
+        self.codes[channels] = np.clip(v_out * self.code_scale[channels] + self.code_offset[channels], 0, self.code_max)
+
+    def write_digital(self, bit:int, value:bool):
+        self.dio_out[bit] = value
+        if self.connected and not self.plugged:
+            self.fault(-1)
+        elif self.connected:
+            self.writes += 1
+
+    def write_digital_multiple(self, bits:np.ndarray, values:np.ndarray):
+        self.dio_out[bits] = values
+        if self.connected and not self.plugged:
+            self.fault(-1)
+        elif self.connected:
+            self.writes += 1
+
+    def reconnect(self) -> bool:
+        if self.plugged:
+            self.codes[:] = self.volts_to_codes(self.v_out)
+            self.connected = True
+        return self.connected
+
 class NIModule(AnalogModule):
     pass
 
 class AIOModule(AnalogModule):
     """Wrapper for AIOUSB module."""
+    # (n_channels, bitdepth, v_min, v_max). The range must match the board's range jumpers.
+    metadata_dict = {
+        'USB-AO16-16A' : (16, 16, -5, 5),
+        'USB-AO16-16E' : (16, 16, -5, 5),
+        'USB-AO12-16A' : (16, 12, -5, 5),
+        'USB-AO12-16E' : (16, 12, -5, 5),
+        'USB-AO16-8E' : (8, 16, -5, 5),
+        'USB-AO16-8A' : (8, 16, -5, 5),
+        'USB-AO12-8E' : (8, 12, -5, 5),
+        'USB-AO12-8A' : (8, 12, -5, 5),
+        'USB-AO16-4A' : (4, 16, -5, 5),
+        'USB-AO16-4E' : (4, 16, -5, 5),
+    }
+
     def __init__(self, index):
         self.index = index
-        _,self.pid,self.name,_,_ = ao.QueryDeviceInfo(self.index)
+        super().__init__()
+        _,self.pid,self.name,self.n_dio_bytes,_ = ao.QueryDeviceInfo(self.index)
+        self.n_dio = 8 * self.n_dio_bytes
+        self.dio_out = np.zeros(self.n_dio, dtype=bool)
+        self.dio_configured = False
         self.serial = ao.GetDeviceSerialNumber(self.index)
 
-        # (n_channels, bitdepth)
-        self.metadata_dict = {
-            'USB-AO16-16A' : (16, 16),
-            'USB-AO16-16E' : (16, 16),
-            'USB-AO12-16A' : (16, 12),
-            'USB-AO12-16E' : (16, 12),
-            'USB-AO16-8E' : (8, 16),
-            'USB-AO16-8A' : (8, 16),
-            'USB-AO12-8E' : (8, 12),
-            'USB-AO12-8A' : (8, 12),
-            'USB-AO16-4A' : (4, 16),
-            'USB-AO16-4E' : (4, 16),
-        }
-
-        self.n_channels = self.metadata_dict[self.name][0]
-        self.bitdepth = self.metadata_dict[self.name][1]
-        self.v_max = 5
-        self.v_min = -5
-        self.v_out = np.zeros(self.n_channels)
+        self.n_channels, self.bitdepth, self.v_min, self.v_max = self.metadata_dict[self.name]
+        self.init_channels()
+        # (channel, code) pairs for DACMultiDirect
+        self._pairs = np.zeros(2 * self.n_channels, dtype=np.uint16)
+        self._pairs[0::2] = np.arange(self.n_channels)
         self.enable()
         self.write_channels(self.v_out)
 
     def enable(self):
-        ao.DACSetBoardRange(ao.diOnly, 1)
+        return ao.DACSetBoardRange(self.index, 1)
     
     def disable(self):
-        ao.DACSetBoardRange(ao.diOnly, 0)
+        return ao.DACSetBoardRange(self.index, 0)
 
     def write_channel(self, channel:int, voltage:float):
         """
-        Writes a voltage to a channel. The voltage is clamped to the range [-v_max, v_max].
+        Writes a voltage to a channel. The voltage is clamped to the range [v_min, v_max].
         """
-        v_out = np.clip(voltage, self.v_min, self.v_max)
-        short_out = int((v_out + self.v_max) / self.v_max / 2 * (2**self.bitdepth))
-        ao.DACDirect(self.index, channel, short_out)
+        v_out = min(max(voltage, self.v_min), self.v_max)
         self.v_out[channel] = v_out
+        if not self.connected:
+            return
+        self.writes += 1
+        status = ao.DACDirect(self.index, channel, self.volts_to_code(channel, v_out))
+        if status != ERROR_SUCCESS:
+            self.fault(status)
 
     def write_channels(self, voltages:np.ndarray):
         """
-        Writes a voltage to a channel. The voltage is clamped to the range [-v_max, v_max].
+        Writes a voltage to every channel in a single USB transaction. The voltages are clamped to the range [v_min, v_max].
         """
         assert voltages.shape == (self.n_channels,), f'Expected {self.n_channels} channels, got {voltages.shape[0]}'
+        np.clip(voltages, self.v_min, self.v_max, out=self.v_out)
+        if not self.connected:
+            return
+        self.writes += 1
+        status = self._write_v_out()
+        if status != ERROR_SUCCESS:
+            self.fault(status)
+
+    def write_multiple(self, channels:np.ndarray, voltages:np.ndarray):
+        """
+        Writes voltages to a subset of channels in a single USB transaction. The voltages are clamped to the range [v_min, v_max].
+        """
         v_out = np.clip(voltages, self.v_min, self.v_max)
-        short_out = np.array((v_out + self.v_max) / self.v_max / 2 * (2**self.bitdepth), dtype=np.uint16)
-        for i in range(self.n_channels):
-            ao.DACDirect(self.index, i, short_out[i])
-        self.v_out = v_out
+        self.v_out[channels] = v_out
+        if not self.connected:
+            return
+        pairs = np.empty(2 * len(channels), dtype=np.uint16)
+        pairs[0::2] = channels
+        pairs[1::2] = np.clip(v_out * self.code_scale[channels] + self.code_offset[channels], 0, self.code_max)
+        self.writes += 1
+        status = ao.DACMultiDirect(self.index, pairs, len(channels))
+        if status != ERROR_SUCCESS:
+            self.fault(status)
+
+    def configure_digital(self):
+        """
+        Configures every DIO group as output, driving the lines to dio_out.
+        """
+        data = np.packbits(self.dio_out, bitorder='little').tolist()
+        status = ao.DIO_Configure(self.index, False, [(1 << self.n_dio_bytes) - 1], data)
+        self.dio_configured = status == ERROR_SUCCESS
+        return status
+
+    def write_digital(self, bit:int, value:bool):
+        """
+        Writes one digital output line. The DIO groups are configured as outputs on first use.
+        """
+        self.dio_out[bit] = value
+        if not self.connected:
+            return
+        if not self.dio_configured:
+            self.configure_digital()
+        self.writes += 1
+        status = ao.DIO_Write1(self.index, bit, int(value))
+        if status != ERROR_SUCCESS:
+            self.fault(status)
+
+    def write_digital_multiple(self, bits:np.ndarray, values:np.ndarray):
+        """
+        Sets several digital output lines in a single DIO_WriteAll transaction.
+        """
+        self.dio_out[bits] = values
+        if not self.connected:
+            return
+        if not self.dio_configured:
+            self.configure_digital()
+        self.writes += 1
+        status = ao.DIO_WriteAll(self.index, np.packbits(self.dio_out, bitorder='little').tolist())
+        if status != ERROR_SUCCESS:
+            self.fault(status)
+
+    def output_waveform(self, voltages:np.ndarray, rate:float) -> float:
+        """
+        Plays voltages (one row of n_channels values per point) through DACOutputProcess, which updates all
+        channels of a point on the same clock tick. v_out is left at the last point. Returns the rate the board
+        runs at, or None if the transfer failed.
+        """
+        voltages = np.clip(voltages, self.v_min, self.v_max)
+        codes = np.clip(voltages * self.code_scale + self.code_offset, 0, self.code_max).astype(np.uint16)
+        if not self.connected:
+            return None
+        self.writes += 1
+        status, rate = ao.DACOutputProcess(self.index, rate, codes.size, codes.view(np.int16).ravel().tolist())
+        if status != ERROR_SUCCESS:
+            self.fault(status)
+            return None
+        self.v_out[:] = voltages[-1]
+        return rate
+
+    def _write_v_out(self) -> int:
+        self._pairs[1::2] = self.volts_to_codes(self.v_out)
+        return ao.DACMultiDirect(self.index, self._pairs, self.n_channels)
+
+    def reconnect(self) -> bool:
+        """
+        Re-runs discovery to find this board (by serial number), re-enables it and restores the last v_out.
+        """
+        bitmask = ao.GetDevices()
+        for index in range(8):
+            if not bitmask & (1 << index):
+                continue
+            status, _, name, _, _ = ao.QueryDeviceInfo(index)
+            if status != ERROR_SUCCESS or name != self.name:
+                continue
+            if ao.GetDeviceSerialNumber(index)[1] != self.serial[1]:
+                continue
+            self.index = index
+            if self.enable() != ERROR_SUCCESS:
+                return False
+            if self._write_v_out() != ERROR_SUCCESS:
+                return False
+            if self.dio_configured and self.configure_digital() != ERROR_SUCCESS:
+                return False
+            self.connected = True
+            return True
+        return False
     
 
 def discover_ao_modules():
     """
     Returns a list of AIOUSB modules connected to the computer.
     """
-    if not has_aio:
+    if not load_aio():
         return []
     
     bitmask = ao.GetDevices()
@@ -126,10 +455,69 @@ def discover_ao_modules():
         if bitmask & (1 << i):
             ao_list.append(i)
 
-    ao_modules = [AIOModule(idx) for idx in ao_list]
+    ao_modules = []
+    for idx in ao_list:
+        name = ao.QueryDeviceInfo(idx)[2]
+        if name not in AIOModule.metadata_dict:
+            # e.g. an ADC board on the same bus
+            print(f'Skipping AIOUSB device {idx} ({name}): not a known analog output board.')
+            continue
+        ao_modules.append(AIOModule(idx))
     return ao_modules
-    
+
+class DeviceMonitor(threading.Thread):
+    """
+    Background thread that reconnects faulted modules, so the output thread never blocks on USB recovery.
+    Recovery times (fault to restored output, in seconds) are appended to recovery_times.
+    """
+    def __init__(self, modules:list, interval:float=0.25):
+        super().__init__(daemon=True)
+        self.modules = modules
+        self.interval = interval
+        self.recovery_times = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            for module in self.modules:
+                if module.connected:
+                    continue
+                try:
+                    if module.reconnect():
+                        self.recovery_times.append(time.perf_counter() - module.fault_time)
+                        print(f'{module} reconnected after {self.recovery_times[-1]*1e3:.1f} ms')
+                except Exception as e:
+                    print(f'Error reconnecting {module}: {e}')
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+def measure_recovery(n_faults:int=10, outage:float=0.1, interval:float=0.01):
+    """
+    Unplugs and replugs a SimulatedModule while writing to it, and returns the measured recovery times.
+    """
+    module = SimulatedModule()
+    monitor = DeviceMonitor([module], interval=interval)
+    monitor.start()
+    for _ in range(n_faults):
+        module.unplug()
+        t_end = time.perf_counter() + outage
+        while time.perf_counter() < t_end:
+            module.write_channel(0, 1.0)
+            time.sleep(0.001)
+        module.replug()
+        while not module.connected:
+            module.write_channel(0, 1.0)
+            time.sleep(0.001)
+    monitor.stop()
+    return np.array(monitor.recovery_times) - outage
+
 if __name__ == "__main__":
-    ao_idx = discover_ao_modules()
-    print(ao_idx)
+    if '--simulate' in sys.argv:
+        recovery = measure_recovery()
+        print(f'Recovery after replug: mean {recovery.mean()*1e3:.1f} ms, max {recovery.max()*1e3:.1f} ms')
+    else:
+        ao_idx = discover_ao_modules()
+        print(ao_idx)
     print('Done!')
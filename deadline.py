@@ -0,0 +1,96 @@
+"""
+Output deadline watchdog. If the pipeline stops producing fresh frames (blocked waiting for the tracker, a hung
+USB call, a long GC pause), the DACs would otherwise hold their last voltage, which downstream cannot tell from
+a real fixation. The watchdog drives the outputs to a safe state once a deadline passes and records every miss.
+
+Configured per rig in the 'watchdog' section of config.json:
+
+    {"deadline_ms": 100, "safe_voltage": -5.0, "line": "USB-AO16-16A-dio7"}
+
+The watchdog is off unless a deadline is set (gui.py --deadline-ms, deadline_ms null or 0 turns it off again).
+safe_voltage null leaves the analog outputs alone, line "None" raises no flag; with both unset only the misses
+are recorded. Misses are printed at most once per log_interval seconds, as a summary.
+"""
+import time
+import threading
+from collections import deque
+
+class DeadlineWatchdog(threading.Thread):
+    """
+    Watches runner.last_output, the perf_counter() time at which runner (a DataPipeline or MultiPipeline) last
+    output a fresh tracker frame. Once that is more than deadline seconds ago the watchdog calls
+    runner.enter_safe_state(safe_voltage, last_output) (when safe_voltage is not None) and raises flag_line (a
+    DigitalOutput, or None). The runner enters the safe state under its output lock, only if no fresh frame has
+    come in since, and keeps it over timed out frames; its next fresh frame ends the safe state, and the
+    watchdog then lowers the flag line and records the miss.
+
+    misses holds (time.time() of the last output before the miss, seconds without output) for the newest
+    max_misses misses; n_misses and max_miss cover the whole run.
+    """
+    def __init__(self, runner, deadline:float=0.1, safe_voltage:float=None, flag_line=None, max_misses:int=1000,
+                 log_interval:float=10.0):
+        super().__init__(daemon=True)
+        self.runner = runner
+        self.deadline = deadline
+        self.safe_voltage = safe_voltage
+        self.flag_line = flag_line
+        # a miss is noticed at most a quarter deadline late
+        self.interval = min(max(deadline / 4, 0.001), 0.05)
+        self.misses = deque(maxlen=max_misses)
+        self.n_misses = 0
+        self.max_miss = 0.0
+        # runner.last_output when the current miss started, None while outputs are on time
+        self.missed = None
+        self.log_interval = log_interval
+        # misses since the last printed summary: count, longest, perf_counter() of the summary
+        self._log = [0, 0.0, float('-inf')]
+        self._stop_event = threading.Event()
+
+    def run(self):
+        if self.flag_line is not None:
+            self.flag_line.write(False)
+        while not self._stop_event.wait(self.interval):
+            self.check(time.perf_counter())
+        if self.missed is not None:
+            self.record(time.perf_counter())
+        self.log(time.perf_counter(), force=True)
+
+    def check(self, now:float):
+        last_output = self.runner.last_output
+        if last_output is None:
+            # no frame yet
+            return
+        if self.missed is None:
+            if now - last_output > self.deadline:
+                if self.safe_voltage is not None and not self.runner.enter_safe_state(self.safe_voltage, last_output):
+                    # a fresh frame came in since last_output was read
+                    return
+                self.missed = last_output
+                if self.flag_line is not None:
+                    self.flag_line.write(True)
+        elif last_output != self.missed:
+            if self.flag_line is not None:
+                self.flag_line.write(False)
+            self.record(last_output)
+        self.log(now)
+
+    def record(self, end:float):
+        duration = end - self.missed
+        self.misses.append((time.time() - (time.perf_counter() - self.missed), duration))
+        self.n_misses += 1
+        self.max_miss = max(self.max_miss, duration)
+        self.missed = None
+        self._log[0] += 1
+        self._log[1] = max(self._log[1], duration)
+
+    def log(self, now:float, force:bool=False):
+        """
+        Prints the misses recorded since the last summary, at most once per log_interval.
+        """
+        count, longest, last = self._log
+        if count and (force or now - last >= self.log_interval):
+            print(f'Output deadline missed {count} times, longest {longest * 1e3:.1f} ms without a fresh frame')
+            self._log = [0, 0.0, now]
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,81 @@
+import numpy as np
+
+class DropoutPolicy:
+    """
+    Decides what one eye (or output pair) outputs while tracking is lost.
+
+    none:        pass the invalid value through unchanged
+    hold:        hold the last valid value
+    sentinel:    drive to a fixed sentinel voltage
+    extrapolate: continue along the last valid velocity for up to max_extrapolate_ms, then hold where that left off
+    """
+    modes = ['none', 'hold', 'sentinel', 'extrapolate']
+
+    def __init__(self, mode:str='hold', n:int=2, sentinel:float=-5.0, max_extrapolate_ms:float=50.0):
+        if mode not in self.modes:
+            print(f'Unknown dropout mode {mode}, using hold.')
+            mode = 'hold'
+        self.mode = mode
+        self.n = n
+        self.sentinel = sentinel
+        self.max_extrapolate_ms = max_extrapolate_ms
+        self.reset()
+
+    def reset(self):
+        self.has_last = np.zeros(self.n, dtype=bool)
+        self.t_last = np.zeros(self.n)
+        self.x_last = np.zeros(self.n)
+        self.v_last = np.zeros(self.n)
+        self.out = np.zeros(self.n)
+
+    def apply(self, t:float, valid, x:np.ndarray) -> np.ndarray:
+        """
+        Returns the value to output at time t (seconds). valid is a bool or a bool per component.
+        """
+        valid = np.broadcast_to(valid, (self.n,))
+        if valid.all():
+            self._remember(t, valid, x)
+            return x
+
+        self._remember(t, valid, x)
+        if self.mode == 'none':
+            return x
+        if self.mode == 'sentinel':
+            fallback = self.sentinel
+        elif self.mode == 'hold':
+            fallback = np.where(self.has_last, self.x_last, self.sentinel)
+        else:
+            dt = t - self.t_last
+            # clamped rather than reset, so the output does not step back to x_last when the time is up
+            dt = np.minimum(dt, self.max_extrapolate_ms / 1e3)
+            fallback = np.where(self.has_last, self.x_last + self.v_last * dt, self.sentinel)
+        np.copyto(self.out, np.where(valid, x, fallback))
+        return self.out
+
+    def _remember(self, t:float, valid:np.ndarray, x:np.ndarray):
+        if self.mode == 'extrapolate':
+            dt = t - self.t_last
+            update_v = valid & self.has_last & (dt > 0)
+            if update_v.any():
+                self.v_last[update_v] = ((x - self.x_last) / np.where(dt > 0, dt, 1))[update_v]
+            self.v_last[valid & ~self.has_last] = 0
+        self.x_last[valid] = np.asarray(x)[valid]
+        self.t_last[valid] = t
+        self.has_last |= valid
+
+    def to_string(self) -> str:
+        return f'{self.mode},sentinel={self.sentinel},max_extrapolate_ms={self.max_extrapolate_ms}'
+
+    def __repr__(self) -> str:
+        return f"DropoutPolicy({self.to_string()})"
+
+def policy_from_string(text:str, n:int=2) -> DropoutPolicy:
+    """
+    Inverse of DropoutPolicy.to_string(), e.g. 'hold,sentinel=-5.0,max_extrapolate_ms=50.0'.
+    """
+    mode, *items = text.strip().split(',')
+    params = {}
+    for item in items:
+        key, value = item.split('=')
+        params[key] = float(value)
+    return DropoutPolicy(mode, n, **params)
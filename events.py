@@ -0,0 +1,69 @@
+"""
+Digital event lines: TTL outputs driven every frame from the tracking-valid flags and bits of the OpenIris
+Extra ints, e.g. to mark stimulus events in an acquisition system alongside the analog gaze.
+
+Sources are named 'left_valid', 'right_valid' or 'int<i>.<bit>' (bit of Extra Int<i>). A mapping is written as
+'source:line, ...', e.g. 'int0.0:AIO-dio2, int1.3:AIO-dio3', with lines named as in GlobalState.digital_dict.
+"""
+import numpy as np
+
+def parse_source(text:str) -> tuple:
+    """
+    'left_valid' -> ('valid', 0), 'right_valid' -> ('valid', 1), 'int3.2' -> ('int', 3, 2).
+    """
+    if text in ['left_valid', 'right_valid']:
+        return ('valid', ['left_valid', 'right_valid'].index(text))
+    if text.startswith('int'):
+        index, _, bit = text[len('int'):].partition('.')
+        index, bit = int(index), int(bit or 0)
+        if 0 <= index < 9 and 0 <= bit < 32:
+            return ('int', index, bit)
+    raise ValueError(f'Unknown event source {text}')
+
+def parse_event_map(text:str) -> dict:
+    """
+    'int0.0:AIO-dio2, int1.3:AIO-dio3' -> {'int0.0': 'AIO-dio2', 'int1.3': 'AIO-dio3'}. Raises on a bad source.
+    """
+    event_map = {}
+    for item in text.replace(',', ' ').split():
+        source, _, line = item.partition(':')
+        parse_source(source)
+        event_map[source] = line
+    return event_map
+
+def format_event_map(event_map:dict) -> str:
+    return ', '.join(f'{source}:{line}' for source, line in event_map.items())
+
+class DigitalEvents:
+    """
+    Writes the mapped lines once per frame. Lines are grouped by module and a module is written only when one
+    of its lines changed, with a single write_digital_multiple (one DIO_WriteAll on AIOUSB boards).
+
+    set_lines runs on the GUI thread while write runs on the pipeline thread, so the groups and the last written
+    values are swapped as one tuple and write reads that tuple once.
+    """
+    def __init__(self):
+        self.lines = []
+        self._plan = ([], [])
+
+    def set_lines(self, lines:list):
+        """
+        lines: [(source, DigitalOutput), ...]. Forces a write of every line on the next frame.
+        """
+        groups = {}
+        for source, output in lines:
+            bits, sources = groups.setdefault(id(output.module), (output.module, [], []))[1:]
+            bits.append(output.bit)
+            sources.append(parse_source(source))
+        self.lines = lines
+        self._plan = ([(module, np.array(bits), sources) for module, bits, sources in groups.values()], [None] * len(groups))
+
+    def write(self, ints:list, left_valid:bool, right_valid:bool):
+        valid = (left_valid, right_valid)
+        groups, last = self._plan
+        for i, (module, bits, sources) in enumerate(groups):
+            values = [valid[source[1]] if source[0] == 'valid' else bool(ints[source[1]] >> source[2] & 1)
+                      for source in sources]
+            if values != last[i]:
+                module.write_digital_multiple(bits, values)
+                last[i] = values
@@ -0,0 +1,185 @@
+import time
+import bisect
+from collections import deque
+import numpy as np
+
+class OutputFilter:
+    """
+    Base class for smoothing filters applied between the calibration transform and the DACs.
+    One instance holds the state for one eye (or one output pair); all components are filtered at once.
+    """
+    name = 'none'
+    defaults = {}
+
+    def __init__(self, n:int=2, **params):
+        self.n = n
+        unknown = set(params) - set(self.defaults)
+        if unknown:
+            raise ValueError(f'Unknown {self.name} filter parameters: {", ".join(sorted(unknown))}')
+        self.params = dict(self.defaults)
+        self.params.update(params)
+        self.reset()
+
+    def reset(self):
+        pass
+
+    def update(self, t:float, x:np.ndarray) -> np.ndarray:
+        """
+        Returns the filtered value of x sampled at time t (seconds).
+        """
+        return x
+
+    def to_string(self) -> str:
+        return ','.join([self.name] + [f'{k}={v}' for k, v in self.params.items()])
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.params})"
+
+class OneEuroFilter(OutputFilter):
+    """
+    One Euro filter (Casiez et al. 2012): a low-pass filter whose cutoff rises with speed,
+    so fixations are smoothed while saccades pass with little lag.
+    """
+    name = 'one_euro'
+    defaults = {'min_cutoff': 1.0, 'beta': 0.01, 'd_cutoff': 1.0}
+
+    def reset(self):
+        self.x_hat = None
+        self.dx_hat = np.zeros(self.n)
+        self.t_prev = 0.0
+
+    @staticmethod
+    def alpha(cutoff, dt):
+        tau = 1.0 / (2 * np.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def update(self, t:float, x:np.ndarray) -> np.ndarray:
+        if self.x_hat is None:
+            self.x_hat = np.array(x, dtype=float)
+            self.t_prev = t
+            return self.x_hat
+        dt = t - self.t_prev
+        if dt <= 0:
+            return self.x_hat
+        self.t_prev = t
+        dx = (x - self.x_hat) / dt
+        self.dx_hat += self.alpha(self.params['d_cutoff'], dt) * (dx - self.dx_hat)
+        cutoff = self.params['min_cutoff'] + self.params['beta'] * np.abs(self.dx_hat)
+        self.x_hat += self.alpha(cutoff, dt) * (x - self.x_hat)
+        return self.x_hat
+
+class KalmanFilter(OutputFilter):
+    """
+    Constant-velocity Kalman filter, run independently on each component.
+    process_noise is the white acceleration noise density, measurement_noise the variance of a sample.
+    """
+    name = 'kalman'
+    defaults = {'process_noise': 1e3, 'measurement_noise': 1e-3}
+
+    def reset(self):
+        self.x = None
+        self.v = np.zeros(self.n)
+        # covariance [[p00, p01], [p01, p11]] per component
+        self.p00 = np.ones(self.n)
+        self.p01 = np.zeros(self.n)
+        self.p11 = np.ones(self.n)
+        self.t_prev = 0.0
+
+    def update(self, t:float, x:np.ndarray) -> np.ndarray:
+        if self.x is None:
+            self.x = np.array(x, dtype=float)
+            self.t_prev = t
+            return self.x
+        dt = t - self.t_prev
+        if dt <= 0:
+            return self.x
+        self.t_prev = t
+        q = self.params['process_noise']
+        r = self.params['measurement_noise']
+        # predict
+        self.x += self.v * dt
+        p00 = self.p00 + dt * (2 * self.p01 + dt * self.p11) + q * dt**3 / 3
+        p01 = self.p01 + dt * self.p11 + q * dt**2 / 2
+        p11 = self.p11 + q * dt
+        # correct
+        k0 = p00 / (p00 + r)
+        k1 = p01 / (p00 + r)
+        residual = x - self.x
+        self.x += k0 * residual
+        self.v += k1 * residual
+        self.p00 = (1 - k0) * p00
+        self.p01 = (1 - k0) * p01
+        self.p11 = p11 - k1 * p01
+        return self.x
+
+class MedianFilter(OutputFilter):
+    """
+    Running median of the last window samples. Removes single-frame spikes.
+    Each component keeps its window sorted, so an update is one bisect removal and one insertion instead of a
+    full sort.
+    """
+    name = 'median'
+    defaults = {'window': 3}
+
+    def reset(self):
+        self.history = None
+        self.sorted = None
+        self.out = np.zeros(self.n)
+
+    def update(self, t:float, x:np.ndarray) -> np.ndarray:
+        values = np.asarray(x, dtype=float).tolist()
+        if self.history is None:
+            size = max(int(self.params['window']), 1)
+            self.history = deque([values] * size)
+            self.sorted = [[value] * size for value in values]
+        oldest = self.history.popleft()
+        self.history.append(values)
+        mid = len(self.history) // 2
+        for i, window in enumerate(self.sorted):
+            del window[bisect.bisect_left(window, oldest[i])]
+            bisect.insort(window, values[i])
+            self.out[i] = window[mid] if len(window) % 2 else (window[mid - 1] + window[mid]) / 2
+        return self.out
+
+FILTERS = {f.name: f for f in [OutputFilter, OneEuroFilter, KalmanFilter, MedianFilter]}
+
+def make_filter(name:str='none', n:int=2, **params) -> OutputFilter:
+    if name not in FILTERS:
+        print(f'Unknown filter {name}, using none.')
+        name = 'none'
+    return FILTERS[name](n, **params)
+
+def filter_from_string(text:str, n:int=2) -> OutputFilter:
+    """
+    Inverse of OutputFilter.to_string(), e.g. 'one_euro,min_cutoff=1.0,beta=0.01,d_cutoff=1.0'.
+    """
+    name, *items = text.strip().split(',')
+    params = {}
+    for item in items:
+        if not item.strip():
+            continue
+        key, value = item.split('=')
+        params[key.strip()] = float(value)
+    return make_filter(name, n, **params)
+
+def measure_latency(filt:OutputFilter, rate:float=500, n_samples:int=2000, slope:float=10.0):
+    """
+    Measures the cost of one update (in microseconds) and the lag the filter adds to a ramp (in milliseconds).
+    The ramp lag is the delay between the input and output once the filter has settled.
+    """
+    filt.reset()
+    t = np.arange(n_samples) / rate
+    x = np.outer(slope * t, np.ones(filt.n))
+    y = np.zeros_like(x)
+    start = time.perf_counter()
+    for i in range(n_samples):
+        y[i] = filt.update(t[i], x[i])
+    cost = (time.perf_counter() - start) / n_samples * 1e6
+    filt.reset()
+    lag = np.mean(x[n_samples // 2:] - y[n_samples // 2:]) / slope * 1e3
+    return cost, lag
+
+if __name__ == "__main__":
+    for name in FILTERS:
+        cost, lag = measure_latency(make_filter(name))
+        print(f'{name:>10}: {cost:6.1f} us/update, {lag:6.2f} ms ramp lag')
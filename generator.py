@@ -0,0 +1,241 @@
+"""
+Built-in test signals: a SignalGenerator stands in for the OpenIris tracker and drives the outputs with known
+waveforms, to check the wiring on a scope or to load the output path at a repeatable rate.
+
+Signals are written as 'channel=waveform(arguments); ...' with the channels of routing.SOURCES, e.g.
+
+    left_x=sine(2, amplitude=1); right_x=chirp(f0=1, f1=50); left_y=square(5); pupil_left=step(); right_y=saccade()
+
+Each waveform is sampled once into a buffer of length seconds at rate Hz and played in a loop; channels without a
+signal stay at 0 V. The values are volts at the outputs: calibration, dropout and filters are bypassed, while the
+output mode, routes, digital events, publishers, metrics and the deadline watchdog see the frames as usual.
+
+    python gui.py --generate "left_x=sine(2); right_x=saccade()" --generate-rate 500
+    python generator.py --clocked "left_x=chirp(f0=1, f1=200, period=2)" --rate 10000 --length 2
+    python generator.py --bench                     # highest frame rate the output path sustains
+"""
+import ast
+import math
+import time
+import inspect
+import numpy as np
+
+from open_iris_client import EyesData
+from routing import SOURCES
+from scheduler import PrecisionTimer
+
+def sine(t:np.ndarray, freq:float=1.0, amplitude:float=1.0, offset:float=0.0, phase:float=0.0) -> np.ndarray:
+    """
+    phase in degrees.
+    """
+    return offset + amplitude * np.sin(2 * np.pi * freq * t + np.radians(phase))
+
+def chirp(t:np.ndarray, f0:float=1.0, f1:float=50.0, period:float=10.0, amplitude:float=1.0, offset:float=0.0) -> np.ndarray:
+    """
+    Linear sweep from f0 to f1 Hz over period seconds, repeated.
+    """
+    s = t % period
+    return offset + amplitude * np.sin(2 * np.pi * (f0 * s + (f1 - f0) * s**2 / (2 * period)))
+
+def square(t:np.ndarray, freq:float=1.0, amplitude:float=1.0, offset:float=0.0, duty:float=0.5) -> np.ndarray:
+    return offset + amplitude * np.where((t * freq) % 1 < duty, 1.0, -1.0)
+
+def step(t:np.ndarray, low:float=-1.0, high:float=1.0, steps:int=5, period:float=5.0) -> np.ndarray:
+    """
+    Staircase from low to high in steps levels, each held period / steps seconds, repeated.
+    """
+    level = np.floor((t % period) / period * steps)
+    return low + (high - low) * level / max(steps - 1, 1)
+
+def saccade(t:np.ndarray, amplitude:float=1.0, interval:float=0.3, duration:float=0.04, offset:float=0.0, seed:int=0) -> np.ndarray:
+    """
+    Fixations at random positions within offset +/- amplitude, one every interval seconds, joined by
+    minimum-jerk movements of duration seconds. The targets repeat with the buffer, so the loop is seamless when
+    the buffer length is a multiple of interval.
+    """
+    span = t[-1] + (t[1] - t[0]) if len(t) > 1 else interval
+    n = max(int(round(span / interval)), 1)
+    targets = offset + amplitude * np.random.default_rng(seed).uniform(-1, 1, n)
+    k = np.floor(t / interval).astype(int)
+    s = np.clip((t - k * interval) / duration, 0, 1)
+    start, end = targets[(k - 1) % n], targets[k % n]
+    return start + (end - start) * (10 * s**3 - 15 * s**4 + 6 * s**5)
+
+WAVEFORMS = {'sine': sine, 'chirp': chirp, 'square': square, 'step': step, 'saccade': saccade}
+
+def parse_signal(text:str) -> tuple:
+    """
+    'sine(2, amplitude=1)' -> ('sine', (2,), {'amplitude': 1}). Raises ValueError on anything else than a call
+    of a known waveform with finite numeric arguments that match its signature, and on non-positive durations.
+    """
+    try:
+        node = ast.parse(text.strip(), mode='eval').body
+        if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Name):
+            raise ValueError
+        args = tuple(ast.literal_eval(arg) for arg in node.args)
+        kwargs = {keyword.arg: ast.literal_eval(keyword.value) for keyword in node.keywords}
+    except (SyntaxError, ValueError):
+        raise ValueError(f'Not a waveform: {text}, expected e.g. sine(2, amplitude=1)')
+    if node.func.id not in WAVEFORMS:
+        raise ValueError(f'Unknown waveform {node.func.id}, expected one of {", ".join(WAVEFORMS)}')
+    try:
+        bound = inspect.signature(WAVEFORMS[node.func.id]).bind(None, *args, **kwargs)
+    except TypeError as e:
+        raise ValueError(f'Bad arguments in {text.strip()}: {e}')
+    for key, value in list(bound.arguments.items())[1:]:
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or not math.isfinite(value):
+            raise ValueError(f'{key} must be a number in {text.strip()}')
+        if key in ['period', 'interval', 'duration', 'steps'] and value <= 0:
+            raise ValueError(f'{key} must be positive in {text.strip()}')
+    return node.func.id, args, kwargs
+
+def parse_signals(text:str) -> dict:
+    """
+    'left_x=sine(2); right_x=saccade()' -> {'left_x': 'sine(2)', 'right_x': 'saccade()'}. Raises on a bad
+    channel or waveform.
+    """
+    signals = {}
+    for item in text.split(';'):
+        if not item.strip():
+            continue
+        channel, _, signal = item.partition('=')
+        channel = channel.strip()
+        if channel not in SOURCES:
+            raise ValueError(f'Unknown channel {channel}, expected one of {", ".join(SOURCES)}')
+        parse_signal(signal)
+        signals[channel] = signal.strip()
+    return signals
+
+class SignalGenerator:
+    """
+    Frame source with the parts of OpenIrisClient's interface that the pipeline and the metrics use (t_receive,
+    interval, stats(), context manager). next_frame() returns the next row of the precomputed buffer as a
+    tracked frame, paced at rate Hz by a PrecisionTimer; with paced=False frames are returned as fast as they
+    are asked for, which makes it a load generator for the output path.
+    """
+    def __init__(self, signals:dict, rate:float=500.0, length:float=10.0, paced:bool=True):
+        if not rate > 0 or not length > 0:
+            raise ValueError(f'rate and length must be positive, got {rate} Hz and {length} s')
+        self.signals = signals
+        self.rate = rate
+        self.paced = paced
+        self.interval = 1 / rate
+        t = np.arange(max(int(round(length * rate)), 1)) / rate
+        # rows of (left x, left y, right x, right y, pupil left, pupil right) in volts
+        self.buffer = np.zeros((len(t), len(SOURCES)))
+        for channel, signal in signals.items():
+            name, args, kwargs = parse_signal(signal)
+            self.buffer[:, SOURCES.index(channel)] = WAVEFORMS[name](t, *args, **kwargs)
+        self.frames = 0
+        self.t_receive = 0.0
+        self.timer = None
+
+    def __enter__(self):
+        self.frames = 0
+        if self.paced:
+            self.timer = PrecisionTimer(self.rate).__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.timer is not None:
+            self.timer.__exit__(exc_type, exc_value, traceback)
+            self.timer = None
+        return False
+
+    def next_frame(self) -> tuple:
+        """
+        Waits for the next tick and returns (EyesData, values): a frame numbered from 1 with both eyes tracked,
+        and the six output voltages.
+        """
+        self.t_receive = self.timer.wait() if self.timer is not None else time.perf_counter()
+        values = self.buffer[self.frames % len(self.buffer)]
+        self.frames += 1
+        data = EyesData()
+        data.error = ''
+        for eye in [data.left, data.right]:
+            eye.frame_number = self.frames
+            eye.cr_error = eye.p4_error = ''
+        return data, values
+
+    def stats(self) -> dict:
+        late = self.timer.late_ticks if self.timer is not None else 0
+        return {'requests': self.frames, 'replies': self.frames, 'retries': 0, 'timeouts': 0, 'stale': 0,
+                'rto_ms': 0.0, 'interval_ms': self.interval * 1e3, 'late': late}
+
+    def play_clocked(self, outputs:list) -> dict:
+        """
+        Plays the buffer once on each board's own clock (AIOUSB DACOutputProcess) instead of frame by frame.
+        outputs are the six AnalogOutputs in SOURCES order; channels of the board that are not among them hold
+        their last voltage. Returns {module: rate the board runs at}, skipping modules without clocked output.
+        """
+        modules = {id(output.module): output.module for output in outputs}.values()
+        rates = {}
+        for module in modules:
+            points = np.tile(module.v_out, (len(self.buffer), 1))
+            for i, output in enumerate(outputs):
+                if output.module is module:
+                    points[:, output.channel] = self.buffer[:, i]
+            rate = module.output_waveform(points, self.rate)
+            if rate is None:
+                print(f'{module} has no clocked output, skipped.')
+            else:
+                rates[module] = rate
+        return rates
+
+def measure_throughput(duration:float=2.0, signals:str='left_x=sine(1); right_x=saccade(); pupil_left=square(2)') -> dict:
+    """
+    Runs a DataPipeline from an unpaced SignalGenerator into a SimulatedModule for duration seconds and returns
+    the frame rate it sustained and the time per frame.
+    """
+    import tempfile
+    import threading
+    from pathlib import Path
+    from dac import SimulatedModule
+    from gui import GlobalState, DataPipeline, AnalogOutput, AnalogOutputPair
+
+    state = GlobalState(Path(tempfile.mkdtemp()) / 'state')
+    module = SimulatedModule()
+    state.module_list.append(module)
+    outputs = [AnalogOutput(module, i) for i in range(6)]
+    state.left_output = AnalogOutputPair(outputs[0], outputs[1])
+    state.right_output = AnalogOutputPair(outputs[2], outputs[3])
+    state.pupil_output = AnalogOutputPair(outputs[4], outputs[5])
+    pipeline = DataPipeline(state)
+    pipeline.generator = SignalGenerator(parse_signals(signals), paced=False)
+    thread = threading.Thread(target=pipeline.run)
+    start = time.perf_counter()
+    thread.start()
+    time.sleep(duration)
+    state.is_running = False
+    thread.join()
+    elapsed = time.perf_counter() - start
+    state.device_monitor.stop()
+    state.config_writer.stop()
+    frames = pipeline.generator.frames
+    return {'frames': frames, 'throughput_hz': frames / elapsed, 'us_per_frame': elapsed / max(frames, 1) * 1e6,
+            'module_writes': module.writes}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clocked', metavar='SIGNALS', help="play these signals once on the boards' own clock, on the saved channel map")
+    parser.add_argument('--rate', type=float, default=1000, help='sample rate of the clocked buffer (Hz)')
+    parser.add_argument('--length', type=float, default=10.0, help='length of the clocked buffer (s)')
+    parser.add_argument('--bench', action='store_true', help='measure the output throughput with simulated modules')
+    args = parser.parse_args()
+
+    if args.clocked:
+        try:
+            generator = SignalGenerator(parse_signals(args.clocked), args.rate, args.length, paced=False)
+        except ValueError as e:
+            parser.error(str(e))
+        from gui import GlobalState
+        state = GlobalState()
+        for module, rate in generator.play_clocked(state.analog_outputs()).items():
+            print(f'{module}: {len(generator.buffer)} points at {rate:.1f} Hz')
+        state.device_monitor.stop()
+        state.config_writer.stop()
+    if args.bench:
+        for key, value in measure_throughput().items():
+            print(f'{key:>16}: {value:.3f}' if isinstance(value, float) else f'{key:>16}: {value}')
@@ -1,11 +1,35 @@
 from open_iris_client import OpenIrisClient, Point, EyesData
-import PySimpleGUI as sg
 import time
 from pathlib import Path
-from dac import AnalogModule, AIOModule, discover_ao_modules
-from dataclasses import dataclass
+from dac import AnalogModule, AIOModule, DeviceMonitor, discover_ao_modules
+from dataclasses import dataclass, asdict
+from filters import FILTERS, make_filter, filter_from_string
+from dropout import DropoutPolicy, policy_from_string
+from scheduler import OversampledWriter, BatchWriter
+from instrumentation import PipelineCounters, SamplingProfiler, startup
+from calibration import CalibrationEngine, MODELS, min_targets, grid_targets, parse_targets, model_from_dict
+from events import DigitalEvents, parse_source, parse_event_map, format_event_map
+from clock import ClockEstimator
+from publish import RECORD, SharedMemoryPublisher, MulticastPublisher
+from metrics import FrameMetrics, MetricsServer
+from deadline import DeadlineWatchdog
+from routing import Router, parse_expression, parse_routes, format_routes
+from config import CONFIG_NAME, CONFIG_VERSION, HISTORY_NAME, ConfigWriter, History, write_config, read_config, read_legacy_config, upgrade_config, set_aside
+import threading
+import json
+import numpy as np
 import math
 
+# PySimpleGUI (and with it tkinter) is imported when the first GUI is built, so a headless run never loads it
+# and the GUI run has its outputs live before paying for it
+sg = None
+
+def load_gui():
+    global sg
+    if sg is None:
+        import PySimpleGUI
+        sg = PySimpleGUI
+
 @dataclass
 class CalibrationParameters:
     x_bias: float
@@ -64,9 +88,29 @@ class AnalogOutputPair:
     def v_out(self):
         return Point(self.output1.v_out, self.output2.v_out)
 
+class DigitalOutput:
+    def __init__(self, module:AnalogModule = None, bit:int=0):
+        if module is None:
+            module = AnalogModule()
+        self.module = module
+        self.bit = bit
+        self.out = None
+    
+    def write(self, value:bool):
+        """
+        Writes the line only when the value changes.
+        """
+        if value != self.out:
+            self.module.write_digital(self.bit, value)
+            self.out = value
+
 
 class GlobalState:
-    def __init__(self, save_dir:Path = None) -> None:
+    def __init__(self, save_dir:Path = None, shared:'GlobalState' = None) -> None:
+        """
+        shared: another state whose output modules (and device monitor) this one reuses instead of discovering
+        its own, for several trackers driving one set of boards.
+        """
         if save_dir is None:
             cals_dir = Path(__file__).parent / 'cals'
             if not cals_dir.exists():
@@ -88,17 +132,78 @@ class GlobalState:
         self.pupil_cal = CalibrationParameters(0,0,3e-5,3e-5,0)
         self.pupil_output = AnalogOutputPair()
 
+        self.left_filter = make_filter()
+        self.right_filter = make_filter()
+        self.pupil_filter = make_filter()
+
+        self.left_dropout = DropoutPolicy()
+        self.right_dropout = DropoutPolicy()
+        self.pupil_dropout = DropoutPolicy()
+        # valid lines (from channel_map) and event_map lines, written together once per frame
+        self.digital_events = DigitalEvents()
+        # event source ('int0.0', ...) -> digital output key, see events.py
+        self.event_map = {}
+        # derived outputs: output key -> linear expression of the six signals, see routing.py
+        self.routes = {}
+        self.router = Router()
+
+        # higher-order calibration models; when set they replace left_cal/right_cal
+        self.left_model = None
+        self.right_model = None
+
+        # set while an automatic calibration is collecting samples
+        self.cal_engine = None
+
+        # 'direct' writes once per frame, otherwise an OversampledWriter mode
+        self.output_mode = 'direct'
+        self.oversample_rate = 1000
+
+        # DeadlineWatchdog settings, see deadline.py: seconds without a fresh frame before the outputs go to
+        # safe_voltage (None: left alone) and the stall_line digital output (a digital_dict key) goes high.
+        # deadline None: no watchdog
+        self.deadline = None
+        self.safe_voltage = None
+        self.stall_line = 'None'
+
+        # output key (or 'None') per role, see channel_roles; applied once the modules are discovered
+        self.channel_map = {}
+        # saved DAC calibrations keyed by device_key, kept for boards that are not plugged in
+        self.device_config = {}
+
         self.last_eyes_data = EyesData()
         self.is_running = True
 
         self.load()
 
-        self.discover_analog_modules()
+        # only the state that discovered the boards applies their saved DAC calibrations; states sharing
+        # them default to the next six outputs each
+        self.owns_modules = shared is None
+        self.sharers = []
+        self.share_index = 0
+        if shared is not None:
+            shared.sharers.append(self)
+            self.share_index = len(shared.sharers)
+        self.discover_analog_modules(shared)
+
+        self.history = History(self.save_dir / HISTORY_NAME)
+        self.history.record(self.to_config())
+        self.config_writer = ConfigWriter(self.to_config, self.save_dir / CONFIG_NAME, history=self.history)
+        self.config_writer.start()
 
-    def discover_analog_modules(self):
+    channel_roles = ['left_x', 'left_y', 'right_x', 'right_y', 'pupil_x', 'pupil_y']
+    digital_roles = ['left_valid', 'right_valid']
+
+    def discover_analog_modules(self, shared:'GlobalState' = None):
         # TODO Move this to global state (also save serial numbers?)
-        self.module_list = discover_ao_modules()
-        print(f"Found {len(self.module_list)} Output Devices: {self.module_list}")
+        if shared is not None:
+            self.module_list = shared.module_list
+            self.device_monitor = shared.device_monitor
+        else:
+            self.module_list = discover_ao_modules()
+            startup.mark('modules discovered')
+            print(f"Found {len(self.module_list)} Output Devices: {self.module_list}")
+            self.device_monitor = DeviceMonitor(self.module_list)
+            self.device_monitor.start()
         
         self.output_dict = {}
         for module in self.module_list:
@@ -110,19 +215,184 @@ class GlobalState:
 
         print(f"Found {len(self.output_dict)} Output Channels: {self.output_dict.keys()}")
 
+        self.digital_dict = {}
+        for module in self.module_list:
+            for bit in range(module.n_dio):
+                key = f'{module.name}-dio{bit}'
+                while key in self.digital_dict:
+                    key = key[:len(module.name)] + '-2' + key[len(module.name):]
+                self.digital_dict[key] = DigitalOutput(module, bit)
+
+        self.apply_devices()
+
+    def analog_outputs(self) -> list:
+        """
+        The six analog outputs in pipeline order: left x/y, right x/y, pupil left/right.
+        """
+        return [self.left_output.output1, self.left_output.output2,
+                self.right_output.output1, self.right_output.output2,
+                self.pupil_output.output1, self.pupil_output.output2]
+
+    @staticmethod
+    def device_key(module:AnalogModule) -> str:
+        return f'{module.name}_{module.serial[1]}'
+
+    def apply_devices(self):
+        """
+        Loads the saved DAC calibrations into the discovered modules and connects the outputs in channel_map.
+        """
+        for module in self.module_list if self.owns_modules else []:
+            entry = self.device_config.get(self.device_key(module))
+            if entry is not None:
+                try:
+                    module.set_calibration_table(entry['calibration'])
+                except Exception as e:
+                    print(e)
+                    print(f'Error loading DAC calibration for {module}.')
+        self.apply_channel_map()
+
+    def apply_channel_map(self):
+        """
+        Points the output pairs and valid lines at the keys in channel_map. Roles without an entry get the
+        discovered outputs in order; keys of devices that are not plugged in write nowhere but stay in the map.
+        """
+        defaults = list(self.output_dict.keys())[len(self.channel_roles) * self.share_index:]
+        for i, role in enumerate(self.channel_roles):
+            self.channel_map.setdefault(role, defaults[i] if i < len(defaults) else 'None')
+        for role in self.digital_roles:
+            self.channel_map.setdefault(role, 'None')
+        outputs = [self.output_dict.get(self.channel_map[role]) or AnalogOutput() for role in self.channel_roles]
+        self.left_output = AnalogOutputPair(outputs[0], outputs[1])
+        self.right_output = AnalogOutputPair(outputs[2], outputs[3])
+        self.pupil_output = AnalogOutputPair(outputs[4], outputs[5])
+        lines = [(role, self.channel_map[role]) for role in self.digital_roles] + list(self.event_map.items())
+        self.digital_events.set_lines([(source, self.digital_dict[key]) for source, key in lines if key in self.digital_dict])
+        self.router.set_routes([(self.output_dict[key], expression) for key, expression in self.routes.items() if key in self.output_dict])
+
+    def to_config(self) -> dict:
+        devices = dict(self.device_config)
+        for module in getattr(self, 'module_list', []):
+            devices[self.device_key(module)] = {'name': module.name, 'serial': module.serial[1],
+                                                'calibration': module.calibration_table()}
+        return {
+            'version': CONFIG_VERSION,
+            'calibrations': {name: asdict(getattr(self, name + '_cal')) for name in ['left', 'right', 'pupil']},
+            'methods': {'left': self.left_method, 'right': self.right_method},
+            'filters': {name: getattr(self, name + '_filter').to_string() for name in ['left', 'right', 'pupil']},
+            'dropout': {name: getattr(self, name + '_dropout').to_string() for name in ['left', 'right', 'pupil']},
+            'models': {name: None if getattr(self, name + '_model') is None else getattr(self, name + '_model').to_dict()
+                       for name in ['left', 'right']},
+            'output': {'mode': self.output_mode, 'rate': self.oversample_rate},
+            'watchdog': {'deadline_ms': None if self.deadline is None else self.deadline * 1e3, 'safe_voltage': self.safe_voltage, 'line': self.stall_line},
+            'channels': dict(self.channel_map),
+            'events': dict(self.event_map),
+            'routes': dict(self.routes),
+            'devices': devices,
+        }
+
+    def from_config(self, config:dict):
+        """
+        Applies a config document or a subset of its sections. Each section is applied on its own, so one bad
+        entry does not discard the rest.
+        """
+        # calibrations are updated in place, the GUI fields hold references to them
+        for name, cal in config.get('calibrations', {}).items():
+            if name in ['left', 'right', 'pupil']:
+                for field in ['x_bias', 'y_bias', 'x_gain', 'y_gain', 'rotation']:
+                    if field in cal:
+                        setattr(getattr(self, name + '_cal'), field, float(cal[field]))
+        for name, method in config.get('methods', {}).items():
+            if name in ['left', 'right']:
+                setattr(self, name + '_method', method if method in ['dpi', 'pcr'] else 'dpi')
+        for section, field, parse in [('filters', 'filter', filter_from_string), ('dropout', 'dropout', policy_from_string)]:
+            for name, text in config.get(section, {}).items():
+                if name in ['left', 'right', 'pupil']:
+                    try:
+                        setattr(self, f'{name}_{field}', parse(text))
+                    except Exception as e:
+                        print(e)
+                        print(f'Error loading {name} {field}.')
+        for name in ['left', 'right']:
+            if 'models' not in config:
+                break
+            setattr(self, name + '_model', None)
+            struct = config['models'].get(name)
+            if struct is not None:
+                try:
+                    setattr(self, name + '_model', model_from_dict(struct))
+                except Exception as e:
+                    print(e)
+                    print(f'Error loading {name} calibration model.')
+        output = config.get('output', {})
+        mode = output.get('mode', self.output_mode)
+        self.output_mode = mode if mode in ['direct'] + OversampledWriter.modes else 'direct'
+        self.oversample_rate = float(output.get('rate', self.oversample_rate))
+        watchdog = config.get('watchdog', {})
+        try:
+            deadline_ms = watchdog.get('deadline_ms')
+            self.deadline = float(deadline_ms) / 1e3 if deadline_ms else None
+            safe_voltage = watchdog.get('safe_voltage', self.safe_voltage)
+            self.safe_voltage = None if safe_voltage is None else float(safe_voltage)
+            self.stall_line = str(watchdog.get('line', self.stall_line))
+        except Exception as e:
+            print(e)
+            print('Error loading watchdog settings.')
+        if 'channels' in config:
+            self.channel_map = dict(config['channels'])
+        if 'events' in config:
+            try:
+                for source in config['events']:
+                    parse_source(source)
+                self.event_map = dict(config['events'])
+            except Exception as e:
+                print(e)
+                print('Error loading event lines.')
+        if 'routes' in config:
+            try:
+                for expression in config['routes'].values():
+                    parse_expression(expression)
+                self.routes = dict(config['routes'])
+            except Exception as e:
+                print(e)
+                print('Error loading routes.')
+        if 'devices' in config:
+            self.device_config = dict(config['devices'])
+
+    def request_save(self):
+        """
+        Non-blocking save to the state directory; the write happens on the config writer thread.
+        """
+        self.config_writer.request()
+
+    def undo(self) -> bool:
+        """
+        Restores the previous calibration snapshot. Pending edits are saved first so they can be redone.
+        """
+        self.save()
+        state = self.history.undo()
+        if state is not None:
+            self.from_config(state)
+            self.save()
+        return state is not None
+
+    def redo(self) -> bool:
+        self.save()
+        state = self.history.redo()
+        if state is not None:
+            self.from_config(state)
+            self.save()
+        return state is not None
+
     def save(self, path:Path = None):
         if path is None:
             path = self.save_dir
 
         if not path.exists():
             path.mkdir()
-        # save calibrations
-        self.left_cal.save(path / 'left_cal.txt')
-        self.right_cal.save(path / 'right_cal.txt')
-        self.pupil_cal.save(path / 'pupil_cal.txt')
-        # save methods
-        with open(path / 'methods.txt', 'w') as f:
-            f.write(f'{self.left_method},{self.right_method}')
+        if path == self.save_dir and hasattr(self, 'config_writer'):
+            self.config_writer.flush()
+        else:
+            write_config(path / CONFIG_NAME, self.to_config())
     
     def load(self, path:Path = None):
         if path is None:
@@ -131,24 +401,29 @@ class GlobalState:
         if not path.exists():
             print('No save directory found.')
             return
-        # load calibrations
-        try:
-            self.left_cal.load(path / 'left_cal.txt')
-            self.right_cal.load(path / 'right_cal.txt')
-            self.pupil_cal.load(path / 'pupil_cal.txt')
-        except:
-            print('Error loading calibration files.')
-        # load methods
-        try:
-            with open(path / 'methods.txt', 'r') as f:
-                self.left_method, self.right_method = f.read().split(',')
-            if self.left_method not in ['dpi', 'pcr']:
-                self.left_method = 'dpi'
-            if self.right_method not in ['dpi', 'pcr']:
-                self.right_method = 'dpi'
-        except:
-            self.left_method = 'dpi'
-            self.right_method = 'dpi'
+        fname = path / CONFIG_NAME
+        if fname.exists():
+            try:
+                config = read_config(fname)
+            except Exception as e:
+                print(e)
+                if path != self.save_dir:
+                    print(f'Error loading {fname}.')
+                    return
+                # autosave would overwrite it with the defaults
+                bad = set_aside(fname)
+                print(f'WARNING: Error loading {fname}. It was moved to {bad} and the settings start from defaults.')
+                return
+        elif any(path.glob('*.txt')):
+            config = upgrade_config(read_legacy_config(path))
+            print(f'Migrated the .txt config files in {path} to {CONFIG_NAME}.')
+        else:
+            return
+        self.from_config(config)
+        if hasattr(self, 'module_list'):
+            self.apply_devices()
+        if not fname.exists():
+            write_config(fname, config)
 
 from typing import Callable
 class GUIField:
@@ -207,35 +482,57 @@ class GUIField:
             if old_slider != new_slider:
                 window[self.key+'_slider'].update(value=state/self.gain_factor)
         
+    def events(self) -> list:
+        """
+        The event keys of this field's elements, for GUI.handlers.
+        """
+        suffixes = ['_input', '_inc', '_dec'] + (['_slider'] if self.slider_enabled else []) + (['_flip'] if self.flip_enabled else [])
+        return [self.key + suffix for suffix in suffixes]
+
     def update(self, window, event:str, values:dict):
-        if self.key in event:
-            flip = (1 - values[self.key+'_flip'] * 2) if self.flip_enabled else 1
-            if event == self.key+'_input':
-                try:
-                    self.setter(float(values[event]) * self.gain_factor * flip)
-                except:
-                    pass
-            if event == self.key+'_inc':
-                if self.multiplicative:
-                    self.setter(self.getter() * (1+self.increment))
-                else:
-                    self.setter(self.getter() + self.increment * self.gain_factor * flip)
-            if event == self.key+'_dec':
-                if self.multiplicative:
-                    self.setter(self.getter() * (1-self.increment))
-                else:
-                    self.setter(self.getter() - self.increment * self.gain_factor * flip)
-            if event == self.key+'_slider':
-                self.setter(values[event] * self.gain_factor * flip)
-            if event == self.key+'_flip':
-                self.setter(self.getter() * -1)
-            self.sync_state(window)
+        """
+        Handles one of this field's events (see events()).
+        """
+        flip = (1 - values[self.key+'_flip'] * 2) if self.flip_enabled else 1
+        if event == self.key+'_input':
+            try:
+                self.setter(float(values[event]) * self.gain_factor * flip)
+            except:
+                pass
+        elif event == self.key+'_inc':
+            if self.multiplicative:
+                self.setter(self.getter() * (1+self.increment))
+            else:
+                self.setter(self.getter() + self.increment * self.gain_factor * flip)
+        elif event == self.key+'_dec':
+            if self.multiplicative:
+                self.setter(self.getter() * (1-self.increment))
+            else:
+                self.setter(self.getter() - self.increment * self.gain_factor * flip)
+        elif event == self.key+'_slider':
+            self.setter(values[event] * self.gain_factor * flip)
+        elif event == self.key+'_flip':
+            self.setter(self.getter() * -1)
+        self.sync_state(window)
 
 class GUI:
-    def __init__(self, state:GlobalState) -> None:
+    def __init__(self, state:GlobalState, pipeline:'DataPipeline'=None) -> None:
+        load_gui()
         self.state = state
+        self.pipeline = pipeline
+        self.cal_target = 0
+        self.cal_results = None
+        self.cal_status = ''
+        # what the graph and status line last showed, see refresh()
+        self.graph_state = None
+        self.graph_figures = []
+        self.status = None
+        self.last_change = 0.0
+        self.next_refresh = 0.0
 
-        menu_def = [['File', ['Save Config', 'Load Config', 'Exit']]]
+        menu_def = [['File', ['Save Config', 'Load Config', 'Exit']],
+                    ['Edit', ['Undo', 'Redo']],
+                    ['Tools', ['Enable Counters', 'Disable Counters', 'Show Counters', 'Capture Profile']]]
 
         def make_column(title, key, size, resolution, default_value, minimum, maximum, append=[]):
             return sg.Column([
@@ -244,158 +541,90 @@ class GUI:
                 append
                 ])
         
-        field_size = (40,1)
-        self.bias_factor = 5e0
-        self.gain_factor = 1.3e-4
-        b_min = -100
-        b_max = 100
-        b_res = .2
-        g_min = 0
-        g_max = 500
-        g_res = .5
-        self.lbx = GUIField(
-            'X Bias', 'left_x_bias', field_size,
-            self.state.left_cal, 'x_bias', gain_factor=self.bias_factor,
-            increment=.5, multiplicative=False,
-            slider_enabled=True, slider_minimum=b_min, slider_maximum=b_max, slider_resolution=b_res
-            )
-        self.lby = GUIField(
-            'Y Bias', 'left_y_bias', field_size,
-            self.state.left_cal, 'y_bias', gain_factor=self.bias_factor,
-            increment=.5, multiplicative=False,
-            slider_enabled=True, slider_minimum=b_min, slider_maximum=b_max, slider_resolution=b_res
-            )
-        self.lgx = GUIField(
-            'X Gain', 'left_x_gain', field_size,
-            self.state.left_cal, 'x_gain', gain_factor=self.gain_factor,
-            increment=0.05, multiplicative=True, flip_enabled=True,
-            slider_enabled=True, slider_minimum=g_min, slider_maximum=g_max, slider_resolution=g_res
-            )
-        self.lgy = GUIField(
-            'Y Gain', 'left_y_gain', field_size,
-            self.state.left_cal, 'y_gain', gain_factor=self.gain_factor,
-            increment=0.05, multiplicative=True, flip_enabled=True,
-            slider_enabled=True, slider_minimum=g_min, slider_maximum=g_max, slider_resolution=g_res
-            )
-        self.lr = GUIField(
-            'Rotation', 'left_rotation', field_size,
-            self.state.left_cal, 'rotation', gain_factor=1,
-            increment=1, multiplicative=False,
-            slider_enabled=True, slider_minimum=-180, slider_maximum=180, slider_resolution=1
-            )
-        lt = sg.Tab('Left Eye', [
-            [self.lbx.get_layout()],
-            [self.lby.get_layout()],
-            [self.lgx.get_layout()],
-            [self.lgy.get_layout()],
-            [self.lr.get_layout()],
-            [sg.VPush()],
-            [sg.Text('Method: '),
-                sg.Radio('DPI (P1-P4)', 'left_method', key='left_dpi', default=self.state.left_method=='dpi', enable_events=True), 
-                sg.Radio('PCR (P1-Pupil)', 'left_method', key='left_pcr', default=self.state.left_method=='pcr', enable_events=True)
-            ]])
-        
-        self.rbx = GUIField(
-            'X Bias', 'right_x_bias', field_size,
-            self.state.right_cal, 'x_bias', gain_factor=self.bias_factor,
-            increment=1, multiplicative=False,
-            slider_enabled=True, slider_minimum=b_min, slider_maximum=b_max, slider_resolution=b_res
-            )
-        self.rby = GUIField(
-            'Y Bias', 'right_y_bias', field_size,
-            self.state.right_cal, 'y_bias', gain_factor=self.bias_factor,
-            increment=1, multiplicative=False,
-            slider_enabled=True, slider_minimum=b_min, slider_maximum=b_max, slider_resolution=b_res
-            )
-        self.rgx = GUIField(
-            'X Gain', 'right_x_gain', field_size,
-            self.state.right_cal, 'x_gain', gain_factor=self.gain_factor,
-            increment=0.05, multiplicative=True, flip_enabled=True,
-            slider_enabled=True, slider_minimum=g_min, slider_maximum=g_max, slider_resolution=g_res
-            )
-        self.rgy = GUIField(
-            'Y Gain', 'right_y_gain', field_size,
-            self.state.right_cal, 'y_gain', gain_factor=self.gain_factor,
-            increment=0.05, multiplicative=True, flip_enabled=True,
-            slider_enabled=True, slider_minimum=g_min, slider_maximum=g_max, slider_resolution=g_res
-            )
-        self.rr = GUIField(
-            'Rotation', 'right_rotation', field_size,
-            self.state.right_cal, 'rotation', gain_factor=1,
-            increment=1, multiplicative=False,
-            slider_enabled=True, slider_minimum=-180, slider_maximum=180, slider_resolution=1
-            )
-        rt = sg.Tab('Right Eye', [
-            [self.rbx.get_layout()],
-            [self.rby.get_layout()],
-            [self.rgx.get_layout()],
-            [self.rgy.get_layout()],
-            [self.rr.get_layout()],
+        field_size = self.field_size
+        # event key -> handler(event, values), see window_loop
+        self.handlers = {}
+        # event key prefix -> GUIField, e.g. 'left_x_bias'
+        self.fields = {}
+
+        eye_tabs = []
+        for title, eye, bias_increment in self.eye_tabs:
+            cal = getattr(self.state, eye + '_cal')
+            fields = [self.add_field(spec, f'{eye}_{spec[1]}', cal, bias_increment) for spec in self.eye_fields]
+            eye_tabs.append(sg.Tab(title, [[field.get_layout()] for field in fields] + [
+                [sg.VPush()],
+                [sg.Text('Method: '),
+                    sg.Radio('DPI (P1-P4)', f'{eye}_method', key=f'{eye}_dpi', default=getattr(self.state, eye + '_method')=='dpi', enable_events=True), 
+                    sg.Radio('PCR (P1-Pupil)', f'{eye}_method', key=f'{eye}_pcr', default=getattr(self.state, eye + '_method')=='pcr', enable_events=True)
+                ],
+                [sg.Text('Filter: '), sg.Combo(list(FILTERS), default_value=getattr(self.state, eye + '_filter').name, key=f'{eye}_filter', readonly=True, enable_events=True),
+                 sg.Input(self.filter_params(eye), key=f'{eye}_filter_params', size=(30, 1), tooltip='key=value, ...'),
+                 sg.Button('Set', key=f'{eye}_filter_set')],
+                [sg.Text('Dropout: '), sg.Combo(DropoutPolicy.modes, default_value=getattr(self.state, eye + '_dropout').mode, key=f'{eye}_dropout', readonly=True, enable_events=True)]
+                ]))
+            for key in [f'{eye}_dpi', f'{eye}_pcr']:
+                self.handlers[key] = self.update_method
+            self.handlers[f'{eye}_zero'] = self.zero_eye
+
+        fields = [self.add_field(spec, spec[1], self.state.pupil_cal) for spec in self.pupil_fields]
+        pt = sg.Tab('Pupil', [[field.get_layout()] for field in fields] + [
             [sg.VPush()],
-            [sg.Text('Method: '),
-                sg.Radio('DPI (P1-P4)', 'right_method', key='right_dpi', default=self.state.right_method=='dpi', enable_events=True), 
-                sg.Radio('PCR (P1-Pupil)', 'right_method', key='right_pcr', default=self.state.right_method=='pcr', enable_events=True)
-            ]])
-        
+            [sg.Text('Filter: '), sg.Combo(list(FILTERS), default_value=self.state.pupil_filter.name, key='pupil_filter', readonly=True, enable_events=True),
+             sg.Input(self.filter_params('pupil'), key='pupil_filter_params', size=(30, 1), tooltip='key=value, ...'),
+             sg.Button('Set', key='pupil_filter_set')],
+            [sg.Text('Dropout: '), sg.Combo(DropoutPolicy.modes, default_value=self.state.pupil_dropout.mode, key='pupil_dropout', readonly=True, enable_events=True)]
+            ])
         
-        self.pupil_bias_factor = 3e3
-        self.pupil_gain_factor = 3e-7
-        self.plb = GUIField(
-            'Left Pupil Bias', 'left_pupil_bias', field_size, 
-            self.state.pupil_cal, 'x_bias', gain_factor=self.pupil_bias_factor, 
-            increment=1, multiplicative=False
-            )
-        self.prb = GUIField(
-            'Right Pupil Bias', 'right_pupil_bias', field_size, 
-            self.state.pupil_cal, 'y_bias', gain_factor=self.pupil_bias_factor,
-            increment=1, multiplicative=False
-            )
-        self.plg = GUIField(
-            'Left Pupil Gain', 'left_pupil_gain', field_size, 
-            self.state.pupil_cal, 'x_gain', gain_factor=self.pupil_gain_factor, 
-            increment=0.05, multiplicative=True, flip_enabled=True,
-            slider_enabled=True, slider_minimum=g_min, slider_maximum=g_max, slider_resolution=g_res
-            )
-        self.prg = GUIField(
-            'Right Pupil Gain', 'right_pupil_gain', field_size, 
-            self.state.pupil_cal, 'y_gain', gain_factor=self.pupil_gain_factor,
-            increment=0.05, multiplicative=True, flip_enabled=True,
-            slider_enabled=True, slider_minimum=g_min, slider_maximum=g_max, slider_resolution=g_res
-            )
-
-        pt = sg.Tab('Pupil', [
-            [self.plb.get_layout()],
-            [self.prb.get_layout()],
-            [self.plg.get_layout()],
-            [self.prg.get_layout()],
+        default_targets = '; '.join(f'{x:g},{y:g}' for x, y in grid_targets())
+        ct = sg.Tab('Calibrate', [
+            [sg.Text('Targets (volts, x,y; x,y; ...)')],
+            [sg.Multiline(default_targets, size=(field_size[0], 4), key='cal_targets')],
+            [sg.Text('Samples per target: '), sg.InputText('100', size=(8, 1), key='cal_samples')],
+            [sg.Text('Model: '), sg.Combo(list(MODELS), default_value='linear', key='cal_model', readonly=True, enable_events=True),
+             sg.Button('Clear Models', key='cal_clear')],
+            [sg.Button('Start', key='cal_start'), sg.Button('Collect', key='cal_collect', disabled=True),
+             sg.Button('Fit', key='cal_fit', disabled=True)],
+            [sg.Button('Apply Left', key='cal_apply_left', disabled=True), sg.Button('Apply Right', key='cal_apply_right', disabled=True)],
+            [sg.Text('', key='cal_status', size=(field_size[0], 6))],
             [sg.VPush()],
             ])
-        
-        tabs = sg.TabGroup([[lt, rt, pt]], key='tabs', expand_y=True)
+
+        tabs = sg.TabGroup([eye_tabs + [pt, ct]], key='tabs', expand_y=True)
         
         self.graph = sg.Graph(canvas_size=(400,400), graph_bottom_left=(-5.1,-5.1), graph_top_right=(5.1,5.1), background_color='grey', key='graph')
 
         self.output_list = list(self.state.output_dict.keys())
         self.output_list.insert(0, 'None')
+        self.digital_list = ['None'] + list(self.state.digital_dict.keys())
         graph_col = sg.Column([
             [sg.Text('', key='error', size=(20,1), text_color='red')],
             [self.graph],
             [sg.Text('Channels: '),],
             [sg.Button(' Zero ', key='left_zero', enable_events=True, button_color='DodgerBlue'), 
-             sg.Text('Left X: '), sg.Combo(self.output_list, default_value=self.output_list[1] if len(self.output_list) > 1 else 'None', 
+             sg.Text('Left X: '), sg.Combo(self.output_list, default_value=self.state.channel_map['left_x'], 
                                            key='left_x_channel', enable_events=True),
-             sg.Text(' Y: '), sg.Combo(self.output_list, default_value=self.output_list[2] if len(self.output_list) > 2 else 'None', 
+             sg.Text(' Y: '), sg.Combo(self.output_list, default_value=self.state.channel_map['left_y'], 
                                             key='left_y_channel', enable_events=True)],
             [sg.Button(' Zero ', key='right_zero', enable_events=True, button_color='firebrick1'), 
-             sg.Text('Right X: '), sg.Combo(self.output_list, default_value=self.output_list[3] if len(self.output_list) > 3 else 'None', 
+             sg.Text('Right X: '), sg.Combo(self.output_list, default_value=self.state.channel_map['right_x'], 
                                             key='right_x_channel', enable_events=True),
-             sg.Text(' Y: '), sg.Combo(self.output_list, default_value=self.output_list[4] if len(self.output_list) > 4 else 'None', 
+             sg.Text(' Y: '), sg.Combo(self.output_list, default_value=self.state.channel_map['right_y'], 
                                             key='right_y_channel', enable_events=True)],
             [sg.Button(' ', disabled=True, button_color='DarkGoldenrod1'), 
-             sg.Text('Pupil Left: '), sg.Combo(self.output_list, default_value=self.output_list[5] if len(self.output_list) > 5 else 'None', 
+             sg.Text('Pupil Left: '), sg.Combo(self.output_list, default_value=self.state.channel_map['pupil_x'], 
                                             key='pupil_x_channel', enable_events=True),
-             sg.Text(' Right: '), sg.Combo(self.output_list, default_value=self.output_list[6] if len(self.output_list) > 6 else 'None', 
+             sg.Text(' Right: '), sg.Combo(self.output_list, default_value=self.state.channel_map['pupil_y'], 
                                             key='pupil_y_channel', enable_events=True)],
+            [sg.Text('Valid Left: '), sg.Combo(self.digital_list, default_value=self.state.channel_map['left_valid'], key='left_valid_line', enable_events=True),
+             sg.Text(' Right: '), sg.Combo(self.digital_list, default_value=self.state.channel_map['right_valid'], key='right_valid_line', enable_events=True)],
+            [sg.Text('Events: '), sg.Input(format_event_map(self.state.event_map), key='event_map', size=(30, 1),
+                                           tooltip='source:line, ... with sources int<i>.<bit>, left_valid, right_valid'),
+             sg.Button('Set', key='event_map_set')],
+            [sg.Text('Routes: '), sg.Input(format_routes(self.state.routes), key='routes', size=(30, 1),
+                                           tooltip='output=expression; ... with linear expressions of left_x, left_y, right_x, right_y, pupil_left, pupil_right'),
+             sg.Button('Set', key='routes_set')],
+            [sg.Text('Output: '), sg.Combo(['direct'] + OversampledWriter.modes, default_value=self.state.output_mode, key='output_mode', readonly=True, enable_events=True),
+             sg.Text(f'({self.state.oversample_rate:g} Hz when oversampling)')],
             [sg.Button('Switch Left/Right', key='switch', enable_events=True)]
             ])
         self.layout = [
@@ -403,36 +632,181 @@ class GUI:
             [tabs, graph_col]
         ]
 
+        for eye in ['left', 'right', 'pupil']:
+            self.handlers[f'{eye}_filter'] = self.update_filter
+            self.handlers[f'{eye}_filter_set'] = self.update_filter_params
+        for key in ['left_dropout', 'right_dropout', 'pupil_dropout']:
+            self.handlers[key] = self.update_dropout
+        for role in self.state.channel_roles:
+            self.handlers[role + '_channel'] = lambda event, values: self.update_output_channels()
+        for key in ['left_valid_line', 'right_valid_line']:
+            self.handlers[key] = lambda event, values: self.update_valid_lines()
+        for key in ['cal_model', 'cal_clear', 'cal_start', 'cal_collect', 'cal_fit', 'cal_apply_left', 'cal_apply_right']:
+            self.handlers[key] = self.update_calibration
+        self.handlers.update({
+            'output_mode': lambda event, values: setattr(self.state, 'output_mode', values[event]),
+            'event_map_set': self.update_event_map,
+            'routes_set': self.update_routes,
+            'switch': self.switch_eyes,
+            'Save Config': self.save_config,
+            'Load Config': self.load_config,
+            'Undo': self.undo_redo,
+            'Redo': self.undo_redo,
+        })
+        if self.pipeline is not None:
+            self.handlers.update({
+                'Enable Counters': lambda event, values: self.pipeline.enable_counters(),
+                'Disable Counters': lambda event, values: self.pipeline.disable_counters(),
+                'Show Counters': self.show_counters,
+                'Capture Profile': self.capture_profile,
+            })
+
+    field_size = (40,1)
+    bias_factor = 5e0
+    gain_factor = 1.3e-4
+    pupil_bias_factor = 3e3
+    pupil_gain_factor = 3e-7
+
+    # GUIFields, one per row. (title, key, calibration field, gain factor, increment, multiplicative, flip, slider)
+    # with slider (minimum, maximum, resolution) or None. Eye field keys are prefixed with the eye ('left_x_bias')
+    # and a None increment is the eye's bias increment.
+    eye_fields = [
+        ('X Bias', 'x_bias', 'x_bias', bias_factor, None, False, False, (-100, 100, .2)),
+        ('Y Bias', 'y_bias', 'y_bias', bias_factor, None, False, False, (-100, 100, .2)),
+        ('X Gain', 'x_gain', 'x_gain', gain_factor, 0.05, True, True, (0, 500, .5)),
+        ('Y Gain', 'y_gain', 'y_gain', gain_factor, 0.05, True, True, (0, 500, .5)),
+        ('Rotation', 'rotation', 'rotation', 1, 1, False, False, (-180, 180, 1)),
+    ]
+    # (tab title, eye, bias increment)
+    eye_tabs = [('Left Eye', 'left', .5), ('Right Eye', 'right', 1)]
+    # on state.pupil_cal
+    pupil_fields = [
+        ('Left Pupil Bias', 'left_pupil_bias', 'x_bias', pupil_bias_factor, 1, False, False, None),
+        ('Right Pupil Bias', 'right_pupil_bias', 'y_bias', pupil_bias_factor, 1, False, False, None),
+        ('Left Pupil Gain', 'left_pupil_gain', 'x_gain', pupil_gain_factor, 0.05, True, True, (0, 500, .5)),
+        ('Right Pupil Gain', 'right_pupil_gain', 'y_gain', pupil_gain_factor, 0.05, True, True, (0, 500, .5)),
+    ]
+
+    def add_field(self, spec:tuple, key:str, obj:object, default_increment:float=None) -> GUIField:
+        """
+        Builds the GUIField for one spec row and registers its events.
+        """
+        title, _, field, gain_factor, increment, multiplicative, flip, slider = spec
+        slider_args = {}
+        if slider is not None:
+            slider_args = dict(slider_enabled=True, slider_minimum=slider[0], slider_maximum=slider[1], slider_resolution=slider[2])
+        gui_field = GUIField(title, key, self.field_size, obj, field, gain_factor=gain_factor,
+                             increment=default_increment if increment is None else increment, multiplicative=multiplicative,
+                             flip_enabled=flip, **slider_args)
+        self.fields[key] = gui_field
+        for event in gui_field.events():
+            self.handlers[event] = lambda event, values: gui_field.update(self.window, event, values)
+        return gui_field
+
     def update_sliders(self):
-        self.lbx.sync_state(self.window)
-        self.lby.sync_state(self.window)
-        self.lgx.sync_state(self.window)
-        self.lgy.sync_state(self.window)
-        self.lr.sync_state(self.window)
-        self.rbx.sync_state(self.window)
-        self.rby.sync_state(self.window)
-        self.rgx.sync_state(self.window)
-        self.rgy.sync_state(self.window)
-        self.rr.sync_state(self.window)
-        self.plb.sync_state(self.window)
-        self.prb.sync_state(self.window)
-        self.plg.sync_state(self.window)
-        self.prg.sync_state(self.window)
+        for field in self.fields.values():
+            field.sync_state(self.window)
+        for eye in ['left', 'right', 'pupil']:
+            self.window[eye + '_filter_params'].update(value=self.filter_params(eye))
 
     def update_output_channels(self):
-        left_x = self.state.output_dict[self.window['left_x_channel'].get()] if self.window['left_x_channel'].get() != 'None' else AnalogOutput()
-        left_y = self.state.output_dict[self.window['left_y_channel'].get()] if self.window['left_y_channel'].get() != 'None' else AnalogOutput()
-        left_pupil = self.state.output_dict[self.window['pupil_x_channel'].get()] if self.window['pupil_x_channel'].get() != 'None' else AnalogOutput()
-        right_x = self.state.output_dict[self.window['right_x_channel'].get()] if self.window['right_x_channel'].get() != 'None' else AnalogOutput()
-        right_y = self.state.output_dict[self.window['right_y_channel'].get()] if self.window['right_y_channel'].get() != 'None' else AnalogOutput()
-        right_pupil = self.state.output_dict[self.window['pupil_y_channel'].get()] if self.window['pupil_y_channel'].get() != 'None' else AnalogOutput()
-        self.state.left_output = AnalogOutputPair(left_x, left_y)
-        self.state.right_output = AnalogOutputPair(right_x, right_y)
-        self.state.pupil_output = AnalogOutputPair(left_pupil, right_pupil)
+        for role in self.state.channel_roles:
+            self.state.channel_map[role] = self.window[role + '_channel'].get()
+        self.state.apply_channel_map()
         
-    def update_graph(self):
-        self.graph.erase()
-        # draw axes
+    def update_calibration(self, event:str, values:dict):
+        """
+        Steps through the automatic calibration: Start, Collect once per target, Fit, Apply.
+        """
+        engine = self.state.cal_engine
+        need = min_targets(values['cal_model'])
+        if event == 'cal_model':
+            try:
+                n_targets = len(parse_targets(values['cal_targets']))
+            except Exception:
+                n_targets = 0
+            if n_targets < need:
+                # the smallest square grid with enough targets, e.g. 4 x 4 for poly3
+                side = math.ceil(math.sqrt(need))
+                self.window['cal_targets'].update(value='; '.join(f'{x:g},{y:g}' for x, y in grid_targets(n=side)))
+                self.cal_status = f"{values['cal_model']} needs {need} targets, switched to a {side} x {side} grid."
+                self.window['cal_status'].update(value=self.cal_status)
+            return
+        if event == 'cal_clear':
+            self.state.left_model = None
+            self.state.right_model = None
+        if event == 'cal_start':
+            try:
+                targets = parse_targets(values['cal_targets'])
+                samples = int(values['cal_samples'])
+            except Exception as e:
+                self.window['cal_status'].update(value=f'Invalid targets: {e}')
+                return
+            if len(targets) < need:
+                self.window['cal_status'].update(value=f"Invalid targets: {values['cal_model']} needs at least {need}, got {len(targets)}.")
+                return
+            self.cal_target = 0
+            self.cal_results = None
+            engine = self.state.cal_engine = CalibrationEngine(targets, samples)
+            self.window['cal_collect'].update(disabled=False)
+            self.window['cal_fit'].update(disabled=True)
+        elif engine is None:
+            return
+        elif event == 'cal_collect' and engine.active is None and self.cal_target < len(engine.targets):
+            engine.start_target(self.cal_target)
+        elif event == 'cal_fit':
+            self.window['cal_fit'].update(disabled=True)
+            engine.fit_async(lambda results: setattr(self, 'cal_results', results), values['cal_model'])
+        elif event in ['cal_apply_left', 'cal_apply_right'] and self.cal_results:
+            eye = event[len('cal_apply_'):]
+            if eye in self.cal_results:
+                result = self.cal_results[eye]
+                if 'parameters' in result:
+                    cal = getattr(self.state, eye + '_cal')
+                    cal.x_bias, cal.y_bias, cal.x_gain, cal.y_gain, cal.rotation = result['parameters']
+                    setattr(self.state, eye + '_model', None)
+                    self.update_sliders()
+                else:
+                    setattr(self.state, eye + '_model', result['model'])
+
+        # advance to the next target once the current one is full
+        if engine.active is None and self.cal_target < len(engine.targets) and engine.counts[self.cal_target] >= engine.samples_per_target:
+            self.cal_target += 1
+            if self.cal_target == len(engine.targets):
+                self.window['cal_collect'].update(disabled=True)
+                self.window['cal_fit'].update(disabled=False)
+
+        if self.cal_results is not None:
+            status = '\n'.join(f"{eye}: rms {result['rms']:.3f} V over {result['n_targets']} targets"
+                               for eye, result in self.cal_results.items()) or \
+                     f'Fit failed: {engine.model} needs {min_targets(engine.model)} tracked targets per eye.'
+            self.window['cal_apply_left'].update(disabled='left' not in self.cal_results)
+            self.window['cal_apply_right'].update(disabled='right' not in self.cal_results)
+        elif engine.active is not None:
+            status = f'Collecting target {engine.active + 1}/{len(engine.targets)}: {engine.counts[engine.active]}/{engine.samples_per_target}'
+        elif self.cal_target < len(engine.targets):
+            x, y = engine.targets[self.cal_target]
+            status = f'Fixate target {self.cal_target + 1}/{len(engine.targets)} at ({x:g}, {y:g}) V and press Collect'
+        else:
+            status = 'All targets collected. Press Fit.'
+        if status != self.cal_status:
+            self.cal_status = status
+            self.window['cal_status'].update(value=status)
+
+    def sync_channels(self):
+        for role in self.state.channel_roles:
+            self.window[role + '_channel'].update(value=self.state.channel_map[role])
+        self.window['left_valid_line'].update(value=self.state.channel_map['left_valid'])
+        self.window['right_valid_line'].update(value=self.state.channel_map['right_valid'])
+        self.window['event_map'].update(value=format_event_map(self.state.event_map))
+        self.window['routes'].update(value=format_routes(self.state.routes))
+
+    def update_valid_lines(self):
+        self.state.channel_map['left_valid'] = self.window['left_valid_line'].get()
+        self.state.channel_map['right_valid'] = self.window['right_valid_line'].get()
+        self.state.apply_channel_map()
+
+    def draw_axes(self):
         self.graph.draw_line((-5,0), (5,0))
         self.graph.draw_line((0,-5), (0,5))
         self.graph.draw_line((-5,-5), (-5,5))
@@ -447,7 +821,12 @@ class GUI:
         for xy in range(-5, 6):
             self.graph.draw_line((xy,-0.1), (xy,0.1))
             self.graph.draw_line((-0.1,xy), (0.1,xy))
-        
+
+    def update_graph(self) -> bool:
+        """
+        Redraws the output markers if any moved by at least a pixel. The axes are drawn once, by draw_axes.
+        Returns True if anything was redrawn.
+        """
         clip = lambda x: min(max(x, -5), 5)
         rx = clip(self.state.right_output.v_out.x)
         ry = clip(self.state.right_output.v_out.y)
@@ -455,26 +834,71 @@ class GUI:
         ly = clip(self.state.left_output.v_out.y)
         px = clip(self.state.pupil_output.v_out.x) 
         py = clip(self.state.pupil_output.v_out.y)
-        self.graph.draw_point((rx, ry), size=.15, color='firebrick1')
-        self.graph.draw_point((lx, ly), size=.15, color='DodgerBlue')
-        self.graph.draw_point((px, py), size=.15, color='DarkGoldenrod1')
-        
         int0 = self.state.last_eyes_data.extra.ints[0] & 1
         int1 = self.state.last_eyes_data.extra.ints[1] & 1
-        self.graph.draw_point((4.3, -4.7), size=.30, color='green' if int0 else 'red')
-        self.graph.draw_point((4.7, -4.7), size=.30, color='green' if int1 else 'red')
+        engine = self.state.cal_engine
+        target = engine.targets[self.cal_target] if engine is not None and self.cal_target < len(engine.targets) else None
+
+        # 400 px over 10.2 V
+        pixels = tuple(round(v * 40) for v in (rx, ry, lx, ly, px, py))
+        graph_state = (pixels, int0, int1, target)
+        if graph_state == self.graph_state:
+            return False
+        self.graph_state = graph_state
+
+        for figure in self.graph_figures:
+            self.graph.delete_figure(figure)
+        self.graph_figures = [
+            self.graph.draw_point((rx, ry), size=.15, color='firebrick1'),
+            self.graph.draw_point((lx, ly), size=.15, color='DodgerBlue'),
+            self.graph.draw_point((px, py), size=.15, color='DarkGoldenrod1'),
+            self.graph.draw_point((4.3, -4.7), size=.30, color='green' if int0 else 'red'),
+            self.graph.draw_point((4.7, -4.7), size=.30, color='green' if int1 else 'red'),
+        ]
+
+        # current calibration target
+        if target is not None:
+            x, y = target
+            self.graph_figures.append(self.graph.draw_line((x - .3, y), (x + .3, y), color='white', width=2))
+            self.graph_figures.append(self.graph.draw_line((x, y - .3), (x, y + .3), color='white', width=2))
+        return True
+
+    def update_status(self) -> bool:
+        """
+        Shows the tracking error (or 'Tracking'); touches the widget only when the text changes.
+        """
+        error = self.state.last_eyes_data.get_error(left_p4=self.state.left_method=='dpi', right_p4=self.state.right_method=='dpi')
+        if error == self.status:
+            return False
+        self.status = error
+        if error:
+            self.window['error'].update(value = error, text_color='red')
+        else:
+            self.window['error'].update(value = 'Tracking', text_color='lawn green')
+        return True
+
+    def visibility(self) -> str:
+        """
+        'hidden' when the window is minimized, 'background' when another application has the focus, else 'focused'.
+        """
+        try:
+            root = self.window.TKroot
+            if root.state() in ['iconic', 'withdrawn']:
+                return 'hidden'
+            return 'focused' if root.focus_get() is not None else 'background'
+        except Exception:
+            # focus_get raises while a combo's dropdown is open
+            return 'focused'
 
     def window_loop(self, verbose=False):
         
-        self.window = sg.Window('OpenIrisClient', self.layout)
-        first = True
+        self.window = sg.Window('OpenIrisClient', self.layout, finalize=True)
+        startup.mark('gui shown')
+        self.draw_axes()
         while self.state.is_running:
-            event, values = self.window.read(timeout=20) # 20ms = 50Hz
-            # if event != '__TIMEOUT__':
-            #     print(event, values)
-            if first:
-                self.update_output_channels()
-                first = False
+            # events are handled as they come; the timeout only schedules the next refresh
+            timeout = max(self.next_refresh - time.perf_counter(), 0)
+            event, values = self.window.read(timeout=int(timeout * 1000))
             if verbose and event != sg.TIMEOUT_EVENT:
                 print(event, values)
 
@@ -482,106 +906,139 @@ class GUI:
             if event == sg.WIN_CLOSED or event == 'Close' or event == 'Exit':
                 self.state.is_running = False
                 break
-            
-            # Update left method
-            if event in ['left_dpi', 'left_pcr']:
-                if values['left_dpi']:
-                    self.state.left_method = 'dpi'
-                elif values['left_pcr']:
-                    self.state.left_method = 'pcr'
-                else:
-                    self.state.left_method = 'dpi'
-            
-            # Update right method
-            if event in ['right_dpi', 'right_pcr']:
-                if values['right_dpi']:
-                    self.state.right_method = 'dpi'
-                elif values['right_pcr']:
-                    self.state.right_method = 'pcr'
-                else:
-                    self.state.right_method = 'dpi'
-
-            # Update states
-            self.rbx.update(self.window, event, values)
-            self.rby.update(self.window, event, values)
-            self.rgx.update(self.window, event, values)
-            self.rgy.update(self.window, event, values)
-            self.rr.update(self.window, event, values)
-            self.lbx.update(self.window, event, values)
-            self.lby.update(self.window, event, values)
-            self.lgx.update(self.window, event, values)
-            self.lgy.update(self.window, event, values)
-            self.lr.update(self.window, event, values)
-            self.plb.update(self.window, event, values)
-            self.prb.update(self.window, event, values)
-            self.plg.update(self.window, event, values)
-            self.prg.update(self.window, event, values)
-
-            # Update output channels
-            if event in ['left_x_channel', 'left_y_channel', 'right_x_channel', 'right_y_channel', 'pupil_x_channel', 'pupil_y_channel']:
-                self.update_output_channels()
-
-            # Zero left
-            if event == 'left_zero':
-                last_left = self.state.last_eyes_data.left.cr - \
-                    (self.state.last_eyes_data.left.pupil if self.state.left_method == 'pcr' else self.state.last_eyes_data.left.p4)
-                print(last_left)
-                self.state.left_cal.x_bias = -last_left.x
-                self.state.left_cal.y_bias = -last_left.y
-                print(self.state.left_cal.x_bias, self.state.left_cal.y_bias)
-                print(self.state.left_cal.transform(last_left))
-                self.lbx.sync_state(self.window)
-                self.lby.sync_state(self.window)
-            
-            
-            # Zero right
-            if event == 'right_zero':
-                last_right = self.state.last_eyes_data.right.cr - \
-                    (self.state.last_eyes_data.right.pupil if self.state.right_method == 'pcr' else self.state.last_eyes_data.right.p4)
-                self.state.right_cal.x_bias = -last_right.x
-                self.state.right_cal.y_bias = -last_right.y
-                self.rbx.sync_state(self.window)
-                self.rby.sync_state(self.window)
-
-            # Switch left and right
-            if event == 'switch':
-                temp = self.state.left_output
-                self.state.left_output = self.state.right_output
-                self.state.right_output = temp
-
-                temp = self.window['right_x_channel'].get()
-                self.window['right_x_channel'].update(value=self.window['left_x_channel'].get())
-                self.window['left_x_channel'].update(value=temp)
-
-                temp = self.window['right_y_channel'].get()
-                self.window['right_y_channel'].update(value=self.window['left_y_channel'].get())
-                self.window['left_y_channel'].update(value=temp)
-
-            # Save config
-            if event == 'Save Config':
-                # Open a dialog to select a new file
-                save_dir = sg.popup_get_folder('Select save directory', default_path=self.state.save_dir)
-                self.state.save(Path(save_dir))
-
-            # Load config
-            if event == 'Load Config':
-                # Open a folder picking dialog
-                load_dir = sg.popup_get_folder('Select directory to load', default_path=self.state.save_dir)
-                if load_dir:
-                    self.state.load(Path(load_dir))
-                    self.update_sliders()
 
-            # update graph and errors on timeout (refresh)
-            if event == sg.TIMEOUT_EVENT:
-                self.update_graph()
+            if event != sg.TIMEOUT_EVENT:
+                handler = self.handlers.get(event)
+                if handler is not None:
+                    handler(event, values)
+                # anything but a refresh may have changed the config; the save is debounced on the writer thread
+                self.state.request_save()
+                # and the display, so refresh at the full rate again
+                self.last_change = time.perf_counter()
+                self.next_refresh = min(self.next_refresh, self.last_change + self.refresh_interval)
 
-                # Get eye data
-                error = self.state.last_eyes_data.get_error(left_p4=self.state.left_method=='dpi', right_p4=self.state.right_method=='dpi')
-                if error:
-                    self.window['error'].update(value = error, text_color='red')
-                else:
-                    self.window['error'].update(value = 'Tracking', text_color='lawn green')
-                
+            if time.perf_counter() >= self.next_refresh:
+                self.refresh(values)
+
+    # seconds between refreshes: while the display changes, once it has been static for idle_after seconds (and
+    # while minimized, when nothing is drawn), and while another application has the focus
+    refresh_interval = 0.02
+    idle_interval = 0.25
+    background_interval = 1.0
+    idle_after = 2.0
+
+    def refresh(self, values:dict):
+        """
+        Updates the calibration status, graph and error line, and schedules the next refresh.
+        """
+        now = time.perf_counter()
+        if self.state.cal_engine is not None:
+            self.update_calibration(sg.TIMEOUT_EVENT, values)
+
+        visibility = self.visibility()
+        if visibility == 'hidden':
+            interval = self.idle_interval
+        else:
+            if self.update_graph() | self.update_status():
+                self.last_change = now
+            interval = self.refresh_interval if now - self.last_change < self.idle_after else self.idle_interval
+            if visibility == 'background':
+                interval = max(interval, self.background_interval)
+        engine = self.state.cal_engine
+        if engine is not None and engine.active is not None:
+            # collecting samples: move on to the next target promptly
+            interval = self.refresh_interval
+        self.next_refresh = now + interval
+
+    def update_method(self, event:str, values:dict):
+        eye = event.split('_')[0]
+        setattr(self.state, eye + '_method', 'pcr' if values[eye + '_pcr'] else 'dpi')
+
+    def update_filter(self, event:str, values:dict):
+        if values[event] != getattr(self.state, event).name:
+            setattr(self.state, event, make_filter(values[event]))
+            self.window[event + '_params'].update(value=self.filter_params(event[:-len('_filter')]))
+
+    def filter_params(self, eye:str) -> str:
+        return getattr(self.state, eye + '_filter').to_string().partition(',')[2]
+
+    def update_filter_params(self, event:str, values:dict):
+        eye = event[:-len('_filter_set')]
+        name = getattr(self.state, eye + '_filter').name
+        try:
+            setattr(self.state, eye + '_filter', filter_from_string(f"{name},{values[eye + '_filter_params']}"))
+        except Exception as e:
+            print(e)
+        self.window[eye + '_filter_params'].update(value=self.filter_params(eye))
+
+    def update_dropout(self, event:str, values:dict):
+        policy = getattr(self.state, event)
+        if values[event] != policy.mode:
+            setattr(self.state, event, DropoutPolicy(values[event], sentinel=policy.sentinel, max_extrapolate_ms=policy.max_extrapolate_ms))
+
+    def update_event_map(self, event:str, values:dict):
+        try:
+            self.state.event_map = parse_event_map(values['event_map'])
+            self.state.apply_channel_map()
+        except Exception as e:
+            print(e)
+        self.window['event_map'].update(value=format_event_map(self.state.event_map))
+
+    def update_routes(self, event:str, values:dict):
+        try:
+            self.state.routes = parse_routes(values['routes'])
+            self.state.apply_channel_map()
+        except Exception as e:
+            print(e)
+        self.window['routes'].update(value=format_routes(self.state.routes))
+
+    def zero_eye(self, event:str, values:dict):
+        """
+        Sets the eye's biases so its current position maps to 0 V.
+        """
+        eye = event.split('_')[0]
+        eye_data = getattr(self.state.last_eyes_data, eye)
+        last = eye_data.cr - (eye_data.pupil if getattr(self.state, eye + '_method') == 'pcr' else eye_data.p4)
+        cal = getattr(self.state, eye + '_cal')
+        cal.x_bias = -last.x
+        cal.y_bias = -last.y
+        self.fields[eye + '_x_bias'].sync_state(self.window)
+        self.fields[eye + '_y_bias'].sync_state(self.window)
+
+    def switch_eyes(self, event:str, values:dict):
+        for axis in ['x', 'y']:
+            temp = self.window[f'right_{axis}_channel'].get()
+            self.window[f'right_{axis}_channel'].update(value=self.window[f'left_{axis}_channel'].get())
+            self.window[f'left_{axis}_channel'].update(value=temp)
+        self.update_output_channels()
+
+    def save_config(self, event:str, values:dict):
+        # Open a dialog to select a new file
+        save_dir = sg.popup_get_folder('Select save directory', default_path=self.state.save_dir)
+        if save_dir:
+            self.state.save(Path(save_dir))
+
+    def load_config(self, event:str, values:dict):
+        # Open a folder picking dialog
+        load_dir = sg.popup_get_folder('Select directory to load', default_path=self.state.save_dir)
+        if load_dir:
+            self.state.load(Path(load_dir))
+            self.update_sliders()
+            self.sync_channels()
+
+    def undo_redo(self, event:str, values:dict):
+        if self.state.undo() if event == 'Undo' else self.state.redo():
+            self.update_sliders()
+            self.window['left_dpi' if self.state.left_method == 'dpi' else 'left_pcr'].update(value=True)
+            self.window['right_dpi' if self.state.right_method == 'dpi' else 'right_pcr'].update(value=True)
+
+    def show_counters(self, event:str, values:dict):
+        counters = self.pipeline.counters
+        sg.popup_scrolled(counters.report() if counters else 'Counters are disabled.', title='Pipeline Counters')
+
+    def capture_profile(self, event:str, values:dict):
+        profiler = self.pipeline.start_profile()
+        sg.popup_no_wait(f'Profiling the pipeline for {profiler.duration:g} s.\nWriting to {profiler.fname}')
 
     def __enter__(self):
         return self
@@ -602,45 +1059,373 @@ class GUI:
             gui.window_loop(verbose)
 
 class DataPipeline:
-    def __init__(self, state:GlobalState, server_address='localhost', port=9003):
+    def __init__(self, state:GlobalState, server_address='localhost', port=9003, rate:float=None):
+        """
+        rate is the tracker's nominal frame rate, if known; the clock drift is measured against it.
+        """
         self.state = state
         self.server_address = server_address
         self.port = port
 
+        # re-request after an adaptive timeout instead of waiting the full second for a lost reply
+        self.adaptive = True
+        self.client = None
+        # generator.SignalGenerator that replaces the tracker while set
+        self.generator = None
+        # frame number -> host capture time; output_age is set at every commit of a tracked frame
+        self.clock = ClockEstimator(1 / rate if rate else None)
+        self.output_age = None
+        self.writer = None
+        # digital event values of the previous frame, held back one frame in interpolate mode
+        self.delayed_events = None
+        self.counters = None
+        self.thread_id = None
+        # SharedMemoryPublisher / MulticastPublisher instances that receive every committed frame
+        self.publishers = []
+        # metrics.FrameMetrics while the metrics endpoint is served
+        self.metrics = None
+        # perf_counter() of the last fresh (not timed out) frame output, and whether the DeadlineWatchdog has
+        # put the outputs in their safe state since
+        self.last_output = None
+        self.stalled = False
+        # held while writing the analog outputs, so the watchdog's safe state and a frame never interleave
+        self.output_lock = threading.Lock()
+
+    def update_writer(self):
+        """
+        Starts, retunes or stops the OversampledWriter to follow state.output_mode.
+        """
+        if self.state.output_mode == 'direct':
+            if self.writer is not None:
+                self.writer.stop()
+                self.writer = None
+            return
+        if self.writer is None:
+            self.writer = OversampledWriter(self.state.analog_outputs, self.state.oversample_rate, self.state.output_mode)
+            self.writer.start()
+        self.writer.mode = self.state.output_mode
+
     def run(self, debug=False):
-        with OpenIrisClient(self.server_address, self.port) as client:
+        self.thread_id = threading.get_ident()
+        if self.generator is None:
+            self.client = OpenIrisClient(self.server_address, self.port, drain=True, adaptive=self.adaptive)
+        else:
+            self.client = self.generator
+        startup.mark('pipeline started')
+        with self.client as client:
+            first = True
             while self.state.is_running:
-                data = client.fetch_next_data(debug)
-                self.state.last_eyes_data = data
-
-                left_output = data.left.cr - (data.left.pupil if self.state.left_method == 'pcr' else data.left.p4)
-                left_output = self.state.left_cal.transform(left_output)
-                self.state.left_output.write(left_output)
-                
-                right_output = data.right.cr - (data.right.pupil if self.state.right_method == 'pcr' else data.right.p4)
-                right_output = self.state.right_cal.transform(right_output)
-                self.state.right_output.write(right_output)
-
-                pupil_output = Point(data.left.pupil_area, data.right.pupil_area)
-                pupil_output = self.state.pupil_cal.transform(pupil_output)
-                self.state.pupil_output.write(pupil_output)
-                if debug:
-                    print(data)
-                    print(f'{left_output}, {right_output}, {pupil_output}')
-
-                
+                self.update_writer()
+                if self.generator is not None:
+                    self.step_generated(client, debug)
+                elif self.counters is None:
+                    self.step(client, debug)
+                else:
+                    self.step_instrumented(client, debug)
+                if first:
+                    startup.mark('first frame output')
+                    first = False
+        if self.writer is not None:
+            self.writer.stop()
+        self.disable_counters()
+
+    def step(self, client:OpenIrisClient, debug=False):
+        raw = client.fetch_next_data_raw(debug)
+        data = self.decode(raw)
+        self.timestamp(data, client.t_receive)
+        t = time.perf_counter()
+        outputs = self.process(t, data, debug)
+        self.commit(t, outputs)
+
+    def step_generated(self, generator:'SignalGenerator', debug=False):
+        """
+        Outputs the generator's next frame as is, without calibration, dropout or filtering.
+        """
+        data, values = generator.next_frame()
+        t = data.t_receive = data.t_capture = generator.t_receive
+        self.state.last_eyes_data = data
+        outputs = Point(*values[0:2]), Point(*values[2:4]), Point(*values[4:6]), True, True
+        if debug:
+            print(f'{outputs[0]}, {outputs[1]}, {outputs[2]}')
+        self.commit(t, outputs)
+
+    def step_instrumented(self, client:OpenIrisClient, debug=False):
+        counters = self.counters
+        t0 = time.perf_counter()
+        raw = client.fetch_next_data_raw(debug)
+        t1 = time.perf_counter()
+        data = self.decode(raw)
+        self.timestamp(data, client.t_receive)
+        t2 = time.perf_counter()
+        outputs = self.process(t2, data, debug)
+        t3 = time.perf_counter()
+        self.commit(t2, outputs)
+        t4 = time.perf_counter()
+        counters.stage_time['receive'] += t1 - t0
+        counters.stage_time['decode'] += t2 - t1
+        counters.stage_time['process'] += t3 - t2
+        counters.stage_time['commit'] += t4 - t3
+        counters.frames += 1
+        if raw is None:
+            counters.timeouts += 1
+        else:
+            counters.bytes_received += len(raw)
+            if data.error:
+                counters.decode_failures += 1
+        if data.t_capture is not None:
+            counters.aged_frames += 1
+            counters.age_total += self.output_age
+            counters.age_max = max(counters.age_max, self.output_age)
+
+    def decode(self, raw:memoryview) -> EyesData:
+        """
+        Parses a reply from OpenIrisClient; None (a timeout) and bad JSON give an error frame.
+        """
+        try:
+            return EyesData(OpenIrisClient.parse(raw))
+        except Exception:
+            return EyesData()
+
+    def timestamp(self, data:EyesData, t_receive:float):
+        """
+        Attaches the receive time and, for tracked frames, the capture time estimated by self.clock.
+        """
+        data.t_receive = t_receive
+        if not data.error:
+            data.t_capture = self.clock.update(data.left.frame_number, t_receive)
+
+    def update_age(self):
+        """
+        Age of the outputs just written: now minus the estimated capture time of their frame.
+        """
+        t_capture = self.state.last_eyes_data.t_capture
+        if t_capture is not None:
+            self.output_age = time.perf_counter() - t_capture
+
+    def process(self, t:float, data:EyesData, debug=False) -> tuple:
+        """
+        Turns one frame into (left, right, pupil, left_valid, right_valid) outputs.
+        """
+        self.state.last_eyes_data = data
+
+        left_valid = data.left.is_valid(p4=self.state.left_method == 'dpi')
+        left_output = data.left.cr - (data.left.pupil if self.state.left_method == 'pcr' else data.left.p4)
+        left_raw = left_output._d
+        left_model = self.state.left_model
+        left_output = self.state.left_cal.transform(left_output) if left_model is None else Point(*left_model.transform(left_raw))
+        left_output = self.state.left_dropout.apply(t, left_valid, left_output._d)
+        left_output = Point(*self.state.left_filter.update(t, left_output))
+        
+        right_valid = data.right.is_valid(p4=self.state.right_method == 'dpi')
+        right_output = data.right.cr - (data.right.pupil if self.state.right_method == 'pcr' else data.right.p4)
+        right_raw = right_output._d
+        if self.state.cal_engine is not None:
+            self.state.cal_engine.push(left_raw if left_valid else np.nan, right_raw if right_valid else np.nan)
+        right_model = self.state.right_model
+        right_output = self.state.right_cal.transform(right_output) if right_model is None else Point(*right_model.transform(right_raw))
+        right_output = self.state.right_dropout.apply(t, right_valid, right_output._d)
+        right_output = Point(*self.state.right_filter.update(t, right_output))
+
+        pupil_valid = (data.left.pupil_area > 0, data.right.pupil_area > 0)
+        pupil_output = Point(data.left.pupil_area, data.right.pupil_area)
+        pupil_output = self.state.pupil_cal.transform(pupil_output)
+        pupil_output = self.state.pupil_dropout.apply(t, pupil_valid, pupil_output._d)
+        pupil_output = Point(*self.state.pupil_filter.update(t, pupil_output))
+
+        if debug:
+            print(data)
+            print(f'{left_output}, {right_output}, {pupil_output}')
+        return left_output, right_output, pupil_output, left_valid, right_valid
+
+    def commit(self, t:float, outputs:tuple):
+        left_output, right_output, pupil_output, left_valid, right_valid = outputs
+        fresh = not self.state.last_eyes_data.error
+        with self.output_lock:
+            if fresh:
+                self.last_output = t
+                self.stalled = False
+            # while stalled, the watchdog's safe state stays until a fresh frame arrives
+            if not self.stalled:
+                if self.writer is None:
+                    self.state.left_output.write(left_output)
+                    self.state.right_output.write(right_output)
+                    self.state.pupil_output.write(pupil_output)
+                else:
+                    self.writer.push(t, np.concatenate([left_output._d, right_output._d, pupil_output._d]))
+                # derived outputs are written at the frame rate in every output mode
+                if self.state.router.outputs:
+                    self.state.router.write(np.concatenate([left_output._d, right_output._d, pupil_output._d]))
+        events = (self.state.last_eyes_data.extra.ints, left_valid, right_valid)
+        if self.writer is not None and self.writer.mode == 'interpolate':
+            # the writer renders the analog outputs one frame late, so the lines follow a frame late too
+            events, self.delayed_events = self.delayed_events, events
+        if events is not None:
+            self.state.digital_events.write(*events)
+        self.update_age()
+        if self.publishers:
+            self.publish(t, outputs)
+        if self.metrics is not None:
+            self.metrics.record(self.state.last_eyes_data, left_valid, right_valid)
+
+    def enter_safe_state(self, voltage:float, last_output:float) -> bool:
+        """
+        Called by the DeadlineWatchdog thread: drives the six analog outputs and the routed ones to voltage until
+        the next fresh frame. Does nothing and returns False if a fresh frame was output after last_output.
+        """
+        with self.output_lock:
+            if self.last_output != last_output:
+                return False
+            self.stalled = True
+            values = np.full(6, voltage)
+            if self.writer is not None:
+                t = time.perf_counter()
+                self.writer.frames = ((t, values), (t, values))
+            else:
+                BatchWriter().write(self.state.analog_outputs(), values)
+            routed = self.state.router.outputs
+            BatchWriter().write(routed, np.full(len(routed), voltage))
+            return True
+
+    def publish(self, t:float, outputs:tuple):
+        """
+        Packs the committed frame into the publish.RECORD layout and hands it to every publisher.
+        """
+        left_output, right_output, pupil_output, left_valid, right_valid = outputs
+        t_capture = self.state.last_eyes_data.t_capture
+        record = RECORD.pack(self.state.last_eyes_data.left.frame_number, t, math.nan if t_capture is None else t_capture, time.time(),
+                             *left_output._d, *right_output._d, *pupil_output._d, left_valid | right_valid << 1)
+        for publisher in self.publishers:
+            publisher.publish(record)
+
+    def enable_counters(self):
+        if self.counters is None:
+            counters = PipelineCounters()
+            counters.attach(self.state.module_list)
+            self.counters = counters
+
+    def disable_counters(self):
+        if self.counters is not None:
+            self.counters.detach()
+            self.counters = None
+
+    def start_profile(self, duration:float=10.0, fname:Path=None) -> SamplingProfiler:
+        """
+        Samples the pipeline thread's stack for duration seconds and writes a collapsed-stack profile.
+        """
+        if fname is None:
+            fname = self.state.save_dir.parent / f'profile_{time.strftime("%Y%m%d_%H%M%S")}.txt'
+        profiler = SamplingProfiler(self.thread_id, fname, duration)
+        profiler.start()
+        return profiler
 
 if __name__ == "__main__":
+    startup.mark('imports')
     from threading import Thread
+    import argparse
+    import signal
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', action='store_true', help='run without the GUI')
+    parser.add_argument('--tracker', action='append', metavar='HOST:PORT',
+                        help='OpenIris server (default localhost:9003); repeat to drive several trackers, the GUI edits the first')
+    parser.add_argument('--tracker-rate', type=float, metavar='HZ', help='nominal tracker frame rate, to report the tracker clock drift against')
+    parser.add_argument('--publish-shm', metavar='NAME', help='publish processed frames to this shared memory ring (NAME-1, ... for further trackers)')
+    parser.add_argument('--publish-multicast', metavar='GROUP:PORT', help='publish processed frames to this UDP multicast group (PORT+1, ... for further trackers)')
+    parser.add_argument('--metrics', metavar='[HOST:]PORT', help='serve Prometheus metrics at http://HOST:PORT/metrics (HOST defaults to localhost)')
+    parser.add_argument('--deadline-ms', type=float, help='enable the output deadline watchdog with this deadline, 0 to disable it (saved to the config)')
+    parser.add_argument('--safe-voltage', help="voltage for the outputs after a missed deadline, or 'hold' (saved to the config)")
+    parser.add_argument('--stall-line', metavar='LINE', help="digital output raised after a missed deadline, or 'None' (saved to the config)")
+    parser.add_argument('--generate', metavar='SIGNALS', help="drive the outputs with test signals instead of the tracker, e.g. 'left_x=sine(2); right_x=saccade()' (see generator.py)")
+    parser.add_argument('--generate-rate', type=float, default=500, help='frame rate of the test signals (Hz)')
+    parser.add_argument('--startup-report', action='store_true', help='print how long each startup step took, once the first frame is out')
+    args = parser.parse_args()
 
     # with GUI() as gui:
     #     gui.window_loop(open_iris_ip='localhost', verbose=False)
-    gs = GlobalState()
-    gui_thread = Thread(target=GUI(gs).window_loop, args=(False,))
-    gui_thread.start()
-    dp_thread = Thread(target=DataPipeline(gs).run, args=(False,))
+    if args.tracker and len(args.tracker) > 1 and not args.generate:
+        from multi import MultiPipeline, make_states, parse_tracker
+        states = make_states(len(args.tracker))
+        pipelines = [DataPipeline(state, *parse_tracker(text), args.tracker_rate) for state, text in zip(states, args.tracker)]
+        runner = MultiPipeline(pipelines)
+    else:
+        from multi import parse_tracker
+        states = [GlobalState()]
+        pipelines = [DataPipeline(states[0], *parse_tracker(args.tracker[0] if args.tracker else 'localhost:9003'), args.tracker_rate)]
+        runner = pipelines[0]
+    startup.mark('state loaded')
+    gs = states[0]
+    dp = pipelines[0]
+    if args.generate:
+        from generator import SignalGenerator, parse_signals
+        try:
+            dp.generator = SignalGenerator(parse_signals(args.generate), args.generate_rate)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.deadline_ms is not None:
+        gs.deadline = args.deadline_ms / 1e3 or None
+    if args.safe_voltage is not None:
+        gs.safe_voltage = None if args.safe_voltage == 'hold' else float(args.safe_voltage)
+    if args.stall_line is not None:
+        gs.stall_line = args.stall_line
+    watchdog = None
+    if gs.deadline:
+        watchdog = DeadlineWatchdog(runner, gs.deadline, gs.safe_voltage, gs.digital_dict.get(gs.stall_line))
+    for i, pipeline in enumerate(pipelines):
+        if args.publish_shm:
+            try:
+                pipeline.publishers.append(SharedMemoryPublisher(args.publish_shm if i == 0 else f'{args.publish_shm}-{i}'))
+            except FileExistsError as e:
+                parser.error(str(e))
+        if args.publish_multicast:
+            group, port = parse_tracker(args.publish_multicast)
+            pipeline.publishers.append(MulticastPublisher(group, port + i))
+        if args.metrics:
+            pipeline.metrics = FrameMetrics()
+    metrics_server = None
+    if args.metrics:
+        metrics_server = MetricsServer(pipelines, *parse_tracker(args.metrics), watchdog=watchdog)
+        metrics_server.start()
+    # outputs first: the GUI is imported and built on its own thread once the pipeline is running
+    dp_thread = Thread(target=runner.run, args=(False,))
     dp_thread.start()
-    dp_thread.join()
-    gui_thread.join()
-    gs.save()
-    print('Done')
\ No newline at end of file
+    if watchdog is not None:
+        watchdog.start()
+    if args.headless:
+        # SIGUSR1 (Ctrl+Break on Windows) captures a profile of the pipeline thread
+        profile_signal = signal.SIGBREAK if hasattr(signal, 'SIGBREAK') else signal.SIGUSR1
+        signal.signal(profile_signal, lambda signum, frame: dp.start_profile())
+        report_marks = ['first frame output']
+    else:
+        gui_thread = Thread(target=lambda: GUI(gs, dp).window_loop(False))
+        gui_thread.start()
+        report_marks = ['first frame output', 'gui shown']
+    try:
+        while dp_thread.is_alive():
+            dp_thread.join(0.5 if not args.startup_report else 0.05)
+            if args.startup_report and startup.reached(*report_marks):
+                print(startup.report())
+                args.startup_report = False
+            if not gs.is_running:
+                for state in states:
+                    state.is_running = False
+    except KeyboardInterrupt:
+        for state in states:
+            state.is_running = False
+        dp_thread.join()
+    if not args.headless:
+        gui_thread.join()
+    if watchdog is not None:
+        watchdog.stop()
+        watchdog.join()
+        if watchdog.n_misses:
+            print(f'{watchdog.n_misses} output deadline misses, longest {watchdog.max_miss * 1e3:.1f} ms')
+    gs.device_monitor.stop()
+    for state in states:
+        state.config_writer.stop()
+        state.save()
+    for pipeline in pipelines:
+        for publisher in pipeline.publishers:
+            publisher.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+    print('Done')
@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from pathlib import Path
+
+class PipelineCounters:
+    """
+    Hot-path counters for DataPipeline. Only exists while instrumentation is enabled; the pipeline runs its
+    uninstrumented step when DataPipeline.counters is None.
+
+    DAC calls are counted by wrapping the write methods of the attached modules, which detach() restores.
+    """
+    stages = ['receive', 'decode', 'process', 'commit']
+    write_methods = ['write_channel', 'write_channels', 'write_multiple', 'write_digital', 'write_digital_multiple']
+
+    def __init__(self):
+        self.stage_time = dict.fromkeys(self.stages, 0.0)
+        self.frames = 0
+        self.bytes_received = 0
+        self.timeouts = 0
+        self.decode_failures = 0
+        self.dac_calls = 0
+        self.aged_frames = 0
+        self.age_total = 0.0
+        self.age_max = 0.0
+        self.start_time = time.perf_counter()
+        self._modules = []
+
+    def attach(self, modules:list):
+        for module in modules:
+            for name in self.write_methods:
+                setattr(module, name, self._counting(getattr(module, name)))
+            self._modules.append(module)
+
+    def detach(self):
+        for module in self._modules:
+            for name in self.write_methods:
+                module.__dict__.pop(name, None)
+        self._modules = []
+
+    def _counting(self, method):
+        def counted(*args):
+            self.dac_calls += 1
+            return method(*args)
+        return counted
+
+    def snapshot(self) -> dict:
+        elapsed = time.perf_counter() - self.start_time
+        frames = max(self.frames, 1)
+        result = {
+            'elapsed_s': elapsed,
+            'frames': self.frames,
+            'frame_rate_hz': self.frames / elapsed if elapsed > 0 else 0.0,
+            'bytes_received': self.bytes_received,
+            'timeouts': self.timeouts,
+            'decode_failures': self.decode_failures,
+            'dac_calls': self.dac_calls,
+            'output_age_ms_mean': self.age_total / max(self.aged_frames, 1) * 1e3,
+            'output_age_ms_max': self.age_max * 1e3,
+        }
+        for stage, total in self.stage_time.items():
+            result[f'{stage}_us_per_frame'] = total / frames * 1e6
+        return result
+
+    def report(self) -> str:
+        return '\n'.join(f'{key:>24}: {value:.3f}' if isinstance(value, float) else f'{key:>24}: {value}'
+                         for key, value in self.snapshot().items())
+
+class SamplingProfiler(threading.Thread):
+    """
+    Statistical profiler for one thread: samples its Python stack every interval seconds for duration seconds
+    and writes the counts in collapsed-stack format (one 'outer;...;inner count' line per stack), which
+    flamegraph.pl and speedscope read directly.
+    """
+    def __init__(self, thread_id:int, fname:Path, duration:float=10.0, interval:float=0.001):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.fname = fname
+        self.duration = duration
+        self.interval = interval
+        self.samples = Counter()
+
+    def run(self):
+        end = time.perf_counter() + self.duration
+        while time.perf_counter() < end:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        self.dump()
+
+    def dump(self):
+        with open(self.fname, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+        print(f'Wrote {sum(self.samples.values())} samples to {self.fname}')
+
+def process_age() -> float:
+    """
+    Seconds since this process was created, so startup marks include interpreter and bundle (PyInstaller)
+    loading. 0.0 where the creation time is not available.
+    """
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+            creation, exit, kernel, user, now = (wintypes.FILETIME() for _ in range(5))
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), ctypes.byref(creation), ctypes.byref(exit),
+                                     ctypes.byref(kernel), ctypes.byref(user))
+            kernel32.GetSystemTimeAsFileTime(ctypes.byref(now))
+            ticks = lambda t: t.dwHighDateTime << 32 | t.dwLowDateTime
+            return (ticks(now) - ticks(creation)) * 1e-7
+        with open('/proc/self/stat') as f:
+            # the fields after the command name; starttime is field 22, in clock ticks since boot
+            start = int(f.read().rpartition(')')[2].split()[19]) / os.sysconf('SC_CLK_TCK')
+        with open('/proc/uptime') as f:
+            return float(f.read().split()[0]) - start
+    except Exception:
+        return 0.0
+
+class StartupTimer:
+    """
+    Named startup milestones, in seconds since the process was created. Only the first mark of each name
+    counts, so marks can sit in code that runs more than once.
+    """
+    def __init__(self):
+        self.t0 = time.perf_counter() - process_age()
+        self.marks = {}
+
+    def mark(self, name:str):
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.t0
+
+    def reached(self, *names:str) -> bool:
+        return all(name in self.marks for name in names)
+
+    def report(self) -> str:
+        lines = []
+        previous = 0.0
+        for name, t in sorted(self.marks.items(), key=lambda item: item[1]):
+            lines.append(f'{name:>24}: {t * 1e3:8.1f} ms (+{(t - previous) * 1e3:.1f})')
+            previous = t
+        return '\n'.join(lines)
+
+# process-wide, see gui.py --startup-report
+startup = StartupTimer()
@@ -0,0 +1,206 @@
+"""
+Loopback verification: writes step patterns through an output module while an ADC channel wired back to the
+output samples continuously, then reports write-to-analog latency, settling time and jitter.
+
+    python loopback.py --simulate
+    python loopback.py --dac-channel 0 --adc-index 1 --adc-channel 0
+"""
+import argparse
+import time
+import threading
+import numpy as np
+
+from dac import AnalogModule, SimulatedModule, discover_ao_modules
+from scheduler import PrecisionTimer
+
+class SimulatedADC:
+    """
+    ADC wired to a SimulatedModule channel. Each write reaches the output after latency + gaussian jitter
+    seconds and then settles exponentially with time constant tau. Samples are generated on stop() from the
+    module's write log, on a clock of rate Hz starting at start().
+    """
+    def __init__(self, module:SimulatedModule, channel:int=0, rate:float=20000, latency:float=0.0008,
+                 jitter:float=0.0001, tau:float=0.00005, noise:float=0.0005, seed:int=0):
+        self.module = module
+        self.channel = channel
+        self.rate = rate
+        self.latency = latency
+        self.jitter = jitter
+        self.tau = tau
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.writes = []
+
+    def start(self):
+        self.t_start = time.perf_counter()
+        self.writes = [(self.t_start, float(self.module.v_out[self.channel]))]
+        write_channel = self.module.write_channel
+        def logged(channel, voltage):
+            write_channel(channel, voltage)
+            if channel == self.channel:
+                self.writes.append((time.perf_counter(), float(self.module.v_out[channel])))
+        self.module.write_channel = logged
+
+    def stop(self):
+        t_stop = time.perf_counter()
+        del self.module.write_channel
+        t = self.t_start + np.arange(int((t_stop - self.t_start) * self.rate)) / self.rate
+        write_t, write_v = np.array(self.writes).T
+        arrive = write_t + self.latency + self.rng.normal(0, self.jitter, len(write_t))
+        arrive[0] = write_t[0]
+        steps = np.diff(write_v, prepend=0.0)
+        elapsed = t[:, None] - arrive[None, :]
+        response = np.where(elapsed >= 0, 1 - np.exp(-np.maximum(elapsed, 0) / self.tau), 0.0)
+        v = response @ steps + self.rng.normal(0, self.noise, len(t))
+        return t, v
+
+class AIOADCSampler:
+    """
+    Continuously samples one channel of an AIOUSB ADC board through ADC_FullStartRing / ADC_ReadData.
+    Sample times are start time + n / rate, so they carry the board's start-up delay as a constant offset.
+    config is the ADC_SetConfig array; the default (USB-AI16 family layout) scans only adc_channel at range_code.
+    """
+    def __init__(self, index:int, channel:int=0, rate:float=20000, range_code:int=1, config:list=None, chunk:int=1000):
+        import AIOUSB as ao
+        self.ao = ao
+        self.index = index
+        self.channel = channel
+        self.rate = rate
+        self.chunk = chunk
+        if config is None:
+            config = [range_code] * 16 + [0x00, 0x05, (channel << 4) | channel, 0x00, 0x00]
+        self.config = config
+        self.chunks = []
+        self.status = 0
+        self._stop_event = threading.Event()
+
+    def start(self):
+        status, self.rate = self.ao.ADC_FullStartRing(self.index, self.config, None, self.rate, 1024 * 1024, 64)
+        if status != 0:
+            raise RuntimeError(f'ADC_FullStartRing failed with status {status}')
+        self.t_start = time.perf_counter()
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        while not self._stop_event.is_set():
+            status, data = self.ao.ADC_ReadData(self.index, self.config, self.chunk, -1000)
+            if status != 0:
+                # the stream does not recover from a failed read, so stop instead of polling it
+                self.status = status
+                print(f'ADC_ReadData failed with status {status}, sampling stopped.')
+                return
+            self.chunks.append(np.array(data[:self.chunk]))
+
+    def stop(self):
+        self._stop_event.set()
+        self.thread.join()
+        self.ao.ADC_BulkContinuousEnd(self.index)
+        v = np.concatenate(self.chunks) if self.chunks else np.zeros(0)
+        return self.t_start + np.arange(len(v)) / self.rate, v
+
+def run_steps(module:AnalogModule, channel:int, adc, levels=(-2.0, 2.0), n_steps:int=100, interval:float=0.02):
+    """
+    Writes n_steps steps cycling through levels, one every interval seconds, while adc samples.
+    Returns (write_times, write_values, adc_times, adc_values).
+    """
+    module.write_channel(channel, levels[-1])
+    time.sleep(interval)
+    adc.start()
+    time.sleep(interval)
+    write_t = np.zeros(n_steps)
+    write_v = np.resize(np.asarray(levels, dtype=float), n_steps)
+    with PrecisionTimer(1 / interval) as timer:
+        for i in range(n_steps):
+            timer.wait()
+            write_t[i] = time.perf_counter()
+            module.write_channel(channel, write_v[i])
+    time.sleep(interval)
+    adc_t, adc_v = adc.stop()
+    return write_t, write_v, adc_t, adc_v
+
+def analyze_steps(write_t:np.ndarray, write_v:np.ndarray, adc_t:np.ndarray, adc_v:np.ndarray, tolerance:float=0.01) -> dict:
+    """
+    Per step: latency to 50 % of the step, settling time into +/- tolerance (fraction of the step) of the
+    final value, and the whole-record lag from cross-correlating the commanded and measured signals. A step
+    pattern repeats, so its cross-correlation peaks again at every period; the lag is searched below the shortest
+    step interval and has to be shorter than that to be found.
+    """
+    n = len(write_t)
+    prev_v = np.concatenate([[np.median(adc_v[adc_t < write_t[0]])], write_v[:-1]])
+    step = write_v - prev_v
+    segment = np.searchsorted(write_t, adc_t, side='right') - 1
+    inside = (segment >= 0)
+    idx = np.flatnonzero(inside)
+    seg = segment[inside]
+    progress = (adc_v[inside] - prev_v[seg]) / np.where(step[seg] != 0, step[seg], 1)
+
+    # first sample per segment past 50 %
+    first = np.full(n, np.iinfo(np.int64).max)
+    crossed = progress >= 0.5
+    np.minimum.at(first, seg[crossed], idx[crossed])
+    has_cross = first < len(adc_t)
+    latency = np.full(n, np.nan)
+    latency[has_cross] = adc_t[first[has_cross]] - write_t[has_cross]
+
+    # last sample per segment outside the tolerance band
+    last = np.full(n, -1)
+    outside = np.abs(progress - 1) > tolerance
+    np.maximum.at(last, seg[outside], idx[outside])
+    settled = (last >= 0) & (last + 1 < len(adc_t))
+    settling = np.full(n, np.nan)
+    settling[settled] = adc_t[last[settled] + 1] - write_t[settled]
+
+    # whole-record lag from the cross-correlation of the derivatives
+    command = np.where(segment >= 0, write_v[np.maximum(segment, 0)], prev_v[0])
+    a = np.diff(command)
+    b = np.diff(adc_v)
+    size = 1 << int(np.ceil(np.log2(2 * len(a))))
+    xcorr = np.fft.irfft(np.fft.rfft(b, size) * np.conj(np.fft.rfft(a, size)), size)
+    dt = np.median(np.diff(adc_t))
+    max_lag = int(np.min(np.diff(write_t)) / dt) if n > 1 else len(a)
+    lag = int(np.argmax(xcorr[:max(min(max_lag, len(a)), 1)]))
+
+    valid = latency[np.isfinite(latency)]
+    return {
+        'steps': n,
+        'latency_ms_mean': float(np.mean(valid) * 1e3) if len(valid) else float('nan'),
+        'latency_ms_p50': float(np.percentile(valid, 50) * 1e3) if len(valid) else float('nan'),
+        'latency_ms_p99': float(np.percentile(valid, 99) * 1e3) if len(valid) else float('nan'),
+        'jitter_ms_std': float(np.std(valid) * 1e3) if len(valid) else float('nan'),
+        'settling_ms_mean': float(np.nanmean(settling) * 1e3) if np.isfinite(settling).any() else float('nan'),
+        'settling_ms_max': float(np.nanmax(settling) * 1e3) if np.isfinite(settling).any() else float('nan'),
+        'xcorr_lag_ms': float(lag * dt * 1e3),
+        'latency_s': latency,
+        'settling_s': settling,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--simulate', action='store_true', help='use a SimulatedModule and SimulatedADC')
+    parser.add_argument('--dac-channel', type=int, default=0)
+    parser.add_argument('--adc-index', type=int, default=0, help='AIOUSB device index of the ADC board')
+    parser.add_argument('--adc-channel', type=int, default=0)
+    parser.add_argument('--rate', type=float, default=20000, help='ADC sample rate (Hz)')
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--interval', type=float, default=0.02, help='seconds between steps')
+    args = parser.parse_args()
+
+    if args.simulate:
+        module = SimulatedModule()
+        adc = SimulatedADC(module, args.dac_channel, args.rate)
+    else:
+        modules = discover_ao_modules()
+        if not modules:
+            print('No output modules found.')
+            return
+        module = modules[0]
+        adc = AIOADCSampler(args.adc_index, args.adc_channel, args.rate)
+
+    results = analyze_steps(*run_steps(module, args.dac_channel, adc, n_steps=args.steps, interval=args.interval))
+    for key, value in results.items():
+        if not isinstance(value, np.ndarray):
+            print(f'{key:>18}: {value:.3f}' if isinstance(value, float) else f'{key:>18}: {value}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Prometheus metrics for monitoring many rigs: a small HTTP server on its own thread renders the pipelines'
+counters in the Prometheus text format.
+
+    python gui.py --metrics 9101                    # http://localhost:9101/metrics
+    python gui.py --metrics 0.0.0.0:9101            # reachable from a Prometheus server on the network
+
+The per-frame counters (FrameMetrics) are plain attributes written only by the pipeline thread. A scrape reads
+them without taking a lock, so it never blocks the pipeline; a scrape that races a frame may see that frame in
+some counters and not yet in others.
+"""
+import time
+import bisect
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+class Histogram:
+    """
+    Prometheus-style histogram: counts[i] holds the observations in (bounds[i-1], bounds[i]], the last one
+    everything above bounds[-1].
+    """
+    def __init__(self, bounds:list):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value:float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class FrameMetrics:
+    """
+    Per-pipeline frame counters, updated by DataPipeline.commit (or MultiPipeline.step) while
+    DataPipeline.metrics is set.
+    """
+    # seconds
+    latency_bounds = [0.0005, 0.001, 0.002, 0.003, 0.005, 0.0075, 0.01, 0.015, 0.02, 0.03, 0.05, 0.1, 0.25]
+
+    def __init__(self):
+        self.frames = 0
+        # timeouts and undecodable replies
+        self.error_frames = 0
+        # tracker frame numbers that were never output
+        self.skipped_frames = 0
+        # frames without tracking, left and right
+        self.lost = [0, 0]
+        self.last_frame = None
+        # capture (estimated, see clock.py) to output, and reply received to output
+        self.output_age = Histogram(self.latency_bounds)
+        self.latency = Histogram(self.latency_bounds)
+
+    def record(self, data, left_valid:bool, right_valid:bool):
+        now = time.perf_counter()
+        self.frames += 1
+        self.lost[0] += not left_valid
+        self.lost[1] += not right_valid
+        if data.error:
+            self.error_frames += 1
+            return
+        frame = data.left.frame_number
+        if self.last_frame is not None and frame > self.last_frame + 1:
+            self.skipped_frames += frame - self.last_frame - 1
+        self.last_frame = frame
+        if data.t_receive is not None:
+            self.latency.observe(now - data.t_receive)
+        if data.t_capture is not None:
+            self.output_age.observe(now - data.t_capture)
+
+class MetricsWriter:
+    """
+    Collects samples by metric name and renders them with one HELP / TYPE block per metric.
+    """
+    prefix = 'openiris_dac_'
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name:str, kind:str, help:str, value:float, **labels):
+        self.metrics.setdefault(name, (kind, help, []))[2].append(('', labels, value))
+
+    def add_histogram(self, name:str, help:str, histogram:Histogram, **labels):
+        samples = self.metrics.setdefault(name, ('histogram', help, []))[2]
+        counts = list(histogram.counts)
+        total = 0
+        for bound, count in zip(histogram.bounds + ['+Inf'], counts):
+            total += count
+            samples.append(('_bucket', {**labels, 'le': f'{bound:g}' if bound != '+Inf' else bound}, total))
+        samples.append(('_sum', labels, histogram.sum))
+        samples.append(('_count', labels, total))
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help, samples) in self.metrics.items():
+            lines.append(f'# HELP {self.prefix}{name} {help}')
+            lines.append(f'# TYPE {self.prefix}{name} {kind}')
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f'{self.prefix}{name}{suffix}{{{label_text}}} {value:g}' if label_text else
+                             f'{self.prefix}{name}{suffix} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+def render_metrics(pipelines:list, watchdog=None) -> str:
+    out = MetricsWriter()
+    for pipeline in pipelines:
+        tracker = f'{pipeline.server_address}:{pipeline.port}'
+        client = pipeline.client
+        if client is not None:
+            stats = client.stats()
+            out.add('tracker_frame_rate_hz', 'gauge', 'Rate of tracker replies (smoothed).',
+                    1 / client.interval if client.interval else 0.0, tracker=tracker)
+            for key, help in [('requests', 'Frame requests sent.'), ('replies', 'Replies received.'),
+                              ('retries', 'Requests re-sent after the adaptive timeout.'),
+                              ('timeouts', 'Frames given up on after the full timeout.'),
+                              ('stale', 'Queued replies discarded for a newer one.')]:
+                out.add(f'tracker_{key}_total', 'counter', help, stats[key], tracker=tracker)
+        # only with a nominal tracker rate (gui.py --tracker-rate)
+        if pipeline.clock.drift_ppm is not None:
+            out.add('clock_drift_ppm', 'gauge', 'Tracker clock rate against the host.', pipeline.clock.drift_ppm, tracker=tracker)
+
+        metrics = pipeline.metrics
+        if metrics is None:
+            continue
+        frames = metrics.frames
+        out.add('frames_total', 'counter', 'Frames output.', frames, tracker=tracker)
+        out.add('error_frames_total', 'counter', 'Frames output without data (timeouts, bad replies).', metrics.error_frames, tracker=tracker)
+        out.add('skipped_frames_total', 'counter', 'Tracker frames never output.', metrics.skipped_frames, tracker=tracker)
+        for i, eye in enumerate(['left', 'right']):
+            lost = metrics.lost[i]
+            out.add('tracking_lost_frames_total', 'counter', 'Frames output without tracking.', lost, tracker=tracker, eye=eye)
+            out.add('tracking_loss_ratio', 'gauge', 'Fraction of frames without tracking since start.',
+                    lost / frames if frames else 0.0, tracker=tracker, eye=eye)
+        out.add_histogram('output_age_seconds', 'Estimated capture to output.', metrics.output_age, tracker=tracker)
+        out.add_histogram('pipeline_latency_seconds', 'Reply received to output.', metrics.latency, tracker=tracker)
+
+    # the output modules and their monitor are shared by every pipeline
+    state = pipelines[0].state
+    for module in list(state.module_list):
+        key = state.device_key(module)
+        out.add('module_connected', 'gauge', '1 while the module accepts writes.', int(module.connected), module=key)
+        out.add('module_writes_total', 'counter', 'Output transactions sent to the module.', module.writes, module=key)
+        out.add('module_write_errors_total', 'counter', 'Failed output transactions.', module.faults, module=key)
+        out.add('module_last_status', 'gauge', 'Status of the last failed transaction (0 if none).', module.last_status, module=key)
+    out.add('module_reconnects_total', 'counter', 'Modules brought back after a fault.', len(state.device_monitor.recovery_times))
+
+    if watchdog is not None:
+        out.add('deadline_seconds', 'gauge', 'Output deadline of the watchdog.', watchdog.deadline)
+        out.add('deadline_misses_total', 'counter', 'Times the outputs went without a fresh frame past the deadline.', watchdog.n_misses)
+        out.add('deadline_miss_max_seconds', 'gauge', 'Longest time without a fresh frame.', watchdog.max_miss)
+        out.add('deadline_missed', 'gauge', '1 while the deadline is missed.', int(watchdog.missed is not None))
+    return out.render()
+
+class MetricsServer(threading.Thread):
+    """
+    Serves render_metrics(pipelines, watchdog) at /metrics. One request at a time, on this thread only.
+    """
+    def __init__(self, pipelines:list, address:str='localhost', port:int=9101, watchdog=None):
+        super().__init__(daemon=True)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ['/', '/metrics']:
+                    self.send_error(404)
+                    return
+                body = render_metrics(pipelines, watchdog).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer((address, port), Handler)
+        self.address = self.server.server_address
+
+    def run(self):
+        self.server.serve_forever(poll_interval=0.5)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
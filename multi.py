@@ -0,0 +1,162 @@
+"""
+Several OpenIris trackers feeding one output process. One thread waits on all tracker sockets with a selector,
+runs each tracker's DataPipeline.process as its frame arrives, and writes the outputs of all trackers with one
+write_multiple() per board.
+
+    python gui.py --tracker localhost:9003 --tracker localhost:9004
+"""
+import time
+import threading
+import selectors
+from pathlib import Path
+import numpy as np
+
+from open_iris_client import OpenIrisClient
+from scheduler import BatchWriter
+from instrumentation import startup
+
+class MultiPipeline:
+    """
+    Runs a list of DataPipelines (each with its own GlobalState, typically sharing the first state's modules)
+    from a single thread. Each tracker is re-asked after its client's adaptive rto (see OpenIrisClient), and
+    gets an empty frame once it has not answered for timeout seconds, as a timed out single pipeline does.
+
+    Outputs are always written directly; the per-state output_mode and counters apply to DataPipeline.run only.
+    """
+    def __init__(self, pipelines:list, timeout:float=1.0):
+        self.pipelines = pipelines
+        self.timeout = timeout
+        self.frames = [0] * len(pipelines)
+        self.clients = []
+        self.values = np.zeros(6 * len(pipelines))
+        self.thread_id = None
+        # see DataPipeline.last_output; any tracker's fresh frame counts
+        self.last_output = None
+        self.stalled = False
+        self.output_lock = threading.Lock()
+        self._batch = BatchWriter()
+
+    def is_running(self) -> bool:
+        return any(pipeline.state.is_running for pipeline in self.pipelines)
+
+    def analog_outputs(self) -> list:
+        return [output for pipeline in self.pipelines for output in pipeline.state.analog_outputs()]
+
+    def run(self, debug=False):
+        self.thread_id = threading.get_ident()
+        self.clients = [OpenIrisClient(pipeline.server_address, pipeline.port, self.timeout, drain=True, adaptive=True)
+                        for pipeline in self.pipelines]
+        clients = self.clients
+        selector = selectors.DefaultSelector()
+        # time of the last request, and of the first request still unanswered
+        sent = np.zeros(len(clients))
+        waiting = np.zeros(len(clients))
+        retried = [False] * len(clients)
+        rto = np.array([client.rto for client in clients])
+        for i, client in enumerate(clients):
+            self.pipelines[i].thread_id = self.thread_id
+            self.pipelines[i].client = client
+            client.__enter__()
+            selector.register(client, selectors.EVENT_READ, i)
+            client.requests += 1
+            client.request_next(debug)
+            sent[i] = waiting[i] = time.perf_counter()
+        startup.mark('pipeline started')
+        first = True
+        try:
+            while self.is_running():
+                ready = selector.select(max((sent + rto).min() - time.perf_counter(), 0))
+                t = time.perf_counter()
+                stepped = []
+                for key, _ in ready:
+                    i = key.data
+                    client = clients[i]
+                    raw = client.receive(debug)
+                    if raw is None:
+                        # an error reported at once (connection refused): re-ask after rto, not right away
+                        continue
+                    client.update_rto(t - sent[i], t, retried[i])
+                    rto[i] = client.rto
+                    client.requests += 1
+                    client.request_next(debug)
+                    sent[i] = waiting[i] = t
+                    retried[i] = False
+                    if self.step(i, t, raw, debug):
+                        stepped.append(i)
+                for i in np.flatnonzero(t - sent > rto):
+                    client = clients[i]
+                    client.backoff()
+                    rto[i] = client.rto
+                    client.requests += 1
+                    client.request_next(debug)
+                    sent[i] = t
+                    retried[i] = True
+                    if t - waiting[i] > self.timeout:
+                        # give up on this frame, like a timed out single pipeline
+                        client.timeouts += 1
+                        waiting[i] = t
+                        if self.step(i, t, None, debug):
+                            stepped.append(i)
+                if stepped:
+                    with self.output_lock:
+                        self._batch.write(self.analog_outputs(), self.values)
+                    for i in stepped:
+                        self.pipelines[i].update_age()
+                    if first:
+                        startup.mark('first frame output')
+                        first = False
+        finally:
+            selector.close()
+            for client in clients:
+                client.__exit__(None, None, None)
+
+    def enter_safe_state(self, voltage:float, last_output:float) -> bool:
+        """
+        Called by the DeadlineWatchdog thread, see DataPipeline.enter_safe_state.
+        """
+        with self.output_lock:
+            if self.last_output != last_output:
+                return False
+            self.stalled = True
+            self.values[:] = voltage
+            routed = [output for pipeline in self.pipelines for output in pipeline.state.router.outputs]
+            BatchWriter().write(self.analog_outputs() + routed, np.full(len(self.values) + len(routed), voltage))
+            return True
+
+    def step(self, i:int, t:float, raw:memoryview, debug=False) -> bool:
+        pipeline = self.pipelines[i]
+        if not pipeline.state.is_running:
+            return False
+        data = pipeline.decode(raw)
+        pipeline.timestamp(data, self.clients[i].t_receive)
+        outputs = pipeline.process(t, data, debug)
+        left_output, right_output, pupil_output, left_valid, right_valid = outputs
+        fresh = not data.error
+        with self.output_lock:
+            if fresh:
+                self.last_output = t
+                self.stalled = False
+            if not self.stalled:
+                self.values[6 * i:6 * i + 6] = (*left_output._d, *right_output._d, *pupil_output._d)
+                if pipeline.state.router.outputs:
+                    pipeline.state.router.write(self.values[6 * i:6 * i + 6])
+        pipeline.state.digital_events.write(pipeline.state.last_eyes_data.extra.ints, left_valid, right_valid)
+        if pipeline.publishers:
+            pipeline.publish(t, outputs)
+        if pipeline.metrics is not None:
+            pipeline.metrics.record(pipeline.state.last_eyes_data, left_valid, right_valid)
+        self.frames[i] += 1
+        return True
+
+def make_states(n:int, save_dir:Path = None) -> list:
+    """
+    One GlobalState per tracker. The first discovers the boards and saves to save_dir, the others share its
+    modules and save to save_dir-1, save_dir-2, ...
+    """
+    from gui import GlobalState
+    first = GlobalState(save_dir)
+    return [first] + [GlobalState(first.save_dir.with_name(f'{first.save_dir.name}-{i}'), shared=first) for i in range(1, n)]
+
+def parse_tracker(text:str) -> tuple:
+    host, _, port = text.rpartition(':')
+    return (host or 'localhost', int(port))
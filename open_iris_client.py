@@ -1,4 +1,5 @@
 import socket
+import select
 import time
 import json
 from dataclasses import dataclass
@@ -78,6 +79,12 @@ class EyeData:
             self.cr_error = 'No Data'
             self.p4_error = 'No Data'
 
+    def is_valid(self, p4:bool=True) -> bool:
+        """
+        True if the CR (and the P4, when p4 is True) were found in this frame.
+        """
+        return not self.cr_error and not (p4 and self.p4_error)
+
     def __repr__(self):
         return f"EyeData({self.frame_number}, Pupil={self.pupil}, Pupil Area={self.pupil_area}, CR={self.cr}, P4={self.p4})"
 
@@ -105,6 +112,9 @@ class EyesData:
     right: EyeData
     error: str
     def __init__(self, struct:dict = {}):
+        # host times (perf_counter) filled in by the pipeline: reply received, estimated capture
+        self.t_receive = None
+        self.t_capture = None
         if struct:
             self.left = EyeData(struct['Left'])
             self.right = EyeData(struct['Right'])
@@ -144,42 +154,191 @@ class EyesData:
         return error
 
 class OpenIrisClient:
-    def __init__(self, server_address='localhost', port=9003, timeout=1):
+    """
+    UDP client for the OpenIris "getdata" / "WAITFORDATA" protocol.
+
+    Error contract: the *_raw methods return the reply payload, or None on a timeout or socket error; the *_json
+    methods return a dict ({} on error or bad JSON); fetch_data / fetch_next_data return EyesData (an error frame
+    on failure).
+
+    Replies are received with recv_into into one preallocated buffer, and the payload is returned as a memoryview
+    of that buffer rather than a copy: it is only valid until the next receive, so parse it (or take bytes() of
+    it) first. With drain=True, replies already queued
+    behind the first one (late answers to earlier requests, a burst after a stall) are read without blocking
+    and only the newest is returned; the discarded ones are counted in stale.
+
+    With adaptive=True, fetch_next_data_raw waits only rto seconds for a reply before asking again, instead of
+    the full timeout. rto follows the reply times like TCP's retransmission timer (smoothed time and deviation,
+    RFC 6298), and is at least two estimated frame intervals, so a lost request or reply costs a couple of
+    frames. Samples from re-sent requests are ambiguous and skipped. timeout still bounds the total wait. A request
+    that fails at once (connection refused while the tracker restarts) is re-sent only after rto as well, so a
+    missing tracker is asked with the same backoff as a silent one.
+    """
+    max_datagram = 65536
+
+    def __init__(self, server_address='localhost', port=9003, timeout=1, drain:bool=False, adaptive:bool=False,
+                 min_timeout:float=0.002):
         self.server_address = (server_address, port)
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.settimeout(timeout) # 200 Hz
+        self.timeout = timeout
+        self.drain = drain
+        self.stale = 0
+        # perf_counter() when the last reply was read
+        self.t_receive = 0.0
+        self._buffer = bytearray(self.max_datagram)
+        self._view = memoryview(self._buffer)
 
-    def fetch_data_raw(self, debug=False):
+        self.adaptive = adaptive
+        self.min_timeout = min_timeout
+        self.rto = timeout
+        self.srtt = None
+        self.rttvar = 0.0
+        self.interval = None
+        self.last_reply = None
+        self.requests = 0
+        self.replies = 0
+        self.retries = 0
+        self.timeouts = 0
+
+    def receive(self, debug=False):
+        """
+        Reads one reply (the newest queued one when draining). Returns a memoryview of the receive buffer, or None
+        on error.
+        """
         try:
-            self.sock.sendto("getdata".encode("utf-8"), self.server_address)
-            data = self.sock.recvfrom(8192)  # Adjust the buffer size as needed
-            return json.loads(data[0].decode("utf-8"))
+            n = self.sock.recv_into(self._buffer)
+            if self.drain:
+                while select.select([self.sock], [], [], 0)[0]:
+                    n = self.sock.recv_into(self._buffer)
+                    self.stale += 1
+            self.t_receive = time.perf_counter()
+            return self._view[:n]
         except Exception as e:
             if debug:
                 print(f"Error receiving data: {e}")
-            return '{}'
+            return None
+
+    def request(self, message:bytes, debug=False) -> bool:
+        try:
+            self.sock.sendto(message, self.server_address)
+            return True
+        except Exception as e:
+            if debug:
+                print(f"Error sending request: {e}")
+            return False
+
+    def fetch_data_raw(self, debug=False):
+        if not self.request(b"getdata", debug):
+            return None
+        return self.receive(debug)
         
     def fetch_data_json(self, debug=False):
-        return json.loads(self.fetch_data_raw(debug))
+        return self.parse(self.fetch_data_raw(debug), debug)
     
     def fetch_data(self, debug=False):
         return EyesData(self.fetch_data_json(debug))
+
+    def request_next(self, debug=False):
+        """
+        Sends a WAITFORDATA request without waiting for the reply; pair with receive() when polling several
+        clients from one selector.
+        """
+        return self.request(b"WAITFORDATA", debug)
     
     def fetch_next_data_raw(self, debug=False):
+        if not self.adaptive:
+            self.requests += 1
+            if not self.request_next(debug):
+                return None
+            raw = self.receive(debug)
+            if raw is None:
+                self.timeouts += 1
+            else:
+                self.replies += 1
+            return raw
+
+        deadline = time.perf_counter() + self.timeout
+        retried = False
         try:
-            self.sock.sendto("WAITFORDATA".encode("utf-8"), self.server_address)
-            data = self.sock.recvfrom(8192)  # Adjust the buffer size as needed
-            return data[0].decode("utf-8")
-        except Exception as e:
-            if debug:
-                print(f"Error receiving data: {e}")
-            return '{}'
+            while True:
+                sent = time.perf_counter()
+                wait = max(min(self.rto, deadline - sent), 0.0001)
+                self.requests += 1
+                raw = None
+                if self.request_next(debug):
+                    self.sock.settimeout(wait)
+                    raw = self.receive(debug)
+                now = time.perf_counter()
+                if raw is not None:
+                    self.update_rto(now - sent, now, retried)
+                    return raw
+                if now < sent + wait:
+                    # the send or receive failed at once (e.g. connection refused while the tracker is down):
+                    # wait out the rto as if the request had gone unanswered instead of re-sending right away
+                    time.sleep(sent + wait - now)
+                    now = time.perf_counter()
+                if now >= deadline:
+                    self.rto = min(2 * self.rto, self.timeout)
+                    self.timeouts += 1
+                    return None
+                self.backoff()
+                retried = True
+        finally:
+            # the rto wait applies to this call only; fetch_data_raw and receive() keep the configured timeout
+            self.sock.settimeout(self.timeout)
+
+    def backoff(self):
+        """
+        Called when a request went unanswered for rto seconds and is about to be re-sent.
+        """
+        self.rto = min(2 * self.rto, self.timeout)
+        self.retries += 1
+
+    def update_rto(self, rtt:float, now:float, retried:bool):
+        """
+        Feeds one reply: rtt seconds after the (last) request, received at now.
+        """
+        self.replies += 1
+        if self.last_reply is not None and not retried:
+            dt = now - self.last_reply
+            self.interval = dt if self.interval is None else self.interval + (dt - self.interval) / 8
+        self.last_reply = now
+        if not retried:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar += (abs(self.srtt - rtt) - self.rttvar) / 4
+                self.srtt += (rtt - self.srtt) / 8
+        if self.srtt is not None:
+            rto = max(self.srtt + 4 * self.rttvar, 2 * (self.interval or 0))
+            self.rto = min(max(rto, self.min_timeout), self.timeout)
+
+    def stats(self) -> dict:
+        return {'requests': self.requests, 'replies': self.replies, 'retries': self.retries, 'timeouts': self.timeouts,
+                'stale': self.stale, 'rto_ms': self.rto * 1e3, 'interval_ms': (self.interval or 0) * 1e3}
 
     def fetch_next_data_json(self, debug=False):
-        return json.loads(self.fetch_next_data_raw(debug))
+        return self.parse(self.fetch_next_data_raw(debug), debug)
     
     def fetch_next_data(self, debug=False):
         return EyesData(self.fetch_next_data_json(debug))
+
+    @staticmethod
+    def parse(raw, debug=False) -> dict:
+        if raw is None:
+            return {}
+        try:
+            # decoding the view directly skips the bytes copy json.loads would need
+            return json.loads(str(raw, 'utf-8'))
+        except Exception as e:
+            if debug:
+                print(f"Error decoding data: {e}")
+            return {}
+
+    def fileno(self):
+        return self.sock.fileno()
     
     def __enter__(self):
         self.sock.connect(self.server_address)
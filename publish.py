@@ -0,0 +1,198 @@
+"""
+Rebroadcast of processed gaze for other programs on the same machine (stimulus software, loggers).
+
+Every frame the pipeline commits is packed into one fixed 88 byte little-endian record:
+
+    offset  type      field
+    0       uint64    frame_number    (OpenIris frame number of the left eye)
+    8       float64   t               (time.perf_counter() when the frame was processed)
+    16      float64   t_capture       (estimated capture time on the same clock, NaN until known; see clock.py)
+    24      float64   t_unix          (time.time() at publish)
+    32      6 float64 values          (left x, left y, right x, right y, pupil left, pupil right; volts, as sent to the DACs)
+    80      uint8     flags           (bit 0: left valid, bit 1: right valid)
+    81      7 bytes   padding
+
+SharedMemoryPublisher keeps the newest records in a ring guarded by a per-slot seqlock; GazeReader reads it.
+MulticastPublisher sends each record as one UDP datagram.
+
+    python publish.py --read openiris_gaze          # print frames from a running pipeline
+    python publish.py --bench                       # cost of one publish
+"""
+import os
+import sys
+import time
+import socket
+import struct
+
+RECORD = struct.Struct('<Qddd6dB7x')
+# magic, layout version, slot count, slot size, owner pid, write count
+HEADER = struct.Struct('<4sIIII4xQ')
+SEQ = struct.Struct('<Q')
+MAGIC = b'OIGZ'
+LAYOUT_VERSION = 1
+SLOT_SIZE = SEQ.size + RECORD.size
+
+def unpack_record(buffer, offset:int=0) -> dict:
+    frame_number, t, t_capture, t_unix, *values, flags = RECORD.unpack_from(buffer, offset)
+    return {'frame_number': frame_number, 't': t, 't_capture': t_capture, 't_unix': t_unix, 'values': values,
+            'left_valid': bool(flags & 1), 'right_valid': bool(flags & 2)}
+
+def owner_alive(pid:int) -> bool:
+    """
+    Whether the process that created a ring still runs. On Windows a block disappears with its last handle, so
+    one that still exists always has a live owner or reader.
+    """
+    if os.name != 'posix' or pid == os.getpid():
+        return True
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def untrack(shm, owner:int):
+    """
+    Attaching to a block registers it with this process's resource tracker, which would unlink it (under the
+    publisher and every other reader) when this process exits. Undoes that, unless this process is the owner.
+    """
+    if os.name == 'posix' and owner != os.getpid():
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+class SharedMemoryPublisher:
+    """
+    Ring of n_slots records in a named shared memory block. Record number i goes to slot i % n_slots, which
+    starts with a seqlock word: 2 * i + 1 while the record is being written, 2 * i + 2 once it is complete. The
+    header's write count is bumped after the slot is complete, so a reader takes record count - 1 as the newest.
+    """
+    def __init__(self, name:str='openiris_gaze', n_slots:int=1024):
+        # imported here: multiprocessing.shared_memory is most of this module's import time
+        from multiprocessing import shared_memory
+        self.name = name
+        self.n_slots = n_slots
+        size = HEADER.size + n_slots * SLOT_SIZE
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            old = shared_memory.SharedMemory(name)
+            owner = HEADER.unpack_from(old.buf, 0)[4] if old.size >= HEADER.size else 0
+            if owner_alive(owner):
+                untrack(old, owner)
+                old.close()
+                raise FileExistsError(f'Shared memory {name} is in use by process {owner}; pick another name.')
+            # left behind by a crashed run
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.buf = self.shm.buf
+        self.count = 0
+        HEADER.pack_into(self.buf, 0, MAGIC, LAYOUT_VERSION, n_slots, SLOT_SIZE, os.getpid(), 0)
+
+    def publish(self, record:bytes):
+        offset = HEADER.size + (self.count % self.n_slots) * SLOT_SIZE
+        SEQ.pack_into(self.buf, offset, 2 * self.count + 1)
+        self.buf[offset + SEQ.size:offset + SLOT_SIZE] = record
+        SEQ.pack_into(self.buf, offset, 2 * self.count + 2)
+        self.count += 1
+        SEQ.pack_into(self.buf, HEADER.size - SEQ.size, self.count)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+class MulticastPublisher:
+    """
+    Sends each record to a UDP multicast group. The socket is non-blocking; a full send buffer drops the frame.
+    interface is the address of the local interface to send on; the default keeps the traffic on loopback,
+    pass '0.0.0.0' to let the routing table pick one for consumers on other machines.
+    """
+    def __init__(self, group:str='239.255.42.99', port:int=9100, ttl:int=1, interface:str='127.0.0.1'):
+        self.address = (group, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        self.sock.setblocking(False)
+        self.dropped = 0
+
+    def publish(self, record:bytes):
+        try:
+            self.sock.sendto(record, self.address)
+        except OSError:
+            self.dropped += 1
+
+    def close(self):
+        self.sock.close()
+
+class GazeReader:
+    """
+    Reader side of SharedMemoryPublisher, for consumers written in Python.
+    """
+    def __init__(self, name:str='openiris_gaze'):
+        from multiprocessing import shared_memory
+        if sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name, track=False)
+            magic, version, self.n_slots, slot_size, _, _ = HEADER.unpack_from(self.shm.buf, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+            magic, version, self.n_slots, slot_size, owner, _ = HEADER.unpack_from(self.shm.buf, 0)
+            untrack(self.shm, owner)
+        if magic != MAGIC or version != LAYOUT_VERSION or slot_size != SLOT_SIZE:
+            raise ValueError(f'{name} is not a version {LAYOUT_VERSION} gaze ring')
+
+    @property
+    def count(self) -> int:
+        return SEQ.unpack_from(self.shm.buf, HEADER.size - SEQ.size)[0]
+
+    def read(self, index:int) -> dict:
+        """
+        Record number index (0-based since the publisher started), or None if it was overwritten or torn.
+        """
+        offset = HEADER.size + (index % self.n_slots) * SLOT_SIZE
+        if SEQ.unpack_from(self.shm.buf, offset)[0] != 2 * index + 2:
+            return None
+        record = bytes(self.shm.buf[offset + SEQ.size:offset + SLOT_SIZE])
+        if SEQ.unpack_from(self.shm.buf, offset)[0] != 2 * index + 2:
+            return None
+        return unpack_record(record)
+
+    def latest(self) -> dict:
+        count = self.count
+        return self.read(count - 1) if count else None
+
+    def close(self):
+        self.shm.close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--read', metavar='NAME', help='print frames from this shared memory ring')
+    parser.add_argument('--bench', action='store_true', help='time packing and publishing one record')
+    args = parser.parse_args()
+
+    if args.read:
+        reader = GazeReader(args.read)
+        index = reader.count
+        while True:
+            while index < reader.count:
+                frame = reader.read(index)
+                if frame is not None:
+                    print(frame)
+                index += 1
+            time.sleep(0.001)
+    if args.bench:
+        publishers = [SharedMemoryPublisher('openiris_gaze_bench'), MulticastPublisher()]
+        n = 100_000
+        start = time.perf_counter()
+        for i in range(n):
+            record = RECORD.pack(i, time.perf_counter(), time.perf_counter(), time.time(), 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 3)
+            for publisher in publishers:
+                publisher.publish(record)
+        print(f'{(time.perf_counter() - start) / n * 1e6:.2f} us per frame (shared memory + multicast)')
+        for publisher in publishers:
+            publisher.close()
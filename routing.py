@@ -0,0 +1,103 @@
+"""
+Derived output channels: extra analog outputs driven by linear combinations of the six calibrated signals,
+e.g. cyclopean gaze or vergence, without downstream math.
+
+Routes are written as 'output=expression; ...', e.g.
+
+    USB-AO16-16A-ch6=(left_x + right_x) / 2; USB-AO16-16A-ch7=left_x - right_x; USB-AO16-16A-ch8=pupil_left - pupil_right
+
+with outputs named as in GlobalState.output_dict and expressions linear in the sources below (constants add an
+offset in volts). The sources are the values written to the six mapped outputs, after calibration, dropout
+and filtering.
+"""
+import ast
+import numpy as np
+
+from scheduler import BatchWriter
+
+SOURCES = ['left_x', 'left_y', 'right_x', 'right_y', 'pupil_left', 'pupil_right']
+
+def parse_expression(text:str) -> np.ndarray:
+    """
+    '(left_x + right_x) / 2' -> coefficients over SOURCES followed by the constant term. Raises ValueError
+    unless the expression is linear in the sources.
+    """
+    def visit(node) -> np.ndarray:
+        if isinstance(node, ast.Expression):
+            return visit(node.body)
+        if isinstance(node, ast.Name):
+            if node.id not in SOURCES:
+                raise ValueError(f'Unknown source {node.id}, expected one of {", ".join(SOURCES)}')
+            row = np.zeros(len(SOURCES) + 1)
+            row[SOURCES.index(node.id)] = 1.0
+            return row
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            row = np.zeros(len(SOURCES) + 1)
+            row[-1] = node.value
+            return row
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            row = visit(node.operand)
+            return -row if isinstance(node.op, ast.USub) else row
+        if isinstance(node, ast.BinOp):
+            a, b = visit(node.left), visit(node.right)
+            if isinstance(node.op, ast.Add):
+                return a + b
+            if isinstance(node.op, ast.Sub):
+                return a - b
+            # a product or quotient stays linear only with a constant
+            constant = lambda row: not row[:-1].any()
+            if isinstance(node.op, ast.Mult) and (constant(a) or constant(b)):
+                return a * b[-1] if constant(b) else b * a[-1]
+            if isinstance(node.op, ast.Div) and constant(b) and b[-1] != 0:
+                return a / b[-1]
+        raise ValueError(f'Not a linear expression: {text}')
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError:
+        raise ValueError(f'Not a linear expression: {text}')
+    return visit(tree)
+
+def parse_routes(text:str) -> dict:
+    """
+    'AIO-ch6=(left_x + right_x) / 2; AIO-ch7=left_x - right_x' -> {'AIO-ch6': '(left_x + right_x) / 2', ...}.
+    Raises on a bad expression.
+    """
+    routes = {}
+    for item in text.split(';'):
+        if not item.strip():
+            continue
+        output, _, expression = item.partition('=')
+        parse_expression(expression)
+        routes[output.strip()] = expression.strip()
+    return routes
+
+def format_routes(routes:dict) -> str:
+    return '; '.join(f'{output}={expression}' for output, expression in routes.items())
+
+class Router:
+    """
+    Writes the derived outputs once per frame: one matrix multiply over the six source values, then one
+    write_multiple per board.
+
+    set_routes runs on the GUI thread while write runs on the pipeline thread, so the outputs, matrix and offset
+    are swapped as one tuple and write reads that tuple once.
+    """
+    def __init__(self):
+        self.plan = ([], np.zeros((0, len(SOURCES))), np.zeros(0))
+        self._batch = BatchWriter()
+
+    @property
+    def outputs(self) -> list:
+        return self.plan[0]
+
+    def set_routes(self, routes:list):
+        """
+        routes: [(AnalogOutput, expression), ...].
+        """
+        rows = np.array([parse_expression(expression) for _, expression in routes]).reshape(-1, len(SOURCES) + 1)
+        self.plan = ([output for output, _ in routes], rows[:, :-1].copy(), rows[:, -1].copy())
+
+    def write(self, values:np.ndarray):
+        outputs, matrix, offset = self.plan
+        if outputs:
+            self._batch.write(outputs, matrix @ values + offset)
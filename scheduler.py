@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+import numpy as np
+
+class PrecisionTimer:
+    """
+    Fixed-rate ticker. Sleeps until shortly before each tick and spins for the rest, so ticks are not
+    limited by the OS sleep granularity. On Windows the system timer resolution is raised to 1 ms while active.
+    The spin is capped at a quarter of the period and yields the GIL on every pass, so a fast ticker does not
+    starve the receive and pipeline threads.
+    """
+    def __init__(self, rate:float, spin:float=0.002):
+        self.period = 1.0 / rate
+        self.spin = min(spin, 0.25 * self.period)
+        self.next_tick = None
+        self.late_ticks = 0
+
+    def __enter__(self):
+        if os.name == 'nt':
+            import ctypes
+            ctypes.windll.winmm.timeBeginPeriod(1)
+        self.next_tick = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if os.name == 'nt':
+            import ctypes
+            ctypes.windll.winmm.timeEndPeriod(1)
+        return False
+
+    def wait(self) -> float:
+        """
+        Blocks until the next tick and returns its time. Ticks that are already late are not made up.
+        """
+        self.next_tick += self.period
+        now = time.perf_counter()
+        if now > self.next_tick:
+            self.late_ticks += 1
+            self.next_tick = now
+            return now
+        if self.next_tick - now > self.spin:
+            time.sleep(self.next_tick - now - self.spin)
+        while time.perf_counter() < self.next_tick:
+            time.sleep(0)
+        return self.next_tick
+
+class BatchWriter:
+    """
+    Writes values to a list of AnalogOutputs with one write_multiple() per module. The grouping is cached
+    and rebuilt when the list of outputs changes.
+    """
+    def __init__(self):
+        self._outputs = None
+        self._plan = []
+
+    def make_plan(self, outputs:list):
+        """
+        Groups outputs by module: [(module, channels, value indices), ...].
+        """
+        groups = {}
+        for i, output in enumerate(outputs):
+            channels, indices = groups.setdefault(id(output.module), (output.module, [], []))[1:]
+            channels.append(output.channel)
+            indices.append(i)
+        self._outputs = outputs
+        self._plan = [(module, np.array(channels), np.array(indices)) for module, channels, indices in groups.values()]
+
+    def write(self, outputs:list, values:np.ndarray):
+        if outputs != self._outputs:
+            self.make_plan(outputs)
+        for module, channels, indices in self._plan:
+            module.write_multiple(channels, values[indices])
+
+class OversampledWriter(threading.Thread):
+    """
+    Writes the outputs at a fixed rate above the tracker frame rate.
+
+    interpolate: renders the signal one frame interval late, interpolating linearly between the last two frames
+    predict:     extrapolates from the last two frames (up to max_predict seconds past the newest frame)
+
+    get_outputs returns the list of AnalogOutputs that the pushed values map to, in order. Writes are batched
+    into one write_multiple() per module and tick.
+    """
+    modes = ['interpolate', 'predict']
+
+    def __init__(self, get_outputs, rate:float=1000, mode:str='interpolate', max_predict:float=0.02):
+        super().__init__(daemon=True)
+        self.get_outputs = get_outputs
+        self.rate = rate
+        self.mode = mode
+        self.max_predict = max_predict
+        self.frames = None
+        self.ticks = 0
+        self._stop_event = threading.Event()
+        self._batch = BatchWriter()
+
+    def push(self, t:float, values:np.ndarray):
+        """
+        Adds a new frame. Called from the pipeline thread; the tuple swap is atomic.
+        """
+        if self.frames is None:
+            self.frames = ((t, values), (t, values))
+        else:
+            self.frames = (self.frames[1], (t, values))
+
+    def render(self, now:float) -> np.ndarray:
+        (t0, x0), (t1, x1) = self.frames
+        dt = t1 - t0
+        if dt <= 0:
+            return x1
+        if self.mode == 'predict':
+            return x1 + (x1 - x0) * (min(now - t1, self.max_predict) / dt)
+        w = min(max((now - dt - t0) / dt, 0.0), 1.0)
+        return x0 + (x1 - x0) * w
+
+    def run(self):
+        with PrecisionTimer(self.rate) as timer:
+            while not self._stop_event.is_set():
+                now = timer.wait()
+                if self.frames is None:
+                    continue
+                self._batch.write(self.get_outputs(), self.render(now))
+                self.ticks += 1
+
+    def stop(self):
+        self._stop_event.set()
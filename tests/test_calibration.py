@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from calibration import (CalibrationEngine, MODELS, min_targets, robust_centroids, fit_affine, affine_to_parameters,
+                         apply_parameters, grid_targets, parse_targets, model_from_dict)
+from gui import CalibrationParameters
+from open_iris_client import Point
+
+def transform(parameters:tuple, raw:np.ndarray) -> np.ndarray:
+    return np.array([CalibrationParameters(*parameters).transform(Point(*r))._d for r in raw])
+
+def test_robust_centroids_reject_outliers_and_missing_targets():
+    samples = np.full((2, 10, 2), np.nan)
+    samples[0] = [1.0, 2.0]
+    samples[0, 3] = [50.0, -50.0]
+    centroids = robust_centroids(samples)
+    assert np.allclose(centroids[0], [1.0, 2.0])
+    assert np.all(np.isnan(centroids[1]))
+
+def test_fit_affine_recovers_exact_map():
+    raw = np.random.default_rng(0).normal(size=(9, 2))
+    M = np.array([[2.0, 0.5], [-0.3, 1.5]])
+    t = np.array([0.1, -0.2])
+    M_fit, t_fit, rms = fit_affine(raw, raw @ M.T + t)
+    assert np.allclose(M_fit, M) and np.allclose(t_fit, t) and rms < 1e-9
+
+def test_affine_to_parameters_round_trip():
+    parameters = (-60.0, 180.0, -0.013, 0.02, 12.0)
+    raw = np.random.default_rng(1).uniform(-100, 100, size=(9, 2))
+    M, t, _ = fit_affine(raw, transform(parameters, raw))
+    assert np.allclose(affine_to_parameters(M, t), parameters, rtol=1e-4)
+
+def test_apply_parameters_matches_calibration_parameters():
+    parameters = (-60.0, 180.0, -0.013, 0.02, 12.0)
+    raw = np.random.default_rng(2).uniform(-100, 100, size=(5, 2))
+    assert np.allclose(apply_parameters(parameters, raw), transform(parameters, raw))
+
+def test_linear_rms_is_that_of_the_applied_parameters():
+    # a sheared map: the affine fit is exact, the bias/gain/rotation projection is not
+    targets = grid_targets(n=4)
+    raw = targets @ np.linalg.inv(np.array([[1.0, 0.3], [0.0, 1.0]]).T) / 0.013
+    engine = CalibrationEngine(targets, samples_per_target=5)
+    fill(engine, raw)
+    result = engine.fit('linear')['left']
+    applied = transform(result['parameters'], raw)
+    assert fit_affine(raw, targets)[2] < 1e-9
+    assert result['rms'] > 0.1
+    assert result['rms'] == pytest.approx(np.sqrt(np.mean(np.sum((applied - targets)**2, axis=1))))
+
+def test_min_targets():
+    assert min_targets('linear') == 3
+    assert min_targets('poly2') == 6
+    assert min_targets('poly3') == 10
+    assert len(grid_targets(n=4)) >= min_targets('poly3')
+
+def fill(engine:CalibrationEngine, raw:np.ndarray):
+    for i, r in enumerate(raw):
+        engine.start_target(i)
+        for _ in range(engine.samples_per_target):
+            engine.push(r, r)
+
+@pytest.mark.parametrize('model', [name for name in MODELS if name != 'linear'])
+def test_engine_fits_every_model(model):
+    targets = grid_targets(n=4)
+    raw = targets / 0.013
+    engine = CalibrationEngine(targets, samples_per_target=5)
+    fill(engine, raw)
+    results = engine.fit(model)
+    assert set(results) == {'left', 'right'}
+    assert results['left']['rms'] < 1e-3
+    assert np.allclose(model_from_dict(results['left']['model'].to_dict()).transform(raw[1]), targets[1], atol=1e-3)
+
+def test_engine_skips_models_with_too_few_targets():
+    targets = grid_targets()
+    engine = CalibrationEngine(targets, samples_per_target=5)
+    fill(engine, targets)
+    assert engine.fit('poly3') == {}
+    assert engine.model == 'poly3'
+
+def test_parse_targets():
+    assert parse_targets('1,2; -3,4;').tolist() == [[1.0, 2.0], [-3.0, 4.0]]
@@ -0,0 +1,71 @@
+import socket
+import time
+
+import pytest
+
+from open_iris_client import OpenIrisClient
+
+@pytest.fixture
+def closed_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def test_adaptive_requests_to_a_closed_port_are_paced(closed_port):
+    with OpenIrisClient('127.0.0.1', closed_port, timeout=0.1, adaptive=True) as client:
+        end = time.perf_counter() + 0.5
+        while time.perf_counter() < end:
+            assert client.fetch_next_data_raw() is None
+        # one request per timeout, not one per refused send
+        assert client.requests <= 10
+        assert client.timeouts == client.requests - client.retries
+        assert client.sock.gettimeout() == 0.1
+
+@pytest.fixture
+def server():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(1)
+    yield sock
+    sock.close()
+
+def test_drain_returns_the_newest_reply(server):
+    with OpenIrisClient(*server.getsockname(), timeout=1, drain=True) as client:
+        client.request_next()
+        request, addr = server.recvfrom(64)
+        assert request == b'WAITFORDATA'
+        for i in range(3):
+            server.sendto(b'{"n": %d}' % i, addr)
+        time.sleep(0.05)
+        raw = client.receive()
+        assert isinstance(raw, memoryview)
+        assert client.parse(raw) == {'n': 2}
+        assert client.stale == 2
+
+def test_without_drain_replies_are_read_in_order(server):
+    with OpenIrisClient(*server.getsockname(), timeout=1) as client:
+        client.request_next()
+        _, addr = server.recvfrom(64)
+        server.sendto(b'{"n": 0}', addr)
+        server.sendto(b'{"n": 1}', addr)
+        time.sleep(0.05)
+        assert [client.parse(client.receive()) for _ in range(2)] == [{'n': 0}, {'n': 1}]
+        assert client.stale == 0
+
+def test_error_contract(server):
+    with OpenIrisClient(*server.getsockname(), timeout=0.05) as client:
+        # nothing answers: None from the raw calls, {} from parse, an error frame from fetch_next_data
+        assert client.fetch_data_raw() is None
+        assert client.fetch_next_data_json() == {}
+        assert client.fetch_next_data().error == 'No Data'
+        assert client.timeouts == 2
+        assert client.parse(None) == {}
+        assert client.parse(b'{"Left": ') == {}
+        assert client.parse(b'\xff\xfe') == {}
+        # a reply that is not JSON
+        client.request_next()
+        _, addr = server.recvfrom(64)
+        server.sendto(b'not json', addr)
+        assert client.fetch_data_json() == {}
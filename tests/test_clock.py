@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from clock import ClockEstimator
+
+PERIOD = 1 / 500
+
+def receive_times(n:int, drift_ppm:float=50.0, offset:float=3.2, min_delay:float=0.0005, seed:int=0):
+    """
+    Frames captured on a tracker clock running drift_ppm fast, received after min_delay plus one-sided jitter
+    and a few long scheduling spikes.
+    """
+    rng = np.random.default_rng(seed)
+    frames = np.arange(1, n + 1)
+    capture = offset + frames * PERIOD * (1 + drift_ppm * 1e-6)
+    delay = min_delay + rng.exponential(0.001, n)
+    delay[rng.random(n) < 0.01] += 0.02
+    return frames, capture, capture + delay
+
+@pytest.mark.parametrize('drift_ppm', [-80.0, 0.0, 50.0])
+def test_recovers_offset_and_drift(drift_ppm):
+    clock = ClockEstimator(PERIOD)
+    frames, capture, receive = receive_times(5000, drift_ppm)
+    estimates = np.array([clock.update(n, r) for n, r in zip(frames, receive)], dtype=float)
+    assert clock.drift_ppm == pytest.approx(drift_ppm, abs=5)
+    # capture times come out min_delay late (it cannot be observed), without the jitter or the spikes
+    error = estimates[-1000:] - capture[-1000:]
+    assert np.all(np.abs(error - 0.0005) < 0.0002)
+    assert clock.capture_time(frames[-1]) == pytest.approx(capture[-1] + 0.0005, abs=0.0002)
+
+def test_known_latency_is_subtracted():
+    clock = ClockEstimator(PERIOD, latency=0.0005)
+    frames, capture, receive = receive_times(3000)
+    for n, r in zip(frames, receive):
+        clock.update(n, r)
+    assert clock.capture_time(frames[-1]) == pytest.approx(capture[-1], abs=0.0002)
+
+def test_period_is_learned_without_a_nominal_rate():
+    clock = ClockEstimator()
+    frames, capture, receive = receive_times(3000, drift_ppm=0.0)
+    assert [clock.update(n, r) for n, r in zip(frames[:49], receive[:49])] == [None] * 49
+    for n, r in zip(frames[49:], receive[49:]):
+        clock.update(n, r)
+    assert clock.period == pytest.approx(PERIOD, rel=1e-4)
+    assert clock.drift_ppm is None
+    assert clock.capture_time(frames[-1]) == pytest.approx(capture[-1] + 0.0005, abs=0.0003)
+
+def test_tracker_restart_resets_the_fit():
+    clock = ClockEstimator(PERIOD)
+    frames, _, receive = receive_times(1000)
+    for n, r in zip(frames, receive):
+        clock.update(n, r)
+    assert len(clock.minima) == 10
+    # a repeated frame is not a new point
+    assert clock.update(frames[-1], receive[-1] + 1.0) == clock.capture_time(frames[-1])
+    clock.update(1, receive[-1] + 10.0)
+    assert len(clock.minima) == 0 and clock.last_frame == 1
+    assert clock.capture_time(1) == pytest.approx(receive[-1] + 10.0)
@@ -0,0 +1,99 @@
+import json
+
+from config import CONFIG_VERSION, History, atomic_write, read_config, write_config, read_legacy_config
+
+def test_atomic_write_replaces_and_leaves_no_temporary(tmp_path):
+    fname = tmp_path / 'config.json'
+    atomic_write(fname, 'old')
+    atomic_write(fname, 'new')
+    assert fname.read_text() == 'new'
+    assert [path.name for path in tmp_path.iterdir()] == ['config.json']
+
+def test_write_and_read_config(tmp_path):
+    fname = tmp_path / 'config.json'
+    write_config(fname, {'version': CONFIG_VERSION, 'methods': {'left': 'pcr'}})
+    assert read_config(fname)['methods'] == {'left': 'pcr'}
+
+def test_read_legacy_config(tmp_path):
+    (tmp_path / 'left_cal.txt').write_text('-60,180,-0.013,0.013,5')
+    (tmp_path / 'methods.txt').write_text('dpi,pcr')
+    (tmp_path / 'right_cal.txt').write_text('not,numbers')
+    config = read_legacy_config(tmp_path)
+    assert config['version'] == 0
+    assert config['calibrations'] == {'left': {'x_bias': -60.0, 'y_bias': 180.0, 'x_gain': -0.013, 'y_gain': 0.013, 'rotation': 5.0}}
+    assert config['methods'] == {'left': 'dpi', 'right': 'pcr'}
+
+def test_legacy_config_loads_into_state(tmp_path):
+    from gui import GlobalState
+    (tmp_path / 'left_cal.txt').write_text('-60,180,-0.013,0.013,5')
+    (tmp_path / 'methods.txt').write_text('pcr,dpi')
+    state = GlobalState(tmp_path)
+    try:
+        assert state.left_cal.rotation == 5.0
+        assert (state.left_method, state.right_method) == ('pcr', 'dpi')
+        assert json.loads((tmp_path / 'config.json').read_text())['version'] == CONFIG_VERSION
+    finally:
+        state.device_monitor.stop()
+        state.config_writer.stop()
+
+def test_history_undo_redo(tmp_path):
+    history = History(tmp_path / 'history.jsonl')
+    for i in range(3):
+        history.record({'calibrations': i})
+    history.record({'calibrations': 2}) # unchanged, not recorded
+    assert len(history.entries) == 3
+    assert history.undo() == {'calibrations': 1}
+    assert history.undo() == {'calibrations': 0}
+    assert history.undo() is None
+    assert history.redo() == {'calibrations': 1}
+    history.record({'calibrations': 5}) # drops the redo branch
+    assert history.redo() is None
+    assert [entry['state'] for entry in history.entries] == [{'calibrations': 0}, {'calibrations': 1}, {'calibrations': 5}]
+
+def test_history_restores_cursor_after_restart(tmp_path):
+    fname = tmp_path / 'history.jsonl'
+    history = History(fname)
+    for i in range(4):
+        history.record({'calibrations': i})
+    history.undo()
+    history.undo()
+    reloaded = History(fname)
+    assert reloaded.entries[reloaded.cursor]['state'] == {'calibrations': 1}
+    assert reloaded.redo() == {'calibrations': 2}
+    assert json.loads(fname.read_text().splitlines()[-1])['state'] == {'calibrations': 2}
+
+def test_history_compaction_keeps_current_state_last(tmp_path):
+    fname = tmp_path / 'history.jsonl'
+    history = History(fname, max_entries=3)
+    for i in range(6):
+        history.record({'calibrations': i})
+    history.undo()
+    history.compact()
+    lines = fname.read_text().splitlines()
+    assert len(lines) == 4
+    assert json.loads(lines[-1])['state'] == {'calibrations': 4}
+    reloaded = History(fname, max_entries=3)
+    assert reloaded.entries[reloaded.cursor]['state'] == {'calibrations': 4}
+    assert reloaded.redo() == {'calibrations': 5}
+
+def test_history_compacts_when_log_grows(tmp_path):
+    fname = tmp_path / 'history.jsonl'
+    history = History(fname, max_entries=5)
+    for i in range(30):
+        history.record({'calibrations': i})
+    assert len(fname.read_text().splitlines()) <= 10
+    assert History(fname, max_entries=5).entries[-1]['state'] == {'calibrations': 29}
+
+def test_unreadable_config_is_set_aside(tmp_path):
+    from gui import GlobalState
+    (tmp_path / 'config.json').write_text('{"version": 1, "methods": {"left": "pc')
+    state = GlobalState(tmp_path)
+    try:
+        state.save()
+    finally:
+        state.device_monitor.stop()
+        state.config_writer.stop()
+    bad = list(tmp_path.glob('config.json.bad-*'))
+    assert len(bad) == 1
+    assert bad[0].read_text() == '{"version": 1, "methods": {"left": "pc'
+    assert json.loads((tmp_path / 'config.json').read_text())['version'] == CONFIG_VERSION
@@ -0,0 +1,111 @@
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from dac import SimulatedModule, DeviceMonitor, measure_recovery
+
+def wait_for(condition, timeout:float=2.0) -> bool:
+    end = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > end:
+            return False
+        time.sleep(0.001)
+    return True
+
+def test_simulated_module_faults_and_reconnects():
+    module = SimulatedModule()
+    module.write_channel(0, 1.0)
+    assert (module.writes, module.faults, module.connected) == (1, 0, True)
+    module.unplug()
+    module.write_channel(0, 2.0)
+    assert not module.connected and module.faults == 1 and module.last_status == -1
+    # skipped while disconnected, but v_out keeps the value to restore
+    module.write_channels(np.full(module.n_channels, 3.0))
+    assert module.writes == 1 and module.v_out[0] == 3.0
+    assert not module.reconnect()
+    module.replug()
+    assert module.reconnect() and module.connected
+    assert module.codes[0] == module.volts_to_code(0, 3.0)
+
+def test_monitor_reconnects_a_module_faulted_mid_run(tmp_path):
+    from gui import GlobalState, DataPipeline, AnalogOutput
+    from metrics import render_metrics
+    state = GlobalState(tmp_path)
+    state.device_monitor.stop()
+    state.device_monitor.join()
+    module = SimulatedModule()
+    state.module_list.append(module)
+    monitor = state.device_monitor = DeviceMonitor(state.module_list, interval=0.005)
+    monitor.start()
+    output = AnalogOutput(module, 0)
+    done = threading.Event()
+    def write():
+        v = 0.0
+        while not done.is_set():
+            v = (v + 0.01) % 1
+            output.write(v)
+            time.sleep(0.001)
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        time.sleep(0.05)
+        module.unplug()
+        assert wait_for(lambda: not module.connected)
+        time.sleep(0.05)
+        assert monitor.recovery_times == []
+        module.replug()
+        assert wait_for(lambda: module.connected)
+        writes = module.writes
+        assert wait_for(lambda: module.writes > writes)
+    finally:
+        done.set()
+        thread.join()
+        monitor.stop()
+        state.config_writer.stop()
+    assert len(monitor.recovery_times) == 1
+    # the outage itself plus at most a few monitor intervals
+    assert 0.05 < monitor.recovery_times[0] < 0.5
+    assert module.faults >= 1
+    assert np.isclose(module.codes[0], module.volts_to_code(0, module.v_out[0]), atol=1)
+    assert 'openiris_dac_module_reconnects_total 1\n' in render_metrics([DataPipeline(state)])
+
+def test_measure_recovery():
+    recovery = measure_recovery(n_faults=3, outage=0.02, interval=0.005)
+    assert len(recovery) == 3
+    # measured from the replug: one monitor interval plus scheduling
+    assert np.all((recovery >= 0) & (recovery < 0.1))
+
+@pytest.mark.parametrize('voltage, code', [(-5.0, 0), (0.0, 32768), (5.0, 65535), (-6.0, 0), (6.0, 65535)])
+def test_code_boundaries(voltage, code):
+    module = SimulatedModule(bitdepth=16)
+    assert module.volts_to_code(0, voltage) == code
+    assert module.volts_to_codes(np.full(module.n_channels, voltage))[0] == code
+    # writes clamp to the range first; vmax used to wrap around to code 0
+    module.write_channel(1, voltage)
+    assert module.codes[1] == code
+
+def test_codes_round_to_nearest():
+    module = SimulatedModule(bitdepth=12)
+    lsb = 10 / 2**12
+    for fraction, code in [(0.49, 2048), (0.51, 2049), (-0.49, 2048), (-0.51, 2047)]:
+        assert module.volts_to_code(0, fraction * lsb) == code
+        assert module.volts_to_codes(np.full(module.n_channels, fraction * lsb))[0] == code
+    assert module.volts_to_code(0, 5.0) == module.code_max == 4095
+
+def test_per_channel_calibration():
+    module = SimulatedModule(bitdepth=16)
+    module.set_channel_calibration(2, 1.01, -0.002)
+    voltages = np.linspace(-4, 4, module.n_channels)
+    codes = module.volts_to_codes(voltages).copy()
+    expected = np.floor((voltages * [1, 1, 1.01, 1, 1, 1, 1, 1] + [0, 0, -0.002, 0, 0, 0, 0, 0] + 5) * 6553.6 + 0.5)
+    assert np.array_equal(codes, expected)
+    assert [module.volts_to_code(i, v) for i, v in enumerate(voltages)] == codes.tolist()
+    assert module.calibration_table()[2] == [1.01, -0.002]
+    # the table survives a round trip, and a table of the wrong size is refused
+    other = SimulatedModule(bitdepth=16)
+    other.set_calibration_table(module.calibration_table())
+    assert np.array_equal(other.volts_to_codes(voltages), codes)
+    with pytest.raises(AssertionError):
+        other.set_calibration_table([[1.0, 0.0]])
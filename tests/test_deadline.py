@@ -0,0 +1,120 @@
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from dac import SimulatedModule
+from gui import GlobalState, DataPipeline, AnalogOutput, AnalogOutputPair, DigitalOutput
+from benchmark import MockOpenIrisServer
+from deadline import DeadlineWatchdog
+
+class StallingServer(MockOpenIrisServer):
+    """
+    Keeps producing frames but sends none while stalled, like a tracker that hangs.
+    """
+    stalled = False
+
+    def send(self, payload:bytes, addr):
+        if not self.stalled:
+            super().send(payload, addr)
+
+class Runner:
+    def __init__(self):
+        self.last_output = None
+        self.safe = []
+
+    def enter_safe_state(self, voltage:float, last_output:float) -> bool:
+        if last_output != self.last_output:
+            return False
+        self.safe.append(voltage)
+        return True
+
+def test_miss_is_recorded_once_frames_resume():
+    runner = Runner()
+    watchdog = DeadlineWatchdog(runner, deadline=0.1, safe_voltage=-5.0)
+    watchdog.check(1.0)
+    assert watchdog.missed is None # no frame yet
+    runner.last_output = 1.0
+    watchdog.check(1.05)
+    assert watchdog.missed is None and runner.safe == []
+    watchdog.check(1.2)
+    assert watchdog.missed == 1.0 and runner.safe == [-5.0]
+    watchdog.check(1.3)
+    assert runner.safe == [-5.0] # entered once per miss
+    runner.last_output = 1.35
+    watchdog.check(1.36)
+    assert watchdog.missed is None
+    assert watchdog.n_misses == 1 and watchdog.max_miss == pytest.approx(0.35)
+
+def test_fresh_frame_during_the_check_wins():
+    runner = Runner()
+    runner.last_output = 1.0
+    enter = runner.enter_safe_state
+    def fresh_frame_first(voltage, last_output):
+        runner.last_output = 1.15
+        return enter(voltage, last_output)
+    runner.enter_safe_state = fresh_frame_first
+    watchdog = DeadlineWatchdog(runner, deadline=0.1, safe_voltage=-5.0)
+    watchdog.check(1.2)
+    assert watchdog.missed is None and runner.safe == []
+
+def test_log_is_rate_limited(capsys):
+    runner = Runner()
+    watchdog = DeadlineWatchdog(runner, deadline=0.1, log_interval=10.0)
+    for start in [0.0, 1.0, 2.0]:
+        runner.last_output = start
+        watchdog.check(start + 0.2)
+        runner.last_output = start + 0.5
+        watchdog.check(start + 0.6)
+    # the first miss is printed at once, the next two wait for the interval
+    assert capsys.readouterr().out.count('Output deadline missed') == 1
+    watchdog.check(12.0)
+    out = capsys.readouterr().out
+    assert 'missed 2 times, longest 500.0 ms' in out
+    watchdog.check(30.0)
+    assert capsys.readouterr().out == ''
+
+def test_stalled_tracker(tmp_path, capsys):
+    server = StallingServer(rate=200)
+    server.start()
+    state = GlobalState(tmp_path)
+    module = SimulatedModule()
+    state.module_list.append(module)
+    outputs = [AnalogOutput(module, i) for i in range(6)]
+    state.left_output = AnalogOutputPair(outputs[0], outputs[1])
+    state.right_output = AnalogOutputPair(outputs[2], outputs[3])
+    state.pupil_output = AnalogOutputPair(outputs[4], outputs[5])
+    pipeline = DataPipeline(state, *server.address, rate=200)
+    watchdog = DeadlineWatchdog(pipeline, deadline=0.05, safe_voltage=-5.0, flag_line=DigitalOutput(module, 7))
+    thread = threading.Thread(target=pipeline.run)
+    try:
+        thread.start()
+        watchdog.start()
+        time.sleep(0.3)
+        assert watchdog.n_misses == 0 and watchdog.missed is None
+        assert not module.dio_out[7] and not np.all(module.v_out[:6] == -5.0)
+
+        server.stalled = True
+        time.sleep(0.3)
+        assert watchdog.missed is not None and pipeline.stalled
+        assert np.all(module.v_out[:6] == -5.0)
+        assert module.dio_out[7]
+
+        server.stalled = False
+        time.sleep(0.3)
+        assert watchdog.missed is None and not pipeline.stalled
+        assert not np.all(module.v_out[:6] == -5.0)
+        assert not module.dio_out[7]
+        assert watchdog.n_misses == 1
+        assert 0.05 < watchdog.max_miss < 0.5
+    finally:
+        watchdog.stop()
+        state.is_running = False
+        thread.join(5)
+        watchdog.join(5)
+        server.stop()
+        server.join()
+        state.device_monitor.stop()
+        state.config_writer.stop()
+    assert 'Output deadline missed 1 times' in capsys.readouterr().out
@@ -0,0 +1,42 @@
+import numpy as np
+
+from dropout import DropoutPolicy, policy_from_string
+
+def run(policy:DropoutPolicy, frames:list, rate:float=100) -> list:
+    return [float(policy.apply(i / rate, valid, np.array([x]))[0]) for i, (valid, x) in enumerate(frames)]
+
+def test_valid_frames_pass_through():
+    for mode in DropoutPolicy.modes:
+        assert run(DropoutPolicy(mode, 1), [(True, 1.0), (True, 2.0)]) == [1.0, 2.0]
+
+def test_hold_keeps_last_valid_value():
+    assert run(DropoutPolicy('hold', 1), [(True, 1.0), (True, 2.0), (False, 0.0), (False, 0.0)]) == [1.0, 2.0, 2.0, 2.0]
+
+def test_hold_without_history_gives_sentinel():
+    assert run(DropoutPolicy('hold', 1, sentinel=-5.0), [(False, 0.0)]) == [-5.0]
+
+def test_sentinel_and_none():
+    frames = [(True, 1.0), (False, 0.0)]
+    assert run(DropoutPolicy('sentinel', 1, sentinel=-4.0), frames) == [1.0, -4.0]
+    assert run(DropoutPolicy('none', 1), frames) == [1.0, 0.0]
+
+def test_extrapolate_continues_then_holds_endpoint():
+    # 1 V per frame at 100 Hz, extrapolated for up to 20 ms (two frames)
+    policy = DropoutPolicy('extrapolate', 1, max_extrapolate_ms=20)
+    out = run(policy, [(True, 1.0), (True, 2.0), (True, 3.0)] + [(False, 0.0)] * 4)
+    assert np.allclose(out, [1, 2, 3, 4, 5, 5, 5])
+
+def test_extrapolate_resumes_on_valid_frame():
+    policy = DropoutPolicy('extrapolate', 1, max_extrapolate_ms=20)
+    out = run(policy, [(True, 1.0), (True, 2.0), (False, 0.0), (True, 10.0)])
+    assert np.allclose(out, [1, 2, 3, 10])
+
+def test_per_component_validity():
+    policy = DropoutPolicy('hold', 2)
+    policy.apply(0.0, True, np.array([1.0, 2.0]))
+    assert np.allclose(policy.apply(0.01, np.array([True, False]), np.array([3.0, 0.0])), [3.0, 2.0])
+
+def test_string_round_trip():
+    policy = DropoutPolicy('extrapolate', 2, sentinel=-3.0, max_extrapolate_ms=30.0)
+    parsed = policy_from_string(policy.to_string())
+    assert (parsed.mode, parsed.sentinel, parsed.max_extrapolate_ms) == ('extrapolate', -3.0, 30.0)
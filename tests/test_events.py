@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from dac import SimulatedModule
+from gui import DigitalOutput
+from events import parse_source, parse_event_map, format_event_map, DigitalEvents
+
+def test_parse_source():
+    assert parse_source('left_valid') == ('valid', 0)
+    assert parse_source('right_valid') == ('valid', 1)
+    assert parse_source('int3.2') == ('int', 3, 2)
+    assert parse_source('int4') == ('int', 4, 0)
+    for text in ['int9.0', 'int0.32', 'both_valid', 'intx']:
+        with pytest.raises(ValueError):
+            parse_source(text)
+
+def test_event_map_round_trip():
+    event_map = parse_event_map('int0.0:A-dio2, int1.3:A-dio3 left_valid:B-dio0')
+    assert event_map == {'int0.0': 'A-dio2', 'int1.3': 'A-dio3', 'left_valid': 'B-dio0'}
+    assert parse_event_map(format_event_map(event_map)) == event_map
+
+def test_writes_only_changed_modules():
+    a, b = SimulatedModule('A'), SimulatedModule('B')
+    events = DigitalEvents()
+    events.set_lines([('int0.1', DigitalOutput(a, 2)), ('left_valid', DigitalOutput(a, 3)), ('right_valid', DigitalOutput(b, 0))])
+    ints = [0b10] + [0] * 8
+    events.write(ints, True, False)
+    assert list(a.dio_out[2:4]) == [True, True] and not b.dio_out[0]
+    assert (a.writes, b.writes) == (1, 1)
+    events.write(ints, True, True)
+    assert (a.writes, b.writes) == (1, 2) and b.dio_out[0]
+    # new lines are written on the next frame even if the values did not change
+    events.set_lines(events.lines)
+    events.write(ints, True, True)
+    assert (a.writes, b.writes) == (2, 3)
+
+def test_set_lines_while_writing():
+    modules = [SimulatedModule(str(i)) for i in range(4)]
+    configurations = [[('left_valid', DigitalOutput(module, 0)) for module in modules[:n]] for n in range(1, 5)]
+    events = DigitalEvents()
+    errors = []
+    done = threading.Event()
+    def write():
+        ints = [0] * 9
+        try:
+            while not done.is_set():
+                events.write(ints, True, False)
+                events.write(ints, False, False)
+        except Exception as e:
+            errors.append(e)
+    thread = threading.Thread(target=write)
+    thread.start()
+    for i in range(20000):
+        events.set_lines(configurations[i % 4 if i % 8 < 4 else 3 - i % 4])
+    done.set()
+    thread.join()
+    assert errors == []
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from filters import FILTERS, MedianFilter, make_filter, filter_from_string, measure_latency
+
+def test_none_filter_has_no_lag():
+    cost, lag = measure_latency(make_filter('none'))
+    assert lag == pytest.approx(0.0, abs=1e-9)
+
+def test_one_euro_lags_a_ramp_and_kalman_tracks_it():
+    _, one_euro_lag = measure_latency(make_filter('one_euro'))
+    _, kalman_lag = measure_latency(make_filter('kalman'))
+    assert one_euro_lag > 1.0
+    assert abs(kalman_lag) < 0.5
+
+def test_median_removes_single_frame_spike():
+    filt = make_filter('median', 1, window=3)
+    out = [float(filt.update(i / 500, np.array([x]))[0]) for i, x in enumerate([1.0, 1.0, 9.0, 1.0, 1.0])]
+    assert out == [1.0, 1.0, 1.0, 1.0, 1.0]
+
+@pytest.mark.parametrize('window', [1, 2, 5, 8])
+def test_median_matches_numpy(window):
+    filt = MedianFilter(2, window=window)
+    x = np.random.default_rng(window).normal(size=(100, 2))
+    for i in range(len(x)):
+        # the window starts filled with the first sample
+        history = np.vstack([np.tile(x[0], (max(window - 1 - i, 0), 1)), x[max(i - window + 1, 0):i + 1]])
+        assert np.allclose(filt.update(i / 500, x[i]), np.median(history, axis=0))
+
+@pytest.mark.parametrize('name', list(FILTERS))
+def test_reset_forgets_history(name):
+    filt = make_filter(name, 1)
+    for i in range(50):
+        filt.update(i / 500, np.array([5.0]))
+    filt.reset()
+    assert float(filt.update(1.0, np.array([-1.0]))[0]) == pytest.approx(-1.0)
+
+@pytest.mark.parametrize('name', list(FILTERS))
+def test_string_round_trip(name):
+    filt = make_filter(name)
+    parsed = filter_from_string(filt.to_string())
+    assert (parsed.name, parsed.params) == (filt.name, filt.params)
+
+def test_unknown_parameter_raises():
+    with pytest.raises(ValueError):
+        filter_from_string('kalman,foo=1')
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from routing import SOURCES
+from generator import sine, chirp, square, step, saccade, parse_signal, parse_signals, SignalGenerator
+
+t = np.arange(1000) / 100.0
+
+def test_sine_and_square():
+    assert np.allclose(sine(np.array([0, 0.125, 0.25]), 2, amplitude=2, offset=1), [1, 3, 1], atol=1e-12)
+    assert np.allclose(sine(np.array([0.0]), phase=90), [1])
+    values = square(t, 1, duty=0.25)
+    assert set(values) == {1.0, -1.0}
+    assert np.isclose((values > 0).mean(), 0.25)
+
+def test_chirp_repeats_every_period():
+    values = chirp(t, f0=1, f1=5, period=2)
+    assert np.allclose(values[:200], values[200:400])
+    assert np.abs(values).max() <= 1
+
+def test_step_levels():
+    values = step(t, low=-1, high=1, steps=5, period=5)
+    assert np.allclose(np.unique(values), [-1, -0.5, 0, 0.5, 1])
+    assert np.allclose(values[:100], -1) and np.allclose(values[400:500], 1)
+    assert np.allclose(step(t, steps=1), -1)
+
+def test_saccade_holds_targets_between_movements():
+    values = saccade(t, amplitude=2, interval=0.5, duration=0.1)
+    assert np.abs(values).max() <= 2
+    # fixations at 0.1 .. 0.5 s hold one target, and the loop over the buffer is seamless
+    assert np.ptp(values[10:50]) == 0
+    assert values[0] == values[-1]
+
+def test_parse_signal():
+    assert parse_signal(' sine(2, amplitude=1) ') == ('sine', (2,), {'amplitude': 1})
+    assert parse_signal('saccade()') == ('saccade', (), {})
+
+@pytest.mark.parametrize('text', [
+    'sine',                   # not a call
+    'sine(2',                 # syntax
+    'noise(1)',               # unknown waveform
+    'sine(1, 2, 3, 4, 5)',    # too many arguments
+    'sine(freqency=2)',       # unknown keyword
+    'sine(1, freq=2)',        # given twice
+    "sine('2')",
+    'sine(True)',
+    "sine(float('nan'))",
+    'sine(1e400)',
+    'chirp(period=0)',
+    'saccade(interval=-1)',
+    'step(steps=0)',
+])
+def test_parse_signal_errors(text):
+    with pytest.raises(ValueError):
+        parse_signal(text)
+
+def test_parse_signals():
+    assert parse_signals('left_x=sine(2);; right_x = saccade() ') == {'left_x': 'sine(2)', 'right_x': 'saccade()'}
+    with pytest.raises(ValueError):
+        parse_signals('left_z=sine(2)')
+    with pytest.raises(ValueError):
+        parse_signals('left_x=sine(2); right_x=')
+
+def test_generator_frames():
+    generator = SignalGenerator({'left_x': 'step(steps=2, period=0.02)', 'pupil_right': 'sine(offset=3, amplitude=0)'},
+                                rate=100, length=0.03, paced=False)
+    assert generator.buffer.shape == (3, len(SOURCES))
+    with generator:
+        frames = [generator.next_frame() for _ in range(4)]
+    data, values = frames[-1]
+    assert data.left.frame_number == data.right.frame_number == 4
+    assert [values[0] for _, values in frames] == [-1, 1, -1, -1]
+    assert all(values[5] == 3 and not values[1:5].any() for _, values in frames)
+    assert generator.stats()['requests'] == 4
+
+@pytest.mark.parametrize('rate, length', [(0, 1), (100, 0), (-1, 1), (float('nan'), 1)])
+def test_generator_rejects_bad_buffer(rate, length):
+    with pytest.raises(ValueError):
+        SignalGenerator({}, rate, length)
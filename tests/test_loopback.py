@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from dac import SimulatedModule
+from loopback import SimulatedADC, run_steps, analyze_steps
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_simulated_loopback_latency(seed):
+    module = SimulatedModule()
+    adc = SimulatedADC(module, 0, rate=20000, latency=0.003, jitter=0.0001, tau=0.00005, seed=seed)
+    results = analyze_steps(*run_steps(module, 0, adc, n_steps=30, interval=0.01))
+    assert results['steps'] == 30
+    # the write itself adds a few microseconds and the 50 % point tau * ln 2 more
+    assert results['latency_ms_p50'] == pytest.approx(3.0, abs=0.2)
+    assert results['xcorr_lag_ms'] == pytest.approx(3.0, abs=0.2)
+    assert results['settling_ms_max'] < 4.0
+
+def test_lag_does_not_alias_to_a_later_period():
+    # alternating steps every 10 ms, measured 1 ms late, with the noise of a real record
+    rate, interval, delay = 20000, 0.01, 0.001
+    write_t = 0.01 + interval * np.arange(60)
+    write_v = np.resize([-2.0, 2.0], 60)
+    adc_t = np.arange(int(0.7 * rate)) / rate
+    segment = np.searchsorted(write_t + delay, adc_t, side='right') - 1
+    adc_v = np.where(segment >= 0, write_v[np.maximum(segment, 0)], 2.0)
+    for seed in range(5):
+        noisy = adc_v + np.random.default_rng(seed).normal(0, 0.05, len(adc_v))
+        results = analyze_steps(write_t, write_v, adc_t, noisy)
+        assert results['xcorr_lag_ms'] == pytest.approx(1.0, abs=0.1)
+        assert results['latency_ms_p50'] == pytest.approx(1.0, abs=0.1)
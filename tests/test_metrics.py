@@ -0,0 +1,80 @@
+import urllib.request
+
+import pytest
+
+from dac import SimulatedModule
+from metrics import Histogram, FrameMetrics, MetricsWriter, MetricsServer, render_metrics
+from open_iris_client import EyesData
+
+def frame(number:int, t_receive:float=None) -> EyesData:
+    data = EyesData()
+    data.error = ''
+    data.left.frame_number = number
+    data.t_receive = t_receive
+    return data
+
+def samples(text:str) -> dict:
+    return {line.rpartition(' ')[0]: float(line.rpartition(' ')[2]) for line in text.splitlines() if not line.startswith('#')}
+
+def test_histogram_buckets():
+    histogram = Histogram([1.0, 2.0])
+    for value in [0.5, 1.0, 1.5, 3.0]:
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.sum == 6.0
+
+def test_frame_metrics_count_skips_errors_and_loss():
+    metrics = FrameMetrics()
+    metrics.record(frame(1), True, True)
+    metrics.record(frame(4), False, True)
+    metrics.record(EyesData(), False, False)
+    assert (metrics.frames, metrics.error_frames, metrics.skipped_frames) == (3, 1, 2)
+    assert metrics.lost == [2, 1]
+
+def test_writer_renders_cumulative_buckets():
+    histogram = Histogram([1.0, 2.0])
+    histogram.observe(1.5)
+    out = MetricsWriter()
+    out.add('frames_total', 'counter', 'Frames.', 3, tracker='a')
+    out.add_histogram('latency_seconds', 'Latency.', histogram, tracker='a')
+    text = out.render()
+    assert '# TYPE openiris_dac_frames_total counter' in text
+    values = samples(text)
+    assert values['openiris_dac_frames_total{tracker="a"}'] == 3
+    assert values['openiris_dac_latency_seconds_bucket{tracker="a",le="1"}'] == 0
+    assert values['openiris_dac_latency_seconds_bucket{tracker="a",le="+Inf"}'] == 1
+    assert values['openiris_dac_latency_seconds_count{tracker="a"}'] == 1
+
+@pytest.fixture
+def pipeline(tmp_path):
+    from gui import GlobalState, DataPipeline
+    state = GlobalState(tmp_path)
+    module = SimulatedModule('Sim')
+    state.module_list.append(module)
+    module.write_channel(0, 1.0)
+    pipeline = DataPipeline(state, 'localhost', 9003)
+    pipeline.metrics = FrameMetrics()
+    pipeline.metrics.record(frame(1), True, False)
+    yield pipeline
+    state.device_monitor.stop()
+    state.config_writer.stop()
+
+def test_render_metrics(pipeline):
+    values = samples(render_metrics([pipeline]))
+    tracker = 'tracker="localhost:9003"'
+    assert values[f'openiris_dac_frames_total{{{tracker}}}'] == 1
+    assert values[f'openiris_dac_tracking_lost_frames_total{{{tracker},eye="right"}}'] == 1
+    assert values['openiris_dac_module_writes_total{module="Sim_0"}'] == 1
+    # no client yet, and no nominal rate for the drift
+    assert not any('tracker_requests_total' in key or 'clock_drift' in key for key in values)
+
+def test_metrics_server(pipeline):
+    server = MetricsServer([pipeline], '127.0.0.1', 0)
+    server.start()
+    try:
+        url = 'http://%s:%d/metrics' % server.address
+        assert 'openiris_dac_frames_total' in urllib.request.urlopen(url).read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url.replace('/metrics', '/other'))
+    finally:
+        server.stop()
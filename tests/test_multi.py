@@ -0,0 +1,71 @@
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from dac import SimulatedModule
+from gui import DataPipeline, AnalogOutput, AnalogOutputPair
+from benchmark import MockOpenIrisServer
+from multi import MultiPipeline, make_states, parse_tracker
+
+class LoggingModule(SimulatedModule):
+    """
+    Records the channels of every write_multiple and counts single-channel writes.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+        self.single = 0
+
+    def write_channel(self, channel:int, voltage:float):
+        self.single += 1
+        super().write_channel(channel, voltage)
+
+    def write_multiple(self, channels:np.ndarray, voltages:np.ndarray):
+        self.batches.append(channels.copy())
+        super().write_multiple(channels, voltages)
+
+def test_parse_tracker():
+    assert parse_tracker('10.0.0.2:9004') == ('10.0.0.2', 9004)
+    assert parse_tracker(':9003') == ('localhost', 9003)
+
+def test_two_trackers_through_one_selector(tmp_path):
+    servers = [MockOpenIrisServer(rate=200, seed=i) for i in range(2)]
+    for server in servers:
+        server.start()
+    states = make_states(2, tmp_path / 'state')
+    module = LoggingModule(n_channels=12)
+    states[0].module_list.append(module)
+    for i, state in enumerate(states):
+        outputs = [AnalogOutput(module, 6 * i + j) for j in range(6)]
+        state.left_output = AnalogOutputPair(outputs[0], outputs[1])
+        state.right_output = AnalogOutputPair(outputs[2], outputs[3])
+        state.pupil_output = AnalogOutputPair(outputs[4], outputs[5])
+    runner = MultiPipeline([DataPipeline(state, *server.address) for state, server in zip(states, servers)])
+    thread = threading.Thread(target=runner.run)
+    try:
+        thread.start()
+        time.sleep(0.5)
+    finally:
+        for state in states:
+            state.is_running = False
+        thread.join(5)
+        for server in servers:
+            server.stop()
+            server.join()
+        states[0].device_monitor.stop()
+        for state in states:
+            state.config_writer.stop()
+    assert not thread.is_alive()
+    # both trackers ran on the one thread, and each got its own frames
+    assert all(frames > 60 for frames in runner.frames)
+    assert all(pipeline.thread_id == runner.thread_id for pipeline in runner.pipelines)
+    assert all(state.last_eyes_data.left.frame_number > 60 for state in states)
+    assert np.any(module.v_out[0:6] != 0) and np.any(module.v_out[6:12] != 0)
+    # every output write is one write_multiple covering both trackers' twelve channels
+    assert module.single == 0
+    assert len(module.batches) <= sum(runner.frames)
+    assert all(sorted(channels) == list(range(12)) for channels in module.batches)
+    # a reply that comes in as the run stops is counted but not output
+    assert all(0 <= client.replies - frames <= 1 for client, frames in zip(runner.clients, runner.frames))
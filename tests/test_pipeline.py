@@ -0,0 +1,84 @@
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from dac import SimulatedModule
+from gui import GlobalState, DataPipeline, AnalogOutput, AnalogOutputPair
+from multi import MultiPipeline
+from benchmark import MockOpenIrisServer, run_benchmark
+
+@pytest.fixture
+def server():
+    server = MockOpenIrisServer(rate=200)
+    server.start()
+    yield server
+    server.stop()
+    server.join()
+
+@pytest.fixture
+def state(tmp_path):
+    state = GlobalState(tmp_path)
+    yield state
+    state.device_monitor.stop()
+    state.config_writer.stop()
+
+def run(pipeline:DataPipeline, duration:float):
+    thread = threading.Thread(target=pipeline.run)
+    thread.start()
+    time.sleep(duration)
+    pipeline.state.is_running = False
+    thread.join(5)
+    assert not thread.is_alive()
+
+def test_pipeline_writes_tracker_frames(server, state):
+    module = SimulatedModule()
+    state.module_list.append(module)
+    outputs = [AnalogOutput(module, i) for i in range(6)]
+    state.left_output = AnalogOutputPair(outputs[0], outputs[1])
+    state.right_output = AnalogOutputPair(outputs[2], outputs[3])
+    state.pupil_output = AnalogOutputPair(outputs[4], outputs[5])
+    pipeline = DataPipeline(state, *server.address, rate=200)
+    run(pipeline, 0.5)
+
+    frame = state.last_eyes_data.left.frame_number
+    assert 0 < frame <= server.frame_number
+    assert module.writes > 50
+    # the mock pupil moves with sin/cos of time, so the gaze outputs leave 0 V
+    assert np.any(module.v_out[:4] != 0) and np.all(np.abs(module.v_out) <= module.v_max)
+    assert not module.v_out[6:].any()
+    assert pipeline.client.stats()['replies'] > 50
+    assert pipeline.clock.drift_ppm is not None
+
+@pytest.mark.parametrize('multi', [False, True])
+def test_pipeline_survives_a_stopped_tracker(state, multi):
+    server = MockOpenIrisServer(rate=200)
+    server.start()
+    pipeline = DataPipeline(state, *server.address)
+    runner = MultiPipeline([pipeline]) if multi else pipeline
+    thread = threading.Thread(target=runner.run)
+    thread.start()
+    time.sleep(0.2)
+    frame = state.last_eyes_data.left.frame_number
+    requests = pipeline.client.requests
+    server.stop()
+    server.join()
+    time.sleep(0.3)
+    state.is_running = False
+    thread.join(5)
+    assert not thread.is_alive()
+    assert frame > 0
+    # the refused requests are re-sent with the rto backoff, not as fast as the socket reports the error
+    assert pipeline.client.requests - requests < 30
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'output_mode': 'interpolate'},
+    {'loss': 0.1},
+    {'trackers': 2, 'routes': 2},
+])
+def test_benchmark_runs(options):
+    result = run_benchmark(rate=200, duration=0.5, **options)
+    assert result['unique_frames'] > 40 * result['trackers']
+    assert result['latency_ms_p50'] < 50
@@ -0,0 +1,109 @@
+import os
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from publish import RECORD, HEADER, SEQ, SharedMemoryPublisher, MulticastPublisher, GazeReader, unpack_record
+
+def record(i:int) -> bytes:
+    return RECORD.pack(i, 1.5, float('nan'), 2.5, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 1)
+
+@pytest.fixture
+def ring():
+    publisher = SharedMemoryPublisher(f'oi_test_{os.getpid()}', n_slots=4)
+    yield publisher
+    publisher.close()
+
+def test_record_layout():
+    assert RECORD.size == 88
+    frame = unpack_record(record(7))
+    assert frame['frame_number'] == 7
+    assert frame['values'] == [0.1, 0.2, 0.3, 0.4, 0.5, 0.6]
+    assert (frame['left_valid'], frame['right_valid']) == (True, False)
+
+def test_reader_sees_newest_and_detects_overwrite(ring):
+    reader = GazeReader(ring.name)
+    try:
+        assert reader.latest() is None
+        for i in range(6):
+            ring.publish(record(i))
+        assert reader.count == 6
+        assert reader.latest()['frame_number'] == 5
+        # four slots: records 0 and 1 were overwritten by 4 and 5
+        assert reader.read(1) is None
+        assert reader.read(2)['frame_number'] == 2
+    finally:
+        reader.close()
+
+def test_reader_rejects_slot_being_written(ring):
+    reader = GazeReader(ring.name)
+    try:
+        ring.publish(record(0))
+        # what a reader sees in the middle of publish(): odd sequence word
+        SEQ.pack_into(ring.buf, HEADER.size, 1)
+        assert reader.read(0) is None
+    finally:
+        reader.close()
+
+@pytest.mark.skipif(os.name != 'posix', reason='resource tracker unlinking is POSIX only')
+def test_reader_process_exit_keeps_the_ring(ring):
+    ring.publish(record(3))
+    code = f"from publish import GazeReader; r = GazeReader('{ring.name}'); print(r.latest()['frame_number']); r.close()"
+    root = Path(__file__).parent.parent
+    for _ in range(2):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=root)
+        assert result.stdout.strip() == '3', result.stderr
+
+def test_second_publisher_keeps_a_live_ring(ring):
+    ring.publish(record(1))
+    with pytest.raises(FileExistsError):
+        SharedMemoryPublisher(ring.name, n_slots=4)
+    reader = GazeReader(ring.name)
+    try:
+        assert reader.latest()['frame_number'] == 1
+    finally:
+        reader.close()
+
+@pytest.mark.skipif(os.name != 'posix', reason='a crashed owner only leaves the block behind on POSIX')
+def test_publisher_replaces_a_ring_left_by_a_crashed_run():
+    from multiprocessing import shared_memory
+    name = f'oi_test_crash_{os.getpid()}'
+    # a ring whose owner has exited
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    stale = shared_memory.SharedMemory(name, create=True, size=HEADER.size)
+    HEADER.pack_into(stale.buf, 0, b'OIGZ', 1, 0, 0, dead.pid, 0)
+    stale.close()
+    publisher = SharedMemoryPublisher(name, n_slots=4)
+    reader = None
+    try:
+        publisher.publish(record(2))
+        reader = GazeReader(name)
+        assert reader.latest()['frame_number'] == 2
+    finally:
+        if reader is not None:
+            reader.close()
+        publisher.close()
+
+def test_multicast_publishes_records():
+    group = '239.255.42.98'
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    receiver.bind(('', 0))
+    receiver.settimeout(1.0)
+    try:
+        receiver.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(group) + socket.inet_aton('127.0.0.1'))
+    except OSError as e:
+        receiver.close()
+        pytest.skip(f'no multicast on loopback: {e}')
+    publisher = MulticastPublisher(group=group, port=receiver.getsockname()[1])
+    try:
+        publisher.publish(record(9))
+        assert unpack_record(receiver.recv(1024))['frame_number'] == 9
+        assert publisher.dropped == 0
+    finally:
+        publisher.close()
+        receiver.close()
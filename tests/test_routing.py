@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from dac import SimulatedModule
+from gui import AnalogOutput
+from routing import SOURCES, parse_expression, parse_routes, format_routes, Router
+
+@pytest.mark.parametrize('text, expected', [
+    ('(left_x + right_x) / 2', [0.5, 0, 0.5, 0, 0, 0, 0]),
+    ('left_x - right_x', [1, 0, -1, 0, 0, 0, 0]),
+    ('-2 * pupil_left + 1', [0, 0, 0, 0, -2, 0, 1]),
+    ('right_y * 3 - 0.5', [0, 0, 0, 3, 0, 0, -0.5]),
+    ('+left_y', [0, 1, 0, 0, 0, 0, 0]),
+])
+def test_parse_expression(text, expected):
+    assert np.allclose(parse_expression(text), expected)
+
+@pytest.mark.parametrize('text', [
+    'left_x * right_x',       # product of sources
+    '1 / left_x',             # source in the denominator
+    'left_x / 0',
+    'left_z',                 # unknown source
+    'abs(left_x)',            # calls
+    'left_x ** 2',
+    'left_x +',               # syntax
+    "'left_x'",
+    '',
+])
+def test_parse_expression_errors(text):
+    with pytest.raises(ValueError):
+        parse_expression(text)
+
+def test_parse_routes_round_trip():
+    routes = parse_routes(' A-ch6 = (left_x + right_x) / 2 ;; A-ch7=left_x - right_x; ')
+    assert routes == {'A-ch6': '(left_x + right_x) / 2', 'A-ch7': 'left_x - right_x'}
+    assert parse_routes(format_routes(routes)) == routes
+    with pytest.raises(ValueError):
+        parse_routes('A-ch6=left_x * left_y')
+
+def test_router_writes_derived_outputs():
+    module = SimulatedModule()
+    router = Router()
+    router.write(np.arange(len(SOURCES), dtype=float))
+    assert module.writes == 0
+    router.set_routes([(AnalogOutput(module, 6), '(left_x + right_x) / 2'), (AnalogOutput(module, 7), 'left_x - right_x + 1')])
+    router.write(np.array([1.0, 0, 3.0, 0, 0, 0]))
+    assert np.allclose(module.v_out[6:], [2.0, -1.0])
+    assert module.writes == 1
+    router.set_routes([])
+    assert router.outputs == []
@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+import pytest
+
+from dac import SimulatedModule
+from gui import AnalogOutput
+from scheduler import PrecisionTimer, BatchWriter, OversampledWriter
+
+def ramp_writer(mode:str, max_predict:float=0.02) -> OversampledWriter:
+    # a 100 V/s ramp sampled by two frames 10 ms apart
+    writer = OversampledWriter(lambda: [], mode=mode, max_predict=max_predict)
+    writer.push(0.0, np.array([0.0]))
+    writer.push(0.01, np.array([1.0]))
+    return writer
+
+@pytest.mark.parametrize('now, expected', [(0.01, 0.0), (0.015, 0.5), (0.02, 1.0), (0.05, 1.0)])
+def test_interpolate_renders_one_frame_late(now, expected):
+    assert ramp_writer('interpolate').render(now)[0] == pytest.approx(expected)
+
+@pytest.mark.parametrize('now, expected', [(0.01, 1.0), (0.015, 1.5), (0.02, 2.0), (0.1, 3.0)])
+def test_predict_follows_the_ramp_up_to_max_predict(now, expected):
+    assert ramp_writer('predict').render(now)[0] == pytest.approx(expected)
+
+def test_single_frame_is_held():
+    writer = OversampledWriter(lambda: [])
+    writer.push(1.0, np.array([2.0]))
+    assert writer.render(1.5)[0] == 2.0
+
+def test_batch_writer_groups_by_module():
+    a, b = SimulatedModule('A'), SimulatedModule('B')
+    outputs = [AnalogOutput(a, 3), AnalogOutput(b, 0), AnalogOutput(a, 1)]
+    batch = BatchWriter()
+    batch.write(outputs, np.array([1.0, 2.0, 3.0]))
+    assert (a.writes, b.writes) == (1, 1)
+    assert (a.v_out[3], a.v_out[1], b.v_out[0]) == (1.0, 3.0, 2.0)
+    batch.write(outputs[:2], np.array([4.0, 5.0]))
+    assert (a.writes, b.writes) == (2, 2) and a.v_out[1] == 3.0
+
+def test_oversampled_writer_runs_at_its_rate():
+    module = SimulatedModule()
+    outputs = [AnalogOutput(module, i) for i in range(2)]
+    writer = OversampledWriter(lambda: outputs, rate=1000)
+    writer.start()
+    time.sleep(0.05)
+    assert writer.ticks == 0 # nothing pushed yet
+    t = time.perf_counter()
+    writer.push(t, np.array([0.0, 1.0]))
+    writer.push(t + 0.01, np.array([1.0, 2.0]))
+    time.sleep(0.2)
+    writer.stop()
+    writer.join()
+    assert 150 < writer.ticks <= 210
+    # one write_multiple per tick for both channels
+    assert module.writes == writer.ticks
+    assert list(module.v_out[:2]) == [1.0, 2.0]
+
+def test_precision_timer():
+    timer = PrecisionTimer(1000, spin=0.002)
+    assert timer.spin == 0.00025 # capped at a quarter period
+    with PrecisionTimer(500) as timer:
+        start = time.perf_counter()
+        ticks = [timer.wait() for _ in range(50)]
+        assert time.perf_counter() - start == pytest.approx(0.1, abs=0.02)
+        assert np.median(np.diff(ticks)) == pytest.approx(0.002)
+        late = timer.late_ticks
+        time.sleep(0.01)
+        timer.wait()
+        assert timer.late_ticks == late + 1